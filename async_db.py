@@ -0,0 +1,48 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBHandler:
+    """
+    نمای ناهمگام (async) برای DBHandler.
+
+    هر متد DBHandler به صورت یک coroutine در دسترس است که پرس‌وجو را روی یک
+    ThreadPoolExecutor محدود اجرا می‌کند، تا پرس‌وجوهای کند یا fsync حلقه رویداد
+    و ویرایش‌های جریانی سایر چت‌ها را متوقف نکنند.
+
+    مثال:
+        history = await async_db.get_dialog_history(user_id, dialog_number)
+    """
+
+    def __init__(self, db, max_workers=1):
+        """
+        Args:
+            db: نمونه DBHandler
+            max_workers: حداکثر تعداد جریان‌های اجرای پرس‌وجو
+        """
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-async")
+
+    def __getattr__(self, name):
+        """ساخت نسخه ناهمگام متد DBHandler با نام مشخص‌شده."""
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        # ذخیره برای جلوگیری از ساخت دوباره در فراخوانی‌های بعدی
+        setattr(self, name, method)
+        return method
+
+    def shutdown(self, wait=True):
+        """توقف جریان‌های اجرای پرس‌وجو."""
+        self._executor.shutdown(wait=wait)
@@ -6,12 +6,65 @@ OPENROUTER_API_KEY = "213"
 
 DB_PATH = r"data/openrouter_bot.db"
 
+# پروفایل ذخیره‌سازی SQLite: "durable"، "throughput" یا "memory-heavy"
+DB_STORAGE_PROFILE = "durable"
+
 # تنظیمات وب‌سایت برای اوپن‌روتر
 SITE_URL = "https://github.com/user-is-absinthe/openrouter-telegram-bot"
 SITE_NAME = "OpenRouter Telegram Bot"
 
+# تنظیمات کلاینت HTTP مشترک برای اوپن‌روتر
+HTTP_POOL_SIZE = 20  # حداکثر تعداد اتصال‌های هم‌زمان
+HTTP_KEEPALIVE_CONNECTIONS = 10  # حداکثر تعداد اتصال‌های بیکار نگه‌داشته‌شده
+HTTP_KEEPALIVE_EXPIRY = 60  # مدت نگه داشتن اتصال بیکار به ثانیه
+HTTP2_ENABLED = False  # استفاده از HTTP/2 (نیاز به نصب httpx[http2])
+HTTP_PREWARM_CONNECTIONS = 2  # تعداد اتصال‌هایی که هنگام راه‌اندازی باز می‌شوند
+
+# تنظیمات صف تولید پاسخ‌ها
+GENERATION_MAX_ACTIVE = 8  # حداکثر تعداد تولیدهای هم‌زمان برای کل ربات
+GENERATION_MAX_PER_USER = 1  # حداکثر تعداد تولیدهای هم‌زمان هر کاربر
+
+# حافظه پنهان پاسخ‌ها برای درخواست‌های یکسان (مدل و پیام‌های زمینه یکسان)
+RESPONSE_CACHE_ENABLED = False  # اگر True باشد، پاسخ‌های یکسان از حافظه ارسال و درخواست‌های هم‌زمان یکسان ادغام می‌شوند
+RESPONSE_CACHE_TTL = 3600  # مدت نگهداری هر پاسخ به ثانیه
+RESPONSE_CACHE_MAX_ENTRIES = 500  # حداکثر تعداد پاسخ‌های نگه‌داشته‌شده
+
+# تنظیمات ترجمه توضیحات مدل‌ها
+TRANSLATION_CONCURRENCY = 3  # حداکثر تعداد ترجمه‌های هم‌زمان
+TRANSLATION_MAX_RETRIES = 5  # حداکثر تلاش مجدد برای خطاهای 429 و 5xx با هر مدل
+TRANSLATION_BACKOFF_BASE = 2.0  # فاصله اولین تلاش مجدد به ثانیه (هر بار دو برابر می‌شود)
+TRANSLATION_BACKOFF_MAX = 60.0  # بیشترین فاصله تلاش مجدد به ثانیه
+TRANSLATION_BATCH_SIZE = 10  # حداکثر تعداد توضیحات در یک درخواست ترجمه (۱ = ترجمه جداگانه هر توضیح)
+
 # تنظیمات به‌روزرسانی پیام‌ها
 STREAM_UPDATE_INTERVAL = 1.5  # فاصله زمانی به‌روزرسانی پیام‌ها در ثانیه هنگام انتقال جریان
+STREAM_FIRST_UPDATE_INTERVAL = 0.3  # فاصله اولین به‌روزرسانی پس از رسیدن اولین بخش پاسخ
+STREAM_MAX_UPDATE_INTERVAL = 6.0  # بیشترین فاصله به‌روزرسانی هنگام بار زیاد یا پیام‌های طولانی
+TELEGRAM_MAX_EDIT_RATE = 20  # نرخ کل ویرایش پیام‌ها در ثانیه که ربات نباید از آن عبور کند
+STREAM_IDLE_TIMEOUT = 120  # توقف جریانی که این مدت (ثانیه) متن تازه‌ای نفرستاده است
+STREAM_MAX_DURATION = 300  # حداکثر مدت تولید یک پاسخ به ثانیه
+STREAM_REGISTRY_TTL = 900  # حذف جریان‌هایی که این مدت (ثانیه) فعالیتی نداشته‌اند از فهرست جریان‌ها
+STREAM_REGISTRY_MAX = 1000  # حداکثر تعداد جریان‌های ثبت‌شده به طور هم‌زمان
+
+# محدودیت‌های نرخ Bot API تلگرام
+TELEGRAM_GLOBAL_RATE = 30  # حداکثر فراخوانی در ثانیه برای کل ربات
+TELEGRAM_CHAT_RATE = 1  # حداکثر فراخوانی در ثانیه برای هر گفت‌وگو
+TELEGRAM_CHAT_BURST = 3  # تعداد فراخوانی پشت سر هم مجاز برای هر گفت‌وگو
+TELEGRAM_GROUP_PER_MINUTE = 20  # حداکثر فراخوانی در دقیقه برای هر گروه
+TELEGRAM_GROUP_BURST = 5  # تعداد فراخوانی پشت سر هم مجاز برای هر گروه
+UPDATE_WORKERS = 4  # تعداد کارگرهای هم‌زمان ارسال به‌روزرسانی پیام‌ها (هر گفت‌وگو همیشه با یک کارگر)
+
+# تنظیمات نوشتن دسته‌ای (write-behind) در پایگاه داده
+DB_WRITE_BEHIND = False  # اگر True باشد، نوشتن گفت‌وگوها در یک جریان جداگانه و به صورت دسته‌ای انجام می‌شود
+DB_WRITE_BATCH_INTERVAL_MS = 50  # حداکثر فاصله بین commitها به میلی‌ثانیه
+DB_WRITE_BATCH_MAX_OPS = 100  # حداکثر تعداد عملیات در هر commit
+
+# تعداد جریان‌های اجرای پرس‌وجو برای نمای ناهمگام پایگاه داده
+# (هر جریان اتصال فقط‌خواندنی خود را دارد و نوشتن‌ها از طریق یک اتصال یکتا سریال می‌شوند)
+DB_EXECUTOR_WORKERS = 4
+
+# حداکثر تعداد گفت‌وگوهایی که تاریخچه آن‌ها (همراه با تعداد توکن‌ها) در حافظه نگه داشته می‌شود
+HISTORY_CACHE_DIALOGS = 1000
 
 # افزودن فیلد برای شناسه‌های مدیران (لیست رشته‌ها)
 ADMIN_IDS = ["1", "2", "3"]
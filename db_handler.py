@@ -1,16 +1,127 @@
+import hashlib
 import os
 import sqlite3
 import logging
+import threading
 from datetime import datetime
+from urllib.request import pathname2url
+
+from db_writer import BatchWriter
+from migrations import apply_migrations
 
 # تنظیم لاگ‌گیری
 logger = logging.getLogger(__name__)
 
+# پروفایل‌های ذخیره‌سازی SQLite
+# همه پروفایل‌ها از WAL استفاده می‌کنند تا نویسنده و خوانندگان یکدیگر را مسدود نکنند
+STORAGE_PROFILES = {
+    # حداکثر دوام: هر commit تا دیسک همگام می‌شود
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,  # حدود 8 مگابایت
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    # توان عملیاتی بیشتر: در WAL با synchronous=NORMAL فقط در checkpoint همگام‌سازی می‌شود
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32000,  # حدود 32 مگابایت
+        "mmap_size": 134217728,  # 128 مگابایت
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # برای سرورهایی با حافظه زیاد و پایگاه داده بزرگ
+    "memory-heavy": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -262144,  # حدود 256 مگابایت
+        "mmap_size": 1073741824,  # 1 گیگابایت
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+
+DEFAULT_STORAGE_PROFILE = "durable"
+
+# ستون‌های جدول models که از API دریافت می‌شوند
+MODEL_COLUMNS = (
+    "id", "name", "created", "description", "context_length", "modality", "tokenizer",
+    "instruct_type", "prompt_price", "completion_price", "image_price",
+    "request_price", "provider_context_length", "is_moderated", "is_free"
+)
+
+# درج یا به‌روزرسانی مدل؛ rus_description و top_model در به‌روزرسانی دست‌نخورده می‌مانند
+# و آخرین پارامتر هش توضیحات (description_hash) است
+MODEL_UPSERT_QUERY = f"""
+INSERT INTO models ({', '.join(MODEL_COLUMNS)}, rus_description, top_model, description_hash)
+VALUES ({', '.join('?' for _ in MODEL_COLUMNS)}, NULL, 0, ?)
+ON CONFLICT(id) DO UPDATE SET
+    {', '.join(f'{column} = excluded.{column}' for column in MODEL_COLUMNS[1:])},
+    description_hash = excluded.description_hash,
+    updated_at = CURRENT_TIMESTAMP
+"""
+
+# پر کردن ترجمه‌های خالی یا کهنه از حافظه ترجمه برای توضیحاتی که قبلاً ترجمه شده‌اند
+APPLY_TRANSLATION_MEMORY_QUERY = """
+UPDATE models SET
+    rus_description = (SELECT translation FROM translation_memory WHERE source_hash = models.description_hash),
+    translation_hash = description_hash
+WHERE description_hash IS NOT NULL
+  AND translation_hash IS NOT description_hash
+  AND description_hash IN (SELECT source_hash FROM translation_memory)
+"""
+
+# توضیحات فارسی فقط اگر ترجمه توضیحات فعلی باشد؛ ترجمه کهنه تا ترجمه دوباره نمایش داده نمی‌شود
+# و به جای آن توضیحات اصلی نمایش داده می‌شود
+CURRENT_TRANSLATION = "CASE WHEN translation_hash IS description_hash THEN rus_description END"
+
+
+def description_hash(description):
+    """هش SHA-256 متن توضیحات مدل، یا None برای توضیحات خالی."""
+    if not description:
+        return None
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
 class DBHandler:
-    def __init__(self, db_path):
-        """آغاز اتصال به پایگاه داده."""
+    def __init__(self, db_path, storage_profile=DEFAULT_STORAGE_PROFILE,
+                 write_behind=False, batch_interval_ms=50, batch_max_ops=100, history_cache=None):
+        """
+        آغاز اتصال به پایگاه داده.
+
+        Args:
+            db_path: مسیر فایل پایگاه داده
+            storage_profile: نام پروفایل ذخیره‌سازی از STORAGE_PROFILES
+            write_behind: اگر True باشد، نوشتن گفت‌وگوها به صورت دسته‌ای در یک جریان جداگانه انجام می‌شود
+            batch_interval_ms: حداکثر فاصله زمانی بین commitها در حالت write-behind
+            batch_max_ops: حداکثر تعداد عملیات در هر commit در حالت write-behind
+            history_cache: کش تاریخچه گفت‌وگوها (DialogHistoryCache) یا None
+        """
         self.db_path = db_path
         self.conn = None
+        self.writer = None
+
+        # اتصال نوشتن یکتا فقط با نگه داشتن این قفل استفاده می‌شود
+        self._write_lock = threading.RLock()
+
+        # اتصال‌های فقط‌خواندنی، یکی برای هر جریان: {شناسه جریان: (جریان، اتصال)}
+        self._local = threading.local()
+        self._readers = {}
+        self._readers_lock = threading.Lock()
+
+        # توابعی که پس از هر تغییر در جدول models فراخوانی می‌شوند (مثلاً ModelCatalog.reload)
+        self.models_listeners = []
+
+        # کش تاریخچه گفت‌وگوها که همراه با نوشتن‌ها به‌روزرسانی می‌شود
+        self.history_cache = history_cache
+
+        if storage_profile not in STORAGE_PROFILES:
+            logger.warning(f"پروفایل ذخیره‌سازی '{storage_profile}' ناشناخته است، از '{DEFAULT_STORAGE_PROFILE}' استفاده می‌شود")
+            storage_profile = DEFAULT_STORAGE_PROFILE
+        self.storage_profile = storage_profile
 
         # ایجاد پوشه برای پایگاه داده اگر وجود نداشته باشد
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
@@ -18,157 +129,142 @@ class DBHandler:
         # اتصال به پایگاه داده
         self.connect()
 
-        # ایجاد جدول‌های مورد نیاز اگر وجود نداشته باشند
-        self.create_tables()
+        # اعمال مهاجرت‌های معلق طرح پایگاه داده
+        try:
+            apply_migrations(self.conn)
+        except Exception as e:
+            logger.error(f"خطا در به‌روزرسانی طرح پایگاه داده: {e}")
+            raise
 
-        # به‌روزرسانی طرح پایگاه داده در صورت نیاز
-        self.update_schema()
+        # راه‌اندازی نویسنده دسته‌ای در صورت فعال بودن
+        if write_behind:
+            self.writer = BatchWriter(self._open_writer_connection, batch_interval_ms, batch_max_ops)
 
     def connect(self):
-        """اتصال به پایگاه داده SQLite."""
+        """اتصال به پایگاه داده SQLite (اتصال نوشتن)."""
         try:
             self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
             self.conn.execute("PRAGMA foreign_keys = ON")
+            self._apply_storage_profile(self.conn)
         except Exception as e:
             logger.error(f"خطا در اتصال به پایگاه داده: {e}")
 
-    def create_tables(self):
-        """ایجاد جدول‌های مورد نیاز."""
-        try:
-            cursor = self.conn.cursor()
-
-            # ایجاد جدول کاربران
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                id_chat INTEGER NOT NULL,
-                id_user INTEGER NOT NULL,
-                first_name TEXT,
-                last_name TEXT,
-                username TEXT,
-                register_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_premium INTEGER DEFAULT 0,
-                UNIQUE(id_chat, id_user)
-            )
-            ''')
-
-            # ایجاد جدول گفت‌وگوها با ستون displayed
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS dialogs (
-                id INTEGER PRIMARY KEY,
-                id_chat INTEGER NOT NULL,
-                id_user INTEGER NOT NULL,
-                number_dialog INTEGER NOT NULL,
-                model TEXT,
-                model_id TEXT,
-                user_ask TEXT,
-                model_answer TEXT,
-                ask_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                displayed INTEGER DEFAULT 1,
-                FOREIGN KEY (id_chat, id_user) REFERENCES users (id_chat, id_user)
-            )
-            ''')
-
-            # ایجاد جدول مدل‌ها
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS models (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                created INTEGER,
-                description TEXT,
-                rus_description TEXT,
-                context_length INTEGER,
-                modality TEXT,
-                tokenizer TEXT,
-                instruct_type TEXT,
-                prompt_price TEXT,
-                completion_price TEXT,
-                image_price TEXT,
-                request_price TEXT,
-                provider_context_length INTEGER,
-                is_moderated INTEGER,
-                is_free INTEGER,
-                top_model INTEGER DEFAULT 0,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
-
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"خطا در ایجاد جدول‌ها: {e}")
-
-    def update_schema(self):
-        """به‌روزرسانی طرح پایگاه داده در صورت نیاز."""
-        try:
-            cursor = self.conn.cursor()
+    def _apply_storage_profile(self, conn, read_only=False):
+        """اعمال تنظیمات PRAGMA پروفایل ذخیره‌سازی روی یک اتصال."""
+        profile = STORAGE_PROFILES[self.storage_profile]
+        for pragma, value in profile.items():
+            # حالت ژورنال در فایل پایگاه داده ذخیره می‌شود و فقط اتصال نوشتن آن را تنظیم می‌کند
+            if read_only and pragma == "journal_mode":
+                continue
+            conn.execute(f"PRAGMA {pragma} = {value}")
 
-            # بررسی وجود ستون 'displayed' در جدول 'dialogs'
-            cursor.execute("PRAGMA table_info(dialogs)")
-            columns = [column[1] for column in cursor.fetchall()]
+    def get_read_connection(self):
+        """
+        دریافت اتصال فقط‌خواندنی مخصوص جریان فعلی.
 
-            if 'displayed' not in columns:
-                logger.info("افزودن ستون 'displayed' به جدول 'dialogs'")
-                cursor.execute("ALTER TABLE dialogs ADD COLUMN displayed INTEGER DEFAULT 1")
-                self.conn.commit()
+        در حالت WAL خوانندگان و نویسنده یکدیگر را مسدود نمی‌کنند، بنابراین خواندن
+        تاریخچه برای کاربران مختلف در جریان‌های جداگانه به صورت موازی انجام می‌شود
+        و هیچ cursorی بین جریان‌ها به اشتراک گذاشته نمی‌شود.
 
-                # تنظیم مقدار پیش‌فرض برای رکوردهای موجود
-                cursor.execute("UPDATE dialogs SET displayed = 1 WHERE displayed IS NULL")
-                self.conn.commit()
+        Returns:
+            sqlite3.Connection: اتصال فقط‌خواندنی جریان فعلی
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._apply_storage_profile(conn, read_only=True)
+        conn.execute("PRAGMA query_only = ON")
+        self._local.conn = conn
+
+        with self._readers_lock:
+            # بستن اتصال‌های جریان‌هایی که دیگر فعال نیستند
+            for ident, (thread, reader) in list(self._readers.items()):
+                if not thread.is_alive():
+                    reader.close()
+                    del self._readers[ident]
+            self._readers[threading.get_ident()] = (threading.current_thread(), conn)
+
+        return conn
+
+    def _open_writer_connection(self):
+        """ایجاد اتصال اختصاصی برای نویسنده دسته‌ای (با مدیریت دستی تراکنش‌ها)."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA foreign_keys = ON")
+        self._apply_storage_profile(conn)
+        return conn
+
+    def _write(self, operation, wait=False, on_error=None):
+        """
+        اجرای یک عملیات نوشتن.
 
-            # بررسی وجود جدول 'models'
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='models'")
-            if not cursor.fetchone():
-                logger.info("ایجاد جدول 'models'")
-                cursor.execute('''
-                CREATE TABLE models (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    created INTEGER,
-                    description TEXT,
-                    rus_description TEXT,
-                    context_length INTEGER,
-                    modality TEXT,
-                    tokenizer TEXT,
-                    instruct_type TEXT,
-                    prompt_price TEXT,
-                    completion_price TEXT,
-                    image_price TEXT,
-                    request_price TEXT,
-                    provider_context_length INTEGER,
-                    is_moderated INTEGER,
-                    is_free INTEGER,
-                    top_model INTEGER DEFAULT 0,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-                ''')
-                self.conn.commit()
+        در حالت write-behind عملیات به نویسنده دسته‌ای سپرده می‌شود؛ در غیر این صورت
+        بلافاصله روی اتصال اصلی اجرا و commit می‌شود. فقط نوشتن‌هایی که فراخواننده
+        نتیجه آن‌ها را نادیده می‌گیرد باید بدون انتظار (wait=False) انجام شوند. نوشتن با
+        انتظار هم commit فوری نمی‌خواهد و تا ثبت دسته بعدی (حداکثر batch_interval_ms) منتظر
+        می‌ماند، تا نوشتن‌های هم‌زمان در یک commit ثبت شوند.
 
-            # بررسی وجود ستون 'is_premium' در جدول 'users'
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cursor.fetchall()]
+        Args:
+            operation: تابعی که یک cursor دریافت کرده و نتیجه عملیات را برمی‌گرداند
+            wait: آیا تا ثبت عملیات منتظر بمانیم و نتیجه آن را برگردانیم
+            on_error: تابعی که در صورت شکست نوشتن بدون انتظار با خطا فراخوانی می‌شود
 
-            if 'is_premium' not in columns:
-                logger.info("افزودن ستون 'is_premium' به جدول 'users'")
-                cursor.execute("ALTER TABLE users ADD COLUMN is_premium INTEGER DEFAULT 0")
-                self.conn.commit()
+        Returns:
+            نتیجه عملیات، یا None اگر wait=False و حالت write-behind فعال باشد
+        """
+        if self.writer:
+            future = self.writer.submit(operation)
+            if wait:
+                return future.result()
+            if on_error is not None:
+                future.add_done_callback(lambda done: done.exception() and on_error(done.exception()))
+            return None
 
-                # تنظیم مقدار پیش‌فرض برای رکوردهای موجود
-                cursor.execute("UPDATE users SET is_premium = 0 WHERE is_premium IS NULL")
+        with self._write_lock:
+            try:
+                cursor = self.conn.cursor()
+                result = operation(cursor)
                 self.conn.commit()
-
-        except Exception as e:
-            logger.error(f"خطا در به‌روزرسانی طرح پایگاه داده: {e}")
+                return result
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def flush(self, timeout=None):
+        """انتظار برای ثبت همه نوشته‌های در صف (برای خواندن نوشته‌های خود)."""
+        if self.writer:
+            self.writer.flush(timeout)
+
+    def _notify_models_changed(self):
+        """اطلاع‌رسانی تغییر جدول models به شنوندگان."""
+        for listener in self.models_listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"خطا در اطلاع‌رسانی تغییر مدل‌ها: {e}")
 
     def close(self):
         """بستن اتصال به پایگاه داده."""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        with self._readers_lock:
+            for _, reader in self._readers.values():
+                reader.close()
+            self._readers.clear()
         if self.conn:
             self.conn.close()
 
     def register_user(self, id_chat, id_user, first_name, last_name, username, is_premium=None):
-        """ثبت کاربر یا به‌روزرسانی اطلاعات او."""
-        try:
-            cursor = self.conn.cursor()
+        """
+        ثبت کاربر یا به‌روزرسانی اطلاعات او.
 
+        فراخواننده منتظر ثبت نمی‌ماند؛ در حالت write-behind مقدار True یعنی نوشتن در صف قرار
+        گرفته است و خطای ثبت فقط در لاگ گزارش می‌شود.
+        """
+        def operation(cursor):
             # بررسی وجود کاربر
             cursor.execute("SELECT id, is_premium FROM users WHERE id_chat = ? AND id_user = ?", (id_chat, id_user))
             result = cursor.fetchone()
@@ -192,54 +288,92 @@ class DBHandler:
                     (id_chat, id_user, first_name, last_name, username, premium_status)
                 )
 
-            self.conn.commit()
+        def on_error(e):
+            logger.error(f"خطا در ثبت کاربر: {e}")
+
+        try:
+            self._write(operation, on_error=on_error)
             return True
         except Exception as e:
-            logger.error(f"خطا در ثبت کاربر: {e}")
+            on_error(e)
             return False
 
     def log_dialog(self, id_chat, id_user, number_dialog, model, model_id, user_ask, model_answer=None, displayed=1):
         """ثبت گفت‌وگو."""
-        try:
-            cursor = self.conn.cursor()
+        def operation(cursor):
             cursor.execute(
                 "INSERT INTO dialogs (id_chat, id_user, number_dialog, model, model_id, user_ask, model_answer, displayed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (id_chat, id_user, number_dialog, model, model_id, user_ask, model_answer, displayed)
             )
-            self.conn.commit()
-            return cursor.lastrowid  # بازگشت شناسه رکورد درج‌شده
+            dialog_id = cursor.lastrowid  # شناسه رکورد درج‌شده
+
+            # اطمینان از اینکه شمارنده هرگز شماره گفت‌وگوی استفاده‌شده را دوباره تخصیص نمی‌دهد
+            cursor.execute(
+                """
+                INSERT INTO dialog_sequences (id_user, last_number) VALUES (?, ?)
+                ON CONFLICT(id_user) DO UPDATE SET last_number = excluded.last_number
+                WHERE excluded.last_number > last_number
+                """,
+                (id_user, number_dialog)
+            )
+            return dialog_id
+
+        try:
+            # برای دریافت lastrowid تا ثبت رکورد منتظر می‌مانیم
+            dialog_id = self._write(operation, wait=True)
+            if self.history_cache:
+                self.history_cache.append(id_user, number_dialog, dialog_id, user_ask, model_answer, displayed)
+            return dialog_id
         except Exception as e:
             logger.error(f"خطا در ثبت گفت‌وگو: {e}")
+            if self.history_cache:
+                self.history_cache.invalidate(id_user, number_dialog)
             return None
 
     def update_model_answer(self, dialog_id, model_answer, displayed=1):
         """به‌روزرسانی پاسخ مدل در رکورد گفت‌وگوی موجود."""
-        try:
-            cursor = self.conn.cursor()
+        def operation(cursor):
             cursor.execute(
                 "UPDATE dialogs SET model_answer = ?, displayed = ? WHERE id = ?",
                 (model_answer, displayed, dialog_id)
             )
-            self.conn.commit()
-        except Exception as e:
+
+        def on_error(e):
+            # حافظه پنهان پیش از نوشتن به‌روز شده است؛ در صورت شکست نوشتن، رکورد از آن حذف می‌شود
             logger.error(f"خطا در به‌روزرسانی پاسخ مدل: {e}")
+            if self.history_cache:
+                self.history_cache.invalidate_record(dialog_id)
 
-    def get_next_dialog_number(self, id_user):
-        """دریافت شماره گفت‌وگوی بعدی برای کاربر."""
+        # به‌روزرسانی حافظه پنهان پیش از سپردن نوشتن، تا on_error همیشه پس از آن اجرا شود
+        if self.history_cache:
+            self.history_cache.update_answer(dialog_id, model_answer, displayed)
         try:
-            cursor = self.conn.cursor()
+            # فراخواننده منتظر نتیجه نیست؛ در حالت write-behind نوشتن بدون انتظار انجام می‌شود
+            self._write(operation, on_error=on_error)
+        except Exception as e:
+            on_error(e)
+
+    def get_next_dialog_number(self, id_user):
+        """
+        تخصیص شماره گفت‌وگوی بعدی برای کاربر.
+
+        شمارنده در یک دستور افزایش یافته و مقدار جدید بازگردانده می‌شود، بنابراین
+        فراخوانی‌های هم‌زمان هرگز شماره یکسان دریافت نمی‌کنند.
+        """
+        def operation(cursor):
+            # اگر این اولین گفت‌وگوی کاربر باشد، شمارنده با 1 ایجاد می‌شود
             cursor.execute(
-                "SELECT MAX(number_dialog) FROM dialogs WHERE id_user = ?",
+                """
+                INSERT INTO dialog_sequences (id_user, last_number) VALUES (?, 1)
+                ON CONFLICT(id_user) DO UPDATE SET last_number = last_number + 1
+                RETURNING last_number
+                """,
                 (id_user,)
             )
-            result = cursor.fetchone()[0]
-
-            # اگر این اولین گفت‌وگوی کاربر باشد
-            if result is None:
-                return 1
+            return cursor.fetchone()[0]
 
-            # در غیر این صورت شماره گفت‌وگو را یک واحد افزایش می‌دهیم
-            return result + 1
+        try:
+            return self._write(operation, wait=True)
         except Exception as e:
             logger.error(f"خطا در دریافت شماره گفت‌وگو: {e}")
             return 1  # در صورت خطا، 1 را برمی‌گردانیم
@@ -247,127 +381,169 @@ class DBHandler:
     def mark_last_message(self, id_user, number_dialog):
         """علامت‌گذاری تکمیل شدن گفت‌وگوی فعلی."""
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             # عملیات صوری برای علامت‌گذاری تکمیل گفت‌وگو
             # در آینده می‌توان ستون خاصی به جدول اضافه کرد
             cursor.execute(
                 "SELECT MAX(id) FROM dialogs WHERE id_user = ? AND number_dialog = ?",
                 (id_user, number_dialog)
             )
-            self.conn.commit()
         except Exception as e:
             logger.error(f"خطا در علامت‌گذاری تکمیل گفت‌وگو: {e}")
 
     def mark_previous_answers_as_inactive(self, dialog_id):
-        """علامت‌گذاری پاسخ قبلی مدل به عنوان غیرقابل نمایش."""
-        try:
-            cursor = self.conn.cursor()
+        """
+        علامت‌گذاری پاسخ قبلی مدل به عنوان غیرقابل نمایش.
+
+        فراخواننده منتظر ثبت نمی‌ماند؛ در صورت شکست نوشتن، رکورد از حافظه پنهان تاریخچه حذف
+        و خطا در لاگ گزارش می‌شود.
+        """
+        def operation(cursor):
             # فقط پاسخ فعلی را به عنوان غیرقابل نمایش به‌روزرسانی می‌کنیم
             cursor.execute(
                 "UPDATE dialogs SET displayed = 0 WHERE id = ?",
                 (dialog_id,)
             )
-            self.conn.commit()
+
+        def on_error(e):
+            logger.error(f"خطا در به‌روزرسانی وضعیت پاسخ: {e}")
+            if self.history_cache:
+                self.history_cache.invalidate_record(dialog_id)
+
+        # به‌روزرسانی حافظه پنهان پیش از سپردن نوشتن، تا on_error همیشه پس از آن اجرا شود
+        if self.history_cache:
+            self.history_cache.deactivate(dialog_id)
+        try:
+            self._write(operation, on_error=on_error)
             logger.info(f"پاسخ {dialog_id} به عنوان غیرفعال علامت‌گذاری شد")
             return True
         except Exception as e:
-            logger.error(f"خطا در به‌روزرسانی وضعیت پاسخ: {e}")
+            on_error(e)
             return False
 
     # متدهای مربوط به کار با مدل‌ها
+    @staticmethod
+    def _model_row(model_data):
+        """
+        تبدیل داده JSON یک مدل به ردیف ستون‌های جدول models.
+
+        Returns:
+            tuple: مقادیر به ترتیب MODEL_COLUMNS
+        """
+        # استخراج داده‌ها از JSON
+        model_id = model_data.get("id")
+        name = model_data.get("name")
+        created = model_data.get("created")
+        description = model_data.get("description")
+        context_length = model_data.get("context_length")
+
+        # استخراج داده‌ها از ساختارهای تودرتو
+        architecture = model_data.get("architecture", {})
+        modality = architecture.get("modality")
+        tokenizer = architecture.get("tokenizer")
+        instruct_type = architecture.get("instruct_type")
+
+        pricing = model_data.get("pricing", {})
+        prompt_price = pricing.get("prompt")
+        completion_price = pricing.get("completion")
+        image_price = pricing.get("image")
+        request_price = pricing.get("request")
+
+        top_provider = model_data.get("top_provider", {})
+        provider_context_length = top_provider.get("context_length")
+        is_moderated = 1 if top_provider.get("is_moderated") else 0
+
+        # بررسی اینکه آیا مدل رایگان است
+        is_free = 1 if model_id.endswith(":free") or (prompt_price == "0" and completion_price == "0") else 0
+
+        return (
+            model_id, name, created, description, context_length, modality, tokenizer,
+            instruct_type, prompt_price, completion_price, image_price,
+            request_price, provider_context_length, is_moderated, is_free
+        )
+
     def save_model(self, model_data):
         """ذخیره یا به‌روزرسانی اطلاعات مدل در پایگاه داده."""
         try:
-            # استخراج داده‌ها از JSON
-            model_id = model_data.get("id")
-            name = model_data.get("name")
-            created = model_data.get("created")
-            description = model_data.get("description")
-            context_length = model_data.get("context_length")
-
-            # استخراج داده‌ها از ساختارهای تودرتو
-            architecture = model_data.get("architecture", {})
-            modality = architecture.get("modality")
-            tokenizer = architecture.get("tokenizer")
-            instruct_type = architecture.get("instruct_type")
-
-            pricing = model_data.get("pricing", {})
-            prompt_price = pricing.get("prompt")
-            completion_price = pricing.get("completion")
-            image_price = pricing.get("image")
-            request_price = pricing.get("request")
-
-            top_provider = model_data.get("top_provider", {})
-            provider_context_length = top_provider.get("context_length")
-            is_moderated = 1 if top_provider.get("is_moderated") else 0
-
-            # بررسی اینکه آیا مدل رایگان است
-            is_free = 1 if model_id.endswith(":free") or (prompt_price == "0" and completion_price == "0") else 0
-
-            cursor = self.conn.cursor()
-
-            # بررسی وجود مدل در پایگاه داده
-            cursor.execute("SELECT id, rus_description, top_model FROM models WHERE id = ?", (model_id,))
-            existing = cursor.fetchone()
-
-            if existing:
-                # حفظ مقادیر فعلی rus_description و top_model
-                rus_description = existing[1]
-                top_model = existing[2]
-
-                # به‌روزرسانی رکورد موجود، با حفظ rus_description و top_model
-                cursor.execute("""
-                UPDATE models SET 
-                    name = ?, 
-                    created = ?, 
-                    description = ?,
-                    context_length = ?,
-                    modality = ?,
-                    tokenizer = ?,
-                    instruct_type = ?,
-                    prompt_price = ?,
-                    completion_price = ?,
-                    image_price = ?,
-                    request_price = ?,
-                    provider_context_length = ?,
-                    is_moderated = ?,
-                    is_free = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-                """, (
-                    name, created, description, context_length, modality, tokenizer,
-                    instruct_type, prompt_price, completion_price, image_price,
-                    request_price, provider_context_length, is_moderated, is_free,
-                    model_id
-                ))
-            else:
-                # افزودن رکورد جدید
-                cursor.execute("""
-                INSERT INTO models (
-                    id, name, created, description, rus_description,
-                    context_length, modality, tokenizer, instruct_type,
-                    prompt_price, completion_price, image_price, request_price,
-                    provider_context_length, is_moderated, is_free, top_model
-                ) VALUES (?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
-                """, (
-                    model_id, name, created, description, context_length, modality, tokenizer,
-                    instruct_type, prompt_price, completion_price, image_price,
-                    request_price, provider_context_length, is_moderated, is_free
-                ))
-
-            self.conn.commit()
+            row = self._model_row(model_data)
+
+            def operation(cursor):
+                # درج یا به‌روزرسانی، با حفظ rus_description و top_model
+                cursor.execute(MODEL_UPSERT_QUERY, row + (description_hash(row[3]),))
+                cursor.execute(APPLY_TRANSLATION_MEMORY_QUERY)
+
+            self._write(operation, wait=True)
+            self._notify_models_changed()
             return True
 
         except Exception as e:
             logger.error(f"خطا در ذخیره مدل {model_data.get('id')}: {e}")
             return False
 
+    def save_models(self, models_data):
+        """
+        ذخیره دسته‌ای مدل‌ها با یک executemany در یک تراکنش.
+
+        مقادیر rus_description و top_model مدل‌های موجود حفظ می‌شوند.
+        مدل‌هایی که دیگر در فهرست API نیستند حذف نمی‌شوند و فقط در خلاصه گزارش می‌شوند.
+        ترجمه مدل‌هایی که توضیحات آن‌ها تغییر کرده کهنه علامت‌گذاری می‌شود و اگر متن جدید
+        قبلاً (برای همین یا مدل دیگری) ترجمه شده باشد، ترجمه از حافظه ترجمه برداشته می‌شود.
+
+        Args:
+            models_data: مجموعه‌ای از دیکشنری‌های JSON مدل‌ها
+
+        Returns:
+            dict: خلاصه تغییرات {"added": [...], "changed": [...], "removed": [...],
+                  "stale": [...], "reused": تعداد} یا None در صورت خطا؛ تا ترجمه دوباره مدل‌های
+                  stale، توضیحات اصلی آن‌ها نمایش داده می‌شود
+        """
+        try:
+            rows = []
+            for model_data in models_data:
+                if not model_data.get("id"):
+                    logger.warning("مدل بدون شناسه نادیده گرفته شد")
+                    continue
+                rows.append(self._model_row(model_data))
+
+            def operation(cursor):
+                # دریافت وضعیت فعلی برای محاسبه تفاوت‌ها
+                cursor.execute(f"SELECT {', '.join(MODEL_COLUMNS)} FROM models")
+                existing = {row[0]: row for row in cursor.fetchall()}
+
+                incoming = {row[0] for row in rows}
+                diff = {
+                    "added": [row[0] for row in rows if row[0] not in existing],
+                    "changed": [row[0] for row in rows if row[0] in existing and existing[row[0]] != row],
+                    "removed": sorted(model_id for model_id in existing if model_id not in incoming),
+                }
+
+                cursor.executemany(MODEL_UPSERT_QUERY, [row + (description_hash(row[3]),) for row in rows])
+                diff["reused"] = cursor.execute(APPLY_TRANSLATION_MEMORY_QUERY).rowcount
+
+                # مدل‌هایی که ترجمه آن‌ها با توضیحات فعلی مطابقت ندارد
+                cursor.execute(
+                    "SELECT id FROM models WHERE rus_description IS NOT NULL AND rus_description != '' "
+                    "AND translation_hash IS NOT description_hash"
+                )
+                diff["stale"] = [row[0] for row in cursor.fetchall()]
+                return diff
+
+            diff = self._write(operation, wait=True)
+            self._notify_models_changed()
+            return diff
+
+        except Exception as e:
+            logger.error(f"خطا در ذخیره دسته‌ای مدل‌ها: {e}")
+            return None
+
     def get_models(self, only_free=False, only_top=False):
         """دریافت لیست مدل‌ها از پایگاه داده با امکان فیلتر کردن."""
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
 
-            query = "SELECT id, name, description, rus_description, context_length, is_free, top_model FROM models"
+            query = (
+                f"SELECT id, name, description, {CURRENT_TRANSLATION}, context_length, is_free, top_model FROM models"
+            )
             conditions = []
             params = []
 
@@ -403,15 +579,90 @@ class DBHandler:
             logger.error(f"خطا در دریافت لیست مدل‌ها: {e}")
             return []
 
-    def set_model_description_ru(self, model_id, rus_description):
-        """به‌روزرسانی توضیحات فارسی مدل."""
+    def get_model_info(self, model_id):
+        """
+        دریافت اطلاعات یک مدل بر اساس شناسه آن.
+
+        Args:
+            model_id: شناسه مدل
+
+        Returns:
+            dict: اطلاعات مدل یا None اگر مدل یافت نشود
+        """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             cursor.execute(
-                "UPDATE models SET rus_description = ? WHERE id = ?",
-                (rus_description, model_id)
+                f"SELECT id, name, description, {CURRENT_TRANSLATION}, context_length, prompt_price, "
+                "completion_price, is_free, top_model FROM models WHERE id = ?",
+                (model_id,)
+            )
+            row = cursor.fetchone()
+
+            if row:
+                return {
+                    "id": row[0],
+                    "name": row[1],
+                    "description": row[3] if row[3] else row[2],  # استفاده از rus_description در صورت وجود
+                    "context_length": row[4],
+                    "prompt_price": row[5],
+                    "completion_price": row[6],
+                    "is_free": bool(row[7]),
+                    "top_model": bool(row[8])
+                }
+            return None
+
+        except Exception as e:
+            logger.error(f"خطا در دریافت اطلاعات مدل {model_id}: {e}")
+            return None
+
+    def get_catalog_rows(self):
+        """
+        دریافت همه ردیف‌های مورد نیاز کاتالوگ مدل‌ها در حافظه.
+
+        Returns:
+            لیست تاپل‌های (id, name, description, rus_description, context_length,
+            prompt_price, completion_price, is_free, top_model) یا None در صورت خطا
+        """
+        try:
+            cursor = self.get_read_connection().cursor()
+            cursor.execute(
+                f"SELECT id, name, description, {CURRENT_TRANSLATION}, context_length, prompt_price, "
+                "completion_price, is_free, top_model FROM models"
             )
-            self.conn.commit()
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"خطا در دریافت ردیف‌های کاتالوگ مدل‌ها: {e}")
+            return None
+
+    def get_free_model_ids(self):
+        """
+        دریافت شناسه‌های همه مدل‌های رایگان به ترتیب شناسه.
+
+        Returns:
+            لیست شناسه‌های مدل‌های رایگان
+        """
+        try:
+            cursor = self.get_read_connection().cursor()
+            cursor.execute("""
+            SELECT id FROM models 
+            WHERE (prompt_price = '0' AND completion_price = '0') 
+               OR id LIKE '%:free' 
+            ORDER BY id
+            """)
+            return [row[0] for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error(f"خطا در دریافت مدل‌های رایگان: {e}")
+            return []
+
+    def set_model_description_ru(self, model_id, rus_description):
+        """به‌روزرسانی توضیحات فارسی مدل و افزودن آن به حافظه ترجمه."""
+        def operation(cursor):
+            self._store_translation(cursor, model_id, rus_description)
+
+        try:
+            self._write(operation, wait=True)
+            self._notify_models_changed()
             return True
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی توضیحات فارسی مدل {model_id}: {e}")
@@ -419,34 +670,55 @@ class DBHandler:
 
     def update_model_description(self, model_id, rus_description, top_model=None):
         """به‌روزرسانی توضیحات فارسی و/یا وضعیت مدل برتر."""
-        try:
-            cursor = self.conn.cursor()
+        # توضیحات واردشده مربوط به توضیحات فعلی مدل است؛ بدون توضیحات، ترجمه‌ای ثبت نمی‌شود
+        translation_hash = "description_hash" if rus_description else "NULL"
 
+        def operation(cursor):
             # تشکیل درخواست بسته به آنچه به‌روزرسانی می‌شود
             if top_model is not None:
                 cursor.execute(
-                    "UPDATE models SET rus_description = ?, top_model = ? WHERE id = ?",
+                    f"UPDATE models SET rus_description = ?, translation_hash = {translation_hash}, top_model = ? "
+                    "WHERE id = ?",
                     (rus_description, 1 if top_model else 0, model_id)
                 )
             else:
                 cursor.execute(
-                    "UPDATE models SET rus_description = ? WHERE id = ?",
+                    f"UPDATE models SET rus_description = ?, translation_hash = {translation_hash} WHERE id = ?",
                     (rus_description, model_id)
                 )
+            if not rus_description:
+                # بازگرداندن ترجمه موجود در حافظه ترجمه
+                cursor.execute(APPLY_TRANSLATION_MEMORY_QUERY)
 
-            self.conn.commit()
+        try:
+            self._write(operation, wait=True)
+            self._notify_models_changed()
             return True
 
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی توضیحات مدل {model_id}: {e}")
             return False
 
+    def set_model_top_status(self, model_id, top_model):
+        """تنظیم وضعیت مدل برتر بدون تغییر توضیحات مدل."""
+        try:
+            self._write(
+                lambda cursor: cursor.execute(
+                    "UPDATE models SET top_model = ? WHERE id = ?", (1 if top_model else 0, model_id)
+                ),
+                wait=True
+            )
+            self._notify_models_changed()
+            return True
+        except Exception as e:
+            logger.error(f"خطا در به‌روزرسانی وضعیت مدل برتر {model_id}: {e}")
+            return False
+
     def clear_top_models(self):
         """بازنشانی وضعیت مدل برتر برای همه مدل‌ها."""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("UPDATE models SET top_model = 0")
-            self.conn.commit()
+            self._write(lambda cursor: cursor.execute("UPDATE models SET top_model = 0"), wait=True)
+            self._notify_models_changed()
             return True
         except Exception as e:
             logger.error(f"خطا در بازنشانی وضعیت مدل‌های برتر: {e}")
@@ -458,12 +730,13 @@ class DBHandler:
 
         Args:
             model_id: شناسه مدل خاص یا None برای همه مدل‌های بدون توضیحات فارسی
+                یا با ترجمه کهنه (توضیحات پس از ترجمه تغییر کرده است)
 
         Returns:
             لیست تاپل‌های (id, description) مدل‌ها برای ترجمه
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
 
             if model_id:
                 # دریافت مدل خاص
@@ -472,9 +745,10 @@ class DBHandler:
                     (model_id,)
                 )
             else:
-                # دریافت همه مدل‌ها با توضیحات فارسی خالی
+                # دریافت همه مدل‌ها با توضیحات فارسی خالی یا کهنه
                 cursor.execute(
-                    "SELECT id, description FROM models WHERE rus_description IS NULL OR rus_description = ''"
+                    "SELECT id, description FROM models WHERE rus_description IS NULL OR rus_description = '' "
+                    "OR translation_hash IS NOT description_hash"
                 )
 
             return cursor.fetchall()
@@ -483,6 +757,198 @@ class DBHandler:
             logger.error(f"خطا در دریافت مدل‌ها برای ترجمه: {e}")
             return []
 
+    def create_translation_job(self, model_ids, id_chat=None):
+        """
+        ثبت کار ترجمه جدید برای لیست مدل‌ها.
+
+        Args:
+            model_ids: شناسه مدل‌هایی که باید ترجمه شوند
+            id_chat: چتی که پیشرفت کار در آن گزارش می‌شود
+
+        Returns:
+            شناسه کار یا None در صورت خطا
+        """
+        def operation(cursor):
+            cursor.execute(
+                "INSERT INTO translation_jobs (id_chat, total) VALUES (?, ?)",
+                (id_chat, len(model_ids))
+            )
+            job_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT OR IGNORE INTO translation_items (job_id, model_id) VALUES (?, ?)",
+                [(job_id, model_id) for model_id in model_ids]
+            )
+            return job_id
+
+        try:
+            return self._write(operation, wait=True)
+        except Exception as e:
+            logger.error(f"خطا در ثبت کار ترجمه: {e}")
+            return None
+
+    def get_active_translation_job(self):
+        """
+        دریافت آخرین کار ترجمه ناتمام (برای ادامه پس از راه‌اندازی مجدد).
+
+        Returns:
+            تاپل (id, id_chat, total) یا None
+        """
+        try:
+            cursor = self.get_read_connection().cursor()
+            cursor.execute(
+                "SELECT id, id_chat, total FROM translation_jobs WHERE status = 'running' ORDER BY id DESC LIMIT 1"
+            )
+            return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"خطا در دریافت کار ترجمه ناتمام: {e}")
+            return None
+
+    def get_pending_translation_items(self, job_id):
+        """
+        دریافت مدل‌های ترجمه‌نشده یک کار.
+
+        Returns:
+            لیست تاپل‌های (model_id, description)
+        """
+        try:
+            cursor = self.get_read_connection().cursor()
+            cursor.execute(
+                "SELECT i.model_id, m.description FROM translation_items i "
+                "LEFT JOIN models m ON m.id = i.model_id "
+                "WHERE i.job_id = ? AND i.status = 'pending' ORDER BY i.model_id",
+                (job_id,)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"خطا در دریافت مدل‌های در انتظار ترجمه: {e}")
+            return []
+
+    def get_translation_job_counts(self, job_id):
+        """
+        دریافت تعداد مدل‌های هر وضعیت در یک کار ترجمه.
+
+        Returns:
+            دیکشنری {وضعیت: تعداد}
+        """
+        try:
+            cursor = self.get_read_connection().cursor()
+            cursor.execute(
+                "SELECT status, COUNT(*) FROM translation_items WHERE job_id = ? GROUP BY status",
+                (job_id,)
+            )
+            return dict(cursor.fetchall())
+        except Exception as e:
+            logger.error(f"خطا در دریافت وضعیت کار ترجمه {job_id}: {e}")
+            return {}
+
+    @staticmethod
+    def _store_translation(cursor, model_id, rus_description):
+        """
+        ذخیره ترجمه برای مدل و همه مدل‌های با توضیحات یکسان، و افزودن آن به حافظه ترجمه.
+
+        Returns:
+            هش توضیحات ترجمه‌شده یا None اگر مدل توضیحاتی ندارد (فقط همان مدل به‌روز می‌شود)
+        """
+        cursor.execute("SELECT description_hash FROM models WHERE id = ?", (model_id,))
+        row = cursor.fetchone()
+        source_hash = row[0] if row else None
+
+        if source_hash is None:
+            cursor.execute(
+                "UPDATE models SET rus_description = ?, translation_hash = NULL WHERE id = ?",
+                (rus_description, model_id)
+            )
+            return None
+
+        cursor.execute(
+            "INSERT OR REPLACE INTO translation_memory (source_hash, translation) VALUES (?, ?)",
+            (source_hash, rus_description)
+        )
+        cursor.execute(
+            "UPDATE models SET rus_description = ?, translation_hash = description_hash WHERE description_hash = ?",
+            (rus_description, source_hash)
+        )
+        return source_hash
+
+    @staticmethod
+    def _update_translation_items(cursor, job_id, model_id, source_hash, status, error, attempts):
+        """
+        ثبت وضعیت مدل و مدل‌های در انتظار با توضیحات یکسان در کار ترجمه.
+
+        Returns:
+            تعداد مدل‌های به‌روزشده در کار
+        """
+        cursor.execute(
+            "UPDATE translation_items SET status = ?, attempts = attempts + ?, error = ?, "
+            "updated_at = CURRENT_TIMESTAMP WHERE job_id = ? AND model_id = ?",
+            (status, attempts, error, job_id, model_id)
+        )
+        count = cursor.rowcount
+        if source_hash is not None:
+            cursor.execute(
+                "UPDATE translation_items SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE job_id = ? AND status = 'pending' AND model_id != ? "
+                "AND model_id IN (SELECT id FROM models WHERE description_hash = ?)",
+                (status, error, job_id, model_id, source_hash)
+            )
+            count += cursor.rowcount
+        return count
+
+    def save_translation(self, job_id, model_id, rus_description, attempts=1):
+        """
+        ذخیره ترجمه مدل و ثبت پیشرفت کار ترجمه در یک تراکنش.
+
+        ترجمه برای همه مدل‌های با توضیحات یکسان نیز ذخیره و در کار ترجمه انجام‌شده ثبت می‌شود.
+
+        Returns:
+            تعداد مدل‌های انجام‌شده در کار، یا False در صورت خطا
+        """
+        def operation(cursor):
+            source_hash = self._store_translation(cursor, model_id, rus_description)
+            return self._update_translation_items(cursor, job_id, model_id, source_hash, 'done', None, attempts)
+
+        try:
+            count = self._write(operation, wait=True)
+            self._notify_models_changed()
+            return count
+        except Exception as e:
+            logger.error(f"خطا در ذخیره ترجمه مدل {model_id}: {e}")
+            return False
+
+    def fail_translation_item(self, job_id, model_id, error, attempts=1):
+        """
+        ثبت شکست ترجمه یک مدل (و مدل‌های در انتظار با توضیحات یکسان) در کار ترجمه.
+
+        Returns:
+            تعداد مدل‌های ناموفق‌شده در کار، یا False در صورت خطا
+        """
+        def operation(cursor):
+            cursor.execute("SELECT description_hash FROM models WHERE id = ?", (model_id,))
+            row = cursor.fetchone()
+            source_hash = row[0] if row else None
+            return self._update_translation_items(cursor, job_id, model_id, source_hash, 'failed', error, attempts)
+
+        try:
+            return self._write(operation, wait=True)
+        except Exception as e:
+            logger.error(f"خطا در ثبت شکست ترجمه مدل {model_id}: {e}")
+            return False
+
+    def finish_translation_job(self, job_id, status="done"):
+        """علامت‌گذاری پایان کار ترجمه."""
+        def operation(cursor):
+            cursor.execute(
+                "UPDATE translation_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (status, job_id)
+            )
+
+        try:
+            self._write(operation, wait=True)
+            return True
+        except Exception as e:
+            logger.error(f"خطا در پایان کار ترجمه {job_id}: {e}")
+            return False
+
     def get_dialog_history(self, id_user, number_dialog, limit=None):
         """
         دریافت تاریخچه گفت‌وگوی کاربر.
@@ -496,7 +962,10 @@ class DBHandler:
             لیست دیکشنری‌های حاوی پیام‌های گفت‌وگو [{"role": "user/assistant", "content": "..."}]
         """
         try:
-            cursor = self.conn.cursor()
+            # اطمینان از اینکه نوشته‌های در صف در تاریخچه دیده می‌شوند
+            self.flush()
+
+            cursor = self.get_read_connection().cursor()
 
             query = """
             SELECT user_ask, model_answer 
@@ -536,6 +1005,53 @@ class DBHandler:
             logger.error(f"خطا در دریافت تاریخچه گفت‌وگو: {e}")
             return []
 
+    def get_dialog_context(self, id_user, number_dialog):
+        """
+        دریافت تاریخچه گفت‌وگو همراه با تعداد توکن هر پیام برای ساخت زمینه.
+
+        اگر کش تاریخچه فعال باشد، گفت‌وگو فقط در اولین درخواست از پایگاه داده خوانده می‌شود
+        و پس از آن با هر ثبت پرسش و پاسخ به صورت افزایشی به‌روز می‌ماند.
+
+        Returns:
+            (history, tokens, total): لیست پیام‌ها، تعداد توکن هر پیام و مجموع آن‌ها؛
+            اگر کش فعال نباشد، tokens و total برابر None هستند
+        """
+        cache = self.history_cache
+        if not cache:
+            return self.get_dialog_history(id_user, number_dialog), None, None
+
+        cached = cache.snapshot(id_user, number_dialog)
+        if cached is not None:
+            return cached
+
+        try:
+            # شروع بارگذاری قبل از خواندن، تا تغییرات هم‌زمان داده خوانده‌شده را باطل کنند
+            cache.begin_load(id_user, number_dialog)
+            self.flush()
+
+            cursor = self.get_read_connection().cursor()
+            cursor.execute(
+                """
+                SELECT id, user_ask, model_answer
+                FROM dialogs
+                WHERE id_user = ? AND number_dialog = ? AND displayed = 1
+                ORDER BY id ASC
+                """,
+                (id_user, number_dialog)
+            )
+            cache.store(id_user, number_dialog, cursor.fetchall())
+        except Exception as e:
+            logger.error(f"خطا در بارگذاری تاریخچه گفت‌وگو در کش: {e}")
+            cache.store(id_user, number_dialog, None)
+            return self.get_dialog_history(id_user, number_dialog), None, None
+
+        cached = cache.snapshot(id_user, number_dialog)
+        if cached is not None:
+            return cached
+
+        # گفت‌وگو در حین بارگذاری تغییر کرده است؛ در درخواست بعدی دوباره بارگذاری می‌شود
+        return self.get_dialog_history(id_user, number_dialog), None, None
+
     def set_premium_status(self, user_id, is_premium=True):
         """
         تنظیم یا حذف وضعیت پرمیوم کاربر.
@@ -547,13 +1063,14 @@ class DBHandler:
         Returns:
             bool: True در صورت به‌روزرسانی موفق، False در صورت خطا
         """
-        try:
-            cursor = self.conn.cursor()
+        def operation(cursor):
             cursor.execute(
                 "UPDATE users SET is_premium = ? WHERE id_user = ?",
                 (1 if is_premium else 0, user_id)
             )
-            self.conn.commit()
+
+        try:
+            self._write(operation, wait=True)
             return True
         except Exception as e:
             logger.error(f"خطا در به‌روزرسانی وضعیت پرمیوم کاربر {user_id}: {e}")
@@ -570,7 +1087,7 @@ class DBHandler:
             bool: True اگر کاربر پرمیوم باشد، در غیر این صورت False
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             cursor.execute(
                 "SELECT is_premium FROM users WHERE id_user = ?",
                 (user_id,)
@@ -594,7 +1111,7 @@ class DBHandler:
             bool: True اگر کاربر وجود داشته باشد، در غیر این صورت False
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             cursor.execute("SELECT 1 FROM users WHERE id_user = ? LIMIT 1", (user_id,))
             return cursor.fetchone() is not None
         except Exception as e:
@@ -612,7 +1129,7 @@ class DBHandler:
             int: شناسه کاربر یا None اگر کاربر یافت نشود
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             cursor.execute("SELECT id_user FROM users WHERE username = ? LIMIT 1", (username,))
             result = cursor.fetchone()
             return result[0] if result else None
@@ -631,7 +1148,7 @@ class DBHandler:
             dict: دیکشنری حاوی اطلاعات کاربر یا None اگر کاربر یافت نشود
         """
         try:
-            cursor = self.conn.cursor()
+            cursor = self.get_read_connection().cursor()
             cursor.execute(
                 "SELECT first_name, last_name, username, is_premium FROM users WHERE id_user = ?",
                 (user_id,)
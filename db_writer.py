@@ -0,0 +1,222 @@
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+# نشانگر توقف جریان نویسنده
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    نویسنده دسته‌ای (write-behind) برای پایگاه داده SQLite.
+
+    عملیات نوشتن در یک صف قرار می‌گیرند و یک جریان اختصاصی آن‌ها را
+    هر interval_ms میلی‌ثانیه یا هر max_ops عملیات در یک تراکنش کوچک اعمال می‌کند.
+    هر عملیات در یک SAVEPOINT جداگانه اجرا می‌شود تا خطای یک عملیات،
+    بقیه عملیات‌های همان دسته را از بین نبرد.
+    """
+
+    def __init__(self, connect, interval_ms=50, max_ops=100):
+        """
+        Args:
+            connect: تابعی که یک اتصال SQLite با isolation_level=None برمی‌گرداند
+            interval_ms: حداکثر زمان انتظار برای تکمیل یک دسته به میلی‌ثانیه
+            max_ops: حداکثر تعداد عملیات در یک تراکنش
+
+        Raises:
+            sqlite3.Error: اگر اتصال نوشتن برقرار نشود (مثلاً database is locked)
+        """
+        self.interval = interval_ms / 1000
+        self.max_ops = max_ops
+
+        # اتصال در همین جریان برقرار می‌شود تا خطای آن به سازنده برسد، نه اینکه جریان نویسنده بی‌صدا متوقف شود
+        self._conn = connect()
+        self._queue = queue.Queue()
+
+        # شمارنده عملیات‌هایی که هنوز ثبت (commit) نشده‌اند
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        # خطایی که جریان نویسنده را متوقف کرده است؛ پس از آن عملیات جدید فوراً شکست می‌خورند
+        self._error = None
+
+        # آمار برای بررسی کاهش تعداد commitها
+        self.commits = 0
+        self.operations = 0
+
+        self._thread = threading.Thread(target=self._run, name="db-batch-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, urgent=False):
+        """
+        افزودن یک عملیات نوشتن به صف.
+
+        Args:
+            operation: تابعی که یک cursor دریافت کرده و نتیجه عملیات را برمی‌گرداند
+            urgent: اگر True باشد، دسته فعلی بلافاصله پس از این عملیات ثبت می‌شود
+
+        Returns:
+            Future: نتیجه عملیات پس از commit
+        """
+        future = Future()
+        with self._pending_lock:
+            if self._error is not None:
+                future.set_exception(self._error)
+                return future
+            self._pending += 1
+            self._queue.put((operation, future, urgent))
+        return future
+
+    def flush(self, timeout=None):
+        """
+        مانع (barrier) برای خواندن نوشته‌های خود: تا ثبت همه عملیات‌های قبلی منتظر می‌ماند.
+
+        Args:
+            timeout: حداکثر زمان انتظار به ثانیه (None = بدون محدودیت)
+        """
+        if not self.has_pending():
+            return
+
+        future = Future()
+        with self._pending_lock:
+            if self._error is not None:
+                return
+            self._queue.put((None, future, True))
+        future.result(timeout)
+
+    def has_pending(self):
+        """بررسی وجود عملیات‌های ثبت‌نشده در صف."""
+        with self._pending_lock:
+            return self._pending > 0
+
+    def close(self):
+        """ثبت عملیات‌های باقی‌مانده و توقف جریان نویسنده."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        """حلقه اصلی جریان نویسنده."""
+        conn = self._conn
+        stop = False
+        batch = []
+
+        try:
+            while not stop:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+
+                batch = [item]
+                urgent = item[2]
+                deadline = time.monotonic() + self.interval
+
+                # جمع‌آوری عملیات‌ها تا پر شدن دسته یا پایان مهلت؛
+                # پس از رسیدن عملیات فوری فقط عملیات‌های موجود در صف برداشته می‌شوند
+                while len(batch) < self.max_ops:
+                    timeout = deadline - time.monotonic()
+                    if not urgent and timeout <= 0:
+                        break
+                    try:
+                        if urgent:
+                            item = self._queue.get_nowait()
+                        else:
+                            item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                    urgent = urgent or item[2]
+
+                self._apply(conn, batch)
+
+            # ثبت عملیات‌هایی که پس از درخواست توقف در صف مانده‌اند
+            remaining = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    remaining.append(item)
+            if remaining:
+                self._apply(conn, remaining)
+        except Exception as e:
+            logger.error(f"جریان نویسنده دسته‌ای متوقف شد: {e}")
+            self._fail_pending(e, batch)
+        finally:
+            conn.close()
+
+    def _fail_pending(self, error, batch):
+        """
+        شکست عملیات‌های دسته نیمه‌کاره، عملیات‌های در صف و عملیات‌های بعدی،
+        تا هیچ فراخواننده‌ای برای همیشه منتظر نماند.
+        """
+        with self._pending_lock:
+            self._error = error
+            items = [item for item in batch if not item[1].done()]
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    items.append(item)
+            for operation, future, _ in items:
+                if operation is not None:
+                    self._pending -= 1
+                future.set_exception(error)
+
+    def _apply(self, conn, batch):
+        """اعمال یک دسته عملیات در یک تراکنش."""
+        results = []
+        operations = 0
+
+        try:
+            conn.execute("BEGIN")
+            cursor = conn.cursor()
+
+            for operation, future, _ in batch:
+                if operation is None:
+                    # نشانگر flush؛ پس از commit آزاد می‌شود
+                    results.append((future, None))
+                    continue
+
+                operations += 1
+                cursor.execute("SAVEPOINT batch_op")
+                try:
+                    result = operation(cursor)
+                    cursor.execute("RELEASE batch_op")
+                    results.append((future, result))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO batch_op")
+                    cursor.execute("RELEASE batch_op")
+                    logger.error(f"خطا در اجرای عملیات نوشتن دسته‌ای: {e}")
+                    future.set_exception(e)
+
+            conn.execute("COMMIT")
+            self.commits += 1
+            self.operations += operations
+
+            for future, result in results:
+                future.set_result(result)
+
+        except Exception as e:
+            logger.error(f"خطا در ثبت دسته عملیات‌ها در پایگاه داده: {e}")
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        finally:
+            with self._pending_lock:
+                self._pending -= sum(1 for operation, _, _ in batch if operation is not None)
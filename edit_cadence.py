@@ -0,0 +1,115 @@
+import logging
+import time
+from collections import deque
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class EditCadence:
+    """
+    کنترل‌کننده تطبیقی فاصله ویرایش پیام‌ها هنگام پخش جریانی پاسخ.
+
+    یک نمونه مشترک برای کل ربات است. فاصله هر ویرایش بعدی از فاصله پایه شروع می‌شود و:
+    - برای اولین ویرایش هر پاسخ کوتاه است تا کاربر زودتر اولین کلمات را ببیند،
+    - با نزدیک شدن نرخ کل ویرایش‌ها به سقف تلگرام یا طولانی شدن صف به‌روزرسانی‌ها بیشتر می‌شود،
+    - برای پیام‌های طولانی بیشتر می‌شود، چون هر ویرایش کل متن را دوباره ارسال می‌کند.
+
+    مثال:
+        cadence = EditCadence(base_interval=1.5)
+        delay = cadence.interval(edits_sent, text_length, dispatcher.backlog())
+        ...
+        cadence.record_edit()  # هنگام ارسال هر ویرایش به تلگرام
+    """
+
+    def __init__(self, base_interval=1.5, first_interval=0.3, max_interval=6.0, max_edit_rate=20.0,
+                 queue_limit=50, long_text=4096, window=5.0):
+        """
+        Args:
+            base_interval: فاصله عادی میان دو ویرایش یک پیام (ثانیه)
+            first_interval: فاصله اولین ویرایش پس از رسیدن اولین بخش پاسخ (ثانیه)
+            max_interval: بیشترین فاصله مجاز (ثانیه)
+            max_edit_rate: نرخ کل ویرایش‌ها در ثانیه که نباید از آن عبور کرد
+            queue_limit: طول صف به‌روزرسانی‌ها که بار کامل در نظر گرفته می‌شود
+            long_text: طول متنی (کاراکتر) که فاصله را دو برابر می‌کند
+            window: بازه اندازه‌گیری نرخ ویرایش‌ها (ثانیه)
+        """
+        self.base_interval = base_interval
+        self.first_interval = min(first_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.max_edit_rate = max_edit_rate
+        self.queue_limit = max(1, queue_limit)
+        self.long_text = max(1, long_text)
+        self.window = window
+
+        # زمان ویرایش‌های اخیر برای محاسبه نرخ
+        self._edits = deque()
+
+        # آمار برای نمایش
+        self.last_interval = base_interval
+        self.interval_total = 0.0
+        self.intervals = 0
+
+    def _prune(self, now):
+        """حذف ویرایش‌های خارج از بازه اندازه‌گیری."""
+        edge = now - self.window
+        while self._edits and self._edits[0] < edge:
+            self._edits.popleft()
+
+    def record_edit(self):
+        """ثبت ارسال یک ویرایش (یا پیام) به تلگرام."""
+        now = time.monotonic()
+        self._edits.append(now)
+        self._prune(now)
+
+    def edit_rate(self):
+        """نرخ کل ویرایش‌ها در بازه اخیر (در ثانیه)."""
+        self._prune(time.monotonic())
+        return len(self._edits) / self.window
+
+    def load(self, queue_depth=0):
+        """بار فعلی بین ۰ و ۱ (یا بیشتر): بیشینه نسبت نرخ ویرایش و طول صف به سقف آن‌ها."""
+        return max(self.edit_rate() / self.max_edit_rate, queue_depth / self.queue_limit)
+
+    def interval(self, edits_sent, text_length=0, queue_depth=0):
+        """
+        محاسبه فاصله تا ویرایش بعدی یک پیام.
+
+        Args:
+            edits_sent: تعداد ویرایش‌های ارسال‌شده برای این پاسخ تا کنون
+            text_length: طول فعلی متن پاسخ (کاراکتر)
+            queue_depth: تعداد به‌روزرسانی‌های ارسال‌نشده پیام‌ها
+
+        Returns:
+            float: فاصله به ثانیه
+        """
+        interval = self.first_interval if edits_sent == 0 else self.base_interval
+
+        # عقب‌نشینی با نزدیک شدن به سقف: از نیمه ظرفیت تا ظرفیت کامل، فاصله تا سه برابر می‌شود
+        load = self.load(queue_depth)
+        if load > 0.5:
+            interval *= 1 + (load - 0.5) * 4
+
+        # پیام‌های طولانی: هر long_text کاراکتر یک برابر فاصله پایه اضافه می‌کند
+        interval *= 1 + text_length / self.long_text
+
+        interval = min(max(interval, self.first_interval), self.max_interval)
+
+        self.last_interval = interval
+        self.interval_total += interval
+        self.intervals += 1
+        return interval
+
+    def snapshot(self):
+        """
+        دریافت خلاصه وضعیت.
+
+        Returns:
+            dict: نرخ فعلی ویرایش‌ها، بار، آخرین فاصله و میانگین فاصله‌ها (ثانیه)
+        """
+        return {
+            "edit_rate": self.edit_rate(),
+            "load": self.load(),
+            "last_interval": self.last_interval,
+            "avg_interval": (self.interval_total / self.intervals) if self.intervals else self.base_interval,
+        }
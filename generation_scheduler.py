@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class _Waiter:
+    """درخواست در انتظار یک جایگاه تولید."""
+
+    __slots__ = ("user_id", "enqueued_at", "wakeup", "granted")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        # با هر تغییر صف یا اعطای جایگاه تنظیم می‌شود
+        self.wakeup = asyncio.Event()
+        self.granted = False
+
+
+class GenerationScheduler:
+    """
+    محدودکننده تعداد تولیدهای هم‌زمان با صف منصفانه بین کاربران.
+
+    حداکثر max_active تولید به طور هم‌زمان اجرا می‌شوند و هر کاربر حداکثر max_per_user
+    تولید هم‌زمان دارد. درخواست‌های اضافی در صف هر کاربر منتظر می‌مانند و جایگاه‌های آزادشده
+    به صورت نوبتی (round-robin) بین کاربران دارای درخواست در انتظار تقسیم می‌شوند، تا
+    چند پیام پشت سر هم از یک کاربر بقیه را معطل نکند.
+
+    مثال:
+        scheduler = GenerationScheduler(max_active=8, max_per_user=1)
+        if await scheduler.acquire(user_id, on_position=show_position, cancel_event=event):
+            try:
+                await generate()
+            finally:
+                scheduler.release(user_id)
+    """
+
+    def __init__(self, max_active=8, max_per_user=1, wait_samples=1000):
+        """
+        Args:
+            max_active: حداکثر تعداد تولیدهای هم‌زمان برای کل ربات
+            max_per_user: حداکثر تعداد تولیدهای هم‌زمان هر کاربر
+            wait_samples: تعداد زمان‌های انتظار اخیر نگه‌داشته‌شده برای محاسبه صدک‌ها
+        """
+        self.max_active = max(1, max_active)
+        self.max_per_user = max(1, max_per_user)
+
+        # {کاربر: تعداد تولیدهای در حال اجرا}
+        self._active = {}
+        self._active_total = 0
+        # {کاربر: صف درخواست‌های در انتظار}
+        self._queues = {}
+        # ترتیب نوبت کاربران دارای درخواست در انتظار
+        self._rotation = deque()
+
+        # آمار زمان انتظار
+        self.granted = 0
+        self.queued = 0
+        self.canceled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._recent_waits = deque(maxlen=wait_samples)
+
+    def _can_start(self, user_id):
+        """آیا جایگاه آزاد برای کاربر وجود دارد."""
+        return self._active_total < self.max_active and self._active.get(user_id, 0) < self.max_per_user
+
+    def _grant(self, waiter):
+        """اعطای جایگاه به یک درخواست و ثبت زمان انتظار آن."""
+        self._active[waiter.user_id] = self._active.get(waiter.user_id, 0) + 1
+        self._active_total += 1
+        waiter.granted = True
+        waiter.wakeup.set()
+
+        wait = time.monotonic() - waiter.enqueued_at
+        self.granted += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self._recent_waits.append(wait)
+
+    def _dispatch(self):
+        """تقسیم جایگاه‌های آزاد بین کاربران در انتظار به صورت نوبتی و بیدار کردن منتظرها."""
+        while self._active_total < self.max_active and self._rotation:
+            # اولین کاربر در نوبت که به سقف تولیدهای هم‌زمان خود نرسیده است
+            for index, user_id in enumerate(self._rotation):
+                if self._active.get(user_id, 0) < self.max_per_user:
+                    break
+            else:
+                break
+
+            del self._rotation[index]
+            queue = self._queues[user_id]
+            self._grant(queue.popleft())
+            if queue:
+                # کاربر به انتهای نوبت منتقل می‌شود
+                self._rotation.append(user_id)
+            else:
+                del self._queues[user_id]
+
+        # جایگاه همه منتظرها ممکن است تغییر کرده باشد
+        for queue in self._queues.values():
+            for waiter in queue:
+                waiter.wakeup.set()
+
+    def position(self, waiter):
+        """
+        تخمین تعداد جایگاه‌هایی که باید پیش از این درخواست آزاد شوند (از ۱).
+
+        با تقسیم نوبتی، کاربرانی که پیش از این کاربر در نوبت هستند تا index + 1
+        و بقیه تا index درخواست پیش از آن دریافت می‌کنند.
+        """
+        index = self._queues[waiter.user_id].index(waiter)
+        position = index + 1
+        before = True
+        for user_id in self._rotation:
+            if user_id == waiter.user_id:
+                before = False
+                continue
+            position += min(len(self._queues[user_id]), index + 1 if before else index)
+        return position
+
+    def _remove(self, waiter):
+        """حذف درخواست لغوشده از صف."""
+        queue = self._queues.get(waiter.user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.user_id]
+            self._rotation.remove(waiter.user_id)
+        self.canceled += 1
+        self._dispatch()
+
+    async def acquire(self, user_id, on_position=None, cancel_event=None):
+        """
+        انتظار برای یک جایگاه تولید.
+
+        Args:
+            user_id: شناسه کاربر درخواست‌دهنده
+            on_position: تابع async که با تغییر جایگاه در صف با شماره جایگاه فراخوانی می‌شود
+            cancel_event: asyncio.Event لغو؛ در صورت تنظیم، درخواست از صف خارج می‌شود
+
+        Returns:
+            bool: True اگر جایگاه دریافت شد (release باید فراخوانی شود)،
+                False اگر درخواست پیش از دریافت جایگاه لغو شد
+        """
+        if not self._rotation and self._can_start(user_id):
+            self._grant(_Waiter(user_id))
+            return True
+
+        waiter = _Waiter(user_id)
+        if user_id not in self._queues:
+            self._queues[user_id] = deque()
+            self._rotation.append(user_id)
+        self._queues[user_id].append(waiter)
+        self.queued += 1
+        self._dispatch()
+
+        reported = None
+        try:
+            while not waiter.granted:
+                if cancel_event is not None and cancel_event.is_set():
+                    self._remove(waiter)
+                    return False
+
+                position = self.position(waiter)
+                if on_position is not None and position != reported:
+                    reported = position
+                    try:
+                        await on_position(position)
+                    except Exception as e:
+                        logger.error(f"خطا در اطلاع‌رسانی جایگاه صف به کاربر {user_id}: {e}")
+                    continue
+
+                waiter.wakeup.clear()
+                if cancel_event is None:
+                    await waiter.wakeup.wait()
+                    continue
+
+                wakeup_task = asyncio.create_task(waiter.wakeup.wait())
+                cancel_task = asyncio.create_task(cancel_event.wait())
+                try:
+                    await asyncio.wait({wakeup_task, cancel_task}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    wakeup_task.cancel()
+                    cancel_task.cancel()
+        except BaseException:
+            # لغو وظیفه در حال انتظار: آزادسازی جایگاه اعطاشده یا خروج از صف
+            if waiter.granted:
+                self.release(user_id)
+            else:
+                self._remove(waiter)
+            raise
+
+        return True
+
+    def release(self, user_id):
+        """آزادسازی جایگاه پس از پایان تولید."""
+        count = self._active.get(user_id, 0)
+        if count <= 0:
+            logger.warning(f"آزادسازی جایگاه تولید بدون دریافت قبلی برای کاربر {user_id}")
+            return
+        if count == 1:
+            del self._active[user_id]
+        else:
+            self._active[user_id] = count - 1
+        self._active_total -= 1
+        self._dispatch()
+
+    def snapshot(self):
+        """
+        دریافت خلاصه وضعیت و آمار زمان انتظار.
+
+        Returns:
+            dict: تولیدهای در حال اجرا، درخواست‌های در صف، تعداد کاربران در انتظار،
+                تعداد اعطاها و لغوها، و میانگین، میانه، صدک ۹۵ و بیشینه زمان انتظار (میلی‌ثانیه)
+        """
+        recent = sorted(self._recent_waits)
+
+        def percentile(fraction):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(len(recent) * fraction))] * 1000
+
+        return {
+            "active": self._active_total,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "waiting_users": len(self._rotation),
+            "granted": self.granted,
+            "queued": self.queued,
+            "canceled": self.canceled,
+            "avg_wait_ms": (self.wait_total / self.granted * 1000) if self.granted else 0.0,
+            "p50_wait_ms": percentile(0.5),
+            "p95_wait_ms": percentile(0.95),
+            "max_wait_ms": self.wait_max * 1000,
+        }
@@ -0,0 +1,250 @@
+import logging
+import threading
+from collections import OrderedDict
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class _DialogEntry:
+    """تاریخچه یک گفت‌وگو در حافظه همراه با تعداد توکن هر پیام."""
+
+    __slots__ = ("rows", "messages", "tokens", "total", "stale")
+
+    def __init__(self):
+        # {شناسه رکورد: [user_ask, model_answer, توکن‌های پرسش, توکن‌های پاسخ]}
+        self.rows = OrderedDict()
+        # لیست مسطح پیام‌ها و توکن‌های متناظر برای ساخت زمینه
+        self.messages = []
+        self.tokens = []
+        self.total = 0
+        # اگر True باشد، لیست مسطح باید از روی rows بازسازی شود
+        self.stale = False
+
+    def rebuild(self):
+        """بازسازی لیست مسطح پیام‌ها پس از تغییری غیر از افزودن به انتها."""
+        self.messages = []
+        self.tokens = []
+        for user_ask, model_answer, ask_tokens, answer_tokens in self.rows.values():
+            if user_ask:
+                self.messages.append({"role": "user", "content": user_ask})
+                self.tokens.append(ask_tokens)
+            if model_answer:
+                self.messages.append({"role": "assistant", "content": model_answer})
+                self.tokens.append(answer_tokens)
+        self.stale = False
+
+
+class DialogHistoryCache:
+    """
+    کش محدود تاریخچه گفت‌وگوها با کلید (کاربر، شماره گفت‌وگو).
+
+    فقط رکوردهای قابل نمایش (displayed = 1) نگه داشته می‌شوند. DBHandler پس از هر ثبت
+    پرسش، ذخیره پاسخ یا غیرفعال شدن پاسخ، کش را به صورت افزایشی به‌روزرسانی می‌کند، بنابراین
+    تخمین توکن هر پیام فقط یک بار انجام می‌شود و مجموع توکن‌ها همیشه آماده است.
+    در صورت پر شدن، گفت‌وگویی که مدت بیشتری استفاده نشده حذف می‌شود (LRU).
+    """
+
+    def __init__(self, estimate_tokens, maxsize=1000):
+        """
+        Args:
+            estimate_tokens: تابع تخمین تعداد توکن‌های یک متن
+            maxsize: حداکثر تعداد گفت‌وگوهای نگه‌داشته‌شده
+        """
+        self.estimate_tokens = estimate_tokens
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # {شناسه رکورد: کلید گفت‌وگو} برای به‌روزرسانی‌هایی که فقط شناسه رکورد را دارند
+        self._dialog_keys = {}
+        # بارگذاری‌های در حال انجام: {کلید: [تعداد بارگذاری‌ها، تغییر کرده؟]}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+        # آمار برای عیب‌یابی
+        self.hits = 0
+        self.misses = 0
+
+    def _mark_loading_dirty(self, key=None):
+        """باطل کردن بارگذاری‌های در حال انجام که ممکن است داده قدیمی خوانده باشند."""
+        if key is None:
+            for state in self._loading.values():
+                state[1] = True
+        elif key in self._loading:
+            self._loading[key][1] = True
+
+    def snapshot(self, id_user, number_dialog):
+        """
+        دریافت تاریخچه گفت‌وگو از کش.
+
+        Returns:
+            (messages, tokens, total) یا None اگر گفت‌وگو در کش نباشد.
+            messages لیست جدیدی است، اما دیکشنری‌های پیام‌ها مشترک‌اند و نباید تغییر داده شوند.
+        """
+        key = (id_user, number_dialog)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if entry.stale:
+                entry.rebuild()
+            return list(entry.messages), list(entry.tokens), entry.total
+
+    def begin_load(self, id_user, number_dialog):
+        """
+        اعلام شروع بارگذاری گفت‌وگو از پایگاه داده.
+        باید قبل از خواندن از پایگاه داده فراخوانی شود تا تغییرات هم‌زمان تشخیص داده شوند.
+        """
+        key = (id_user, number_dialog)
+        with self._lock:
+            state = self._loading.setdefault(key, [0, False])
+            state[0] += 1
+
+    def store(self, id_user, number_dialog, rows):
+        """
+        ذخیره گفت‌وگوی بارگذاری‌شده از پایگاه داده.
+
+        Args:
+            rows: لیست (id, user_ask, model_answer) رکوردهای قابل نمایش به ترتیب id،
+                یا None اگر بارگذاری ناموفق بوده باشد
+        """
+        key = (id_user, number_dialog)
+
+        # تخمین توکن‌ها خارج از قفل انجام می‌شود
+        prepared = [
+            (dialog_id, [user_ask, model_answer,
+                         self.estimate_tokens(user_ask) if user_ask else 0,
+                         self.estimate_tokens(model_answer) if model_answer else 0])
+            for dialog_id, user_ask, model_answer in rows or ()
+        ]
+
+        with self._lock:
+            state = self._loading.get(key)
+            dirty = state is None or state[1]
+            if state is not None:
+                state[0] -= 1
+                if state[0] <= 0:
+                    del self._loading[key]
+
+            # اگر در حین بارگذاری گفت‌وگو تغییر کرده باشد، داده خوانده‌شده ممکن است قدیمی باشد
+            if rows is None or dirty or key in self._entries:
+                return
+
+            entry = _DialogEntry()
+            for dialog_id, row in prepared:
+                entry.rows[dialog_id] = row
+                entry.total += row[2] + row[3]
+                self._dialog_keys[dialog_id] = key
+            entry.rebuild()
+
+            self._entries[key] = entry
+            self._evict()
+
+    def _evict(self):
+        """حذف گفت‌وگوهای کم‌استفاده در صورت عبور از حداکثر اندازه."""
+        while len(self._entries) > self.maxsize:
+            _, entry = self._entries.popitem(last=False)
+            for dialog_id in entry.rows:
+                self._dialog_keys.pop(dialog_id, None)
+
+    def append(self, id_user, number_dialog, dialog_id, user_ask, model_answer=None, displayed=1):
+        """افزودن رکورد تازه ثبت‌شده به انتهای گفت‌وگو."""
+        key = (id_user, number_dialog)
+        ask_tokens = self.estimate_tokens(user_ask) if user_ask else 0
+        answer_tokens = self.estimate_tokens(model_answer) if model_answer else 0
+
+        with self._lock:
+            self._mark_loading_dirty(key)
+            entry = self._entries.get(key)
+            if entry is None or not displayed:
+                return
+
+            entry.rows[dialog_id] = [user_ask, model_answer, ask_tokens, answer_tokens]
+            entry.total += ask_tokens + answer_tokens
+            self._dialog_keys[dialog_id] = key
+            if not entry.stale:
+                if user_ask:
+                    entry.messages.append({"role": "user", "content": user_ask})
+                    entry.tokens.append(ask_tokens)
+                if model_answer:
+                    entry.messages.append({"role": "assistant", "content": model_answer})
+                    entry.tokens.append(answer_tokens)
+
+    def update_answer(self, dialog_id, model_answer, displayed=1):
+        """به‌روزرسانی پاسخ مدل برای یک رکورد."""
+        answer_tokens = self.estimate_tokens(model_answer) if model_answer else 0
+
+        with self._lock:
+            key = self._dialog_keys.get(dialog_id)
+            if key is None:
+                # رکورد در کش نیست؛ فقط بارگذاری‌های در حال انجام باطل می‌شوند
+                self._mark_loading_dirty()
+                return
+
+            self._mark_loading_dirty(key)
+            entry = self._entries[key]
+            if not displayed:
+                self._remove_row(entry, dialog_id)
+                return
+
+            row = entry.rows[dialog_id]
+            had_answer = bool(row[1])
+            entry.total += answer_tokens - row[3]
+            row[1] = model_answer
+            row[3] = answer_tokens
+
+            if entry.stale:
+                return
+            if next(reversed(entry.rows)) == dialog_id and model_answer:
+                # حالت رایج: پاسخ آخرین پرسش گفت‌وگو
+                if had_answer:
+                    entry.messages[-1] = {"role": "assistant", "content": model_answer}
+                    entry.tokens[-1] = answer_tokens
+                else:
+                    entry.messages.append({"role": "assistant", "content": model_answer})
+                    entry.tokens.append(answer_tokens)
+            else:
+                entry.stale = True
+
+    def deactivate(self, dialog_id):
+        """حذف رکوردی که به عنوان غیرقابل نمایش علامت‌گذاری شده است."""
+        with self._lock:
+            key = self._dialog_keys.get(dialog_id)
+            if key is None:
+                self._mark_loading_dirty()
+                return
+
+            self._mark_loading_dirty(key)
+            self._remove_row(self._entries[key], dialog_id)
+
+    def _remove_row(self, entry, dialog_id):
+        """حذف یک رکورد از گفت‌وگو (باید با نگه داشتن قفل فراخوانی شود)."""
+        row = entry.rows.pop(dialog_id)
+        self._dialog_keys.pop(dialog_id, None)
+        entry.total -= row[2] + row[3]
+        entry.stale = True
+
+    def _invalidate(self, key):
+        """حذف گفت‌وگو از کش (باید با نگه داشتن قفل فراخوانی شود)."""
+        self._mark_loading_dirty(key)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for dialog_id in entry.rows:
+                self._dialog_keys.pop(dialog_id, None)
+
+    def invalidate(self, id_user, number_dialog):
+        """حذف گفت‌وگو از کش (مثلاً پس از خطای نوشتن)."""
+        with self._lock:
+            self._invalidate((id_user, number_dialog))
+
+    def invalidate_record(self, dialog_id):
+        """حذف گفت‌وگوی شامل یک رکورد از کش."""
+        with self._lock:
+            key = self._dialog_keys.get(dialog_id)
+            if key is None:
+                self._mark_loading_dirty()
+            else:
+                self._invalidate(key)
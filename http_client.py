@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+# پشتیبانی از HTTP/2 به بسته اختیاری h2 نیاز دارد (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class PoolMetrics:
+    """
+    آمار استفاده از استخر اتصال‌ها.
+
+    هر درخواست یا از یک اتصال باز موجود استفاده می‌کند، یا اتصال جدیدی (TCP و TLS) می‌سازد.
+    نسبت استفاده مجدد و زمان برقراری اتصال نشان می‌دهند چه مقدار از تأخیر اولین توکن
+    صرف راه‌اندازی اتصال شده است.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.connect_time_total = 0.0
+        self.headers_time_total = 0.0
+        self.responses = 0
+
+    def record_connect(self, seconds):
+        """ثبت یک اتصال جدید و زمان برقراری آن (TCP و TLS)."""
+        self.new_connections += 1
+        self.connect_time_total += seconds
+
+    def snapshot(self):
+        """
+        دریافت خلاصه آمار.
+
+        Returns:
+            dict: تعداد درخواست‌ها، اتصال‌های جدید، نسبت استفاده مجدد،
+                میانگین زمان اتصال و میانگین زمان تا دریافت سرآیندهای پاسخ (میلی‌ثانیه)
+        """
+        requests = self.requests
+        return {
+            "requests": requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": (1 - self.new_connections / requests) if requests else 0.0,
+            "avg_connect_ms": (self.connect_time_total / self.new_connections * 1000) if self.new_connections else 0.0,
+            "avg_headers_ms": (self.headers_time_total / self.responses * 1000) if self.responses else 0.0,
+        }
+
+
+class SharedHTTPClient:
+    """
+    کلاینت HTTP مشترک برای همه درخواست‌های اوپن‌روتر.
+
+    یک httpx.AsyncClient با استخر اتصال‌های keep-alive برای کل ربات ساخته می‌شود،
+    تا هر نوبت گفت‌وگو هزینه DNS، TCP و TLS را دوباره نپردازد.
+
+    مثال:
+        http = SharedHTTPClient(pool_size=20, http2=True)
+        await http.prewarm("https://openrouter.ai/api/v1/models")
+        response = await http.client.get(url)
+    """
+
+    def __init__(self, pool_size=20, keepalive_connections=10, keepalive_expiry=60, http2=False):
+        """
+        Args:
+            pool_size: حداکثر تعداد اتصال‌های هم‌زمان
+            keepalive_connections: حداکثر تعداد اتصال‌های بیکار نگه‌داشته‌شده
+            keepalive_expiry: مدت نگه داشتن اتصال بیکار (ثانیه)
+            http2: استفاده از HTTP/2 (چندگانه‌سازی درخواست‌ها روی یک اتصال)
+        """
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("بسته h2 نصب نیست، از HTTP/1.1 استفاده می‌شود")
+            http2 = False
+
+        self.metrics = PoolMetrics()
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
+            }
+        )
+
+    async def _on_request(self, request):
+        """ثبت درخواست و افزودن trace برای اندازه‌گیری برقراری اتصال."""
+        self.metrics.requests += 1
+        request.extensions["started_at"] = time.perf_counter()
+
+        connect_started = None
+
+        async def trace(event_name, info):
+            nonlocal connect_started
+            if event_name == "connection.connect_tcp.started":
+                connect_started = time.perf_counter()
+            elif connect_started is not None and event_name in (
+                    "connection.start_tls.complete", "connection.connect_tcp.failed", "connection.start_tls.failed"):
+                self.metrics.record_connect(time.perf_counter() - connect_started)
+                connect_started = None
+            elif connect_started is not None and event_name == "connection.connect_tcp.complete" \
+                    and request.url.scheme != "https":
+                self.metrics.record_connect(time.perf_counter() - connect_started)
+                connect_started = None
+
+        request.extensions["trace"] = trace
+
+    async def _on_response(self, response):
+        """ثبت زمان تا دریافت سرآیندهای پاسخ."""
+        started_at = response.request.extensions.get("started_at")
+        if started_at is not None:
+            self.metrics.responses += 1
+            self.metrics.headers_time_total += time.perf_counter() - started_at
+
+    async def prewarm(self, url, connections=1):
+        """
+        باز کردن اتصال‌ها پیش از اولین درخواست کاربران.
+
+        Args:
+            url: نشانی‌ای روی میزبان مقصد (پاسخ آن اهمیتی ندارد)
+            connections: تعداد اتصال‌هایی که هم‌زمان باز می‌شوند
+        """
+        async def warm():
+            try:
+                await self.client.head(url, timeout=10)
+            except Exception as e:
+                logger.error(f"خطا در آماده‌سازی اتصال به {url}: {e}")
+
+        await asyncio.gather(*(warm() for _ in range(max(1, connections))))
+        logger.info(f"{connections} اتصال به {url} آماده شد")
+
+    async def aclose(self):
+        """بستن همه اتصال‌ها."""
+        await self.client.aclose()
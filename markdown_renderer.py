@@ -0,0 +1,217 @@
+import html
+import re
+
+# الگوهای تبدیل؛ ترتیب اعمال آن‌ها بخشی از خروجی است
+_PRE_RE = re.compile(r'```([^`]+)```')
+_CODE_RE = re.compile(r'`([^`]+)`')
+_BOLD_RE = re.compile(r'\*\*([^*]+)\*\*')
+_ITALIC_RE = re.compile(r'\*([^*]+)\*')
+
+# برای هر نشانگر: الگوی دوتایی/سه‌تایی که ابتدا اعمال می‌شود و الگوی تکی پس از آن
+_MARKER_PASSES = (
+    ("`", _PRE_RE, _CODE_RE),
+    ("*", _BOLD_RE, _ITALIC_RE),
+)
+
+# تگ بازکننده‌ای که یک نشانگر تکی در صورت جفت شدن به آن تبدیل می‌شود
+_OPEN_TAGS = {"`": "<code>", "*": "<i>"}
+
+# کاراکترهای جانشین نشانگرهای معلق هنگام رندر بخش ثابت‌شده
+_SENTINELS = {"`": "\x00", "*": "\x01"}
+
+
+def convert_markdown_to_html(markdown_text):
+    """تبدیل نشانه‌گذاری پایه Markdown به HTML برای تلگرام."""
+    # جایگزینی کاراکترهای ویژه HTML
+    text = html.escape(markdown_text)
+
+    # جایگزینی بلوک‌های کد
+    text = _PRE_RE.sub(r'<pre>\1</pre>', text)
+
+    # جایگزینی کد درون‌خطی
+    text = _CODE_RE.sub(r'<code>\1</code>', text)
+
+    # جایگزینی متن پررنگ
+    text = _BOLD_RE.sub(r'<b>\1</b>', text)
+
+    # جایگزینی متن کج (ایتالیک)
+    text = _ITALIC_RE.sub(r'<i>\1</i>', text)
+
+    return text
+
+
+def _find_cut(text):
+    """
+    یافتن دورترین نقطه برش امن در متن.
+
+    نقطه برش c امن است اگر خروجی convert_markdown_to_html برای text[:c] با هر ادامه‌ای
+    از متن تغییر نکند. نشانگرهای ` و * مستقل از یکدیگر پردازش می‌شوند و html.escape
+    هر کاراکتر را جداگانه تبدیل می‌کند، بنابراین کافی است برای هر نشانگر:
+    - همه نشانگرهای پیش از c در تطبیق‌هایی مصرف شده باشند که تا c تمام می‌شوند،
+    - کاراکتر text[c-1] نشانگر نباشد (الگوهای چندکاراکتری از روی برش عبور نکنند).
+
+    یک استثنا برای هر نشانگر مجاز است: اولین نشانگر تکی مصرف‌نشده u که پیش و پس از آن
+    نشانگر هم‌نوع نیست. سرنوشت چنین نشانگری فقط به این بستگی دارد که بعداً نشانگر هم‌نوع
+    مصرف‌نشده دیگری برسد یا نه؛ در آن صورت به تگ بازکننده تبدیل می‌شود و در غیر این صورت
+    همان کاراکتر باقی می‌ماند. چنین نشانگری «معلق» نگه داشته می‌شود.
+
+    Returns:
+        (cut, pending): محل برش و {نشانگر: موقعیت} نشانگرهای معلق پیش از برش
+    """
+    spans = []
+
+    def blank(match):
+        spans.append(match.span())
+        return "\0" * (match.end() - match.start())
+
+    limit = len(text)
+    pending = {}
+    for marker, multi_re, single_re in _MARKER_PASSES:
+        # نشانگرهای مصرف‌شده با کاراکتر خنثی جایگزین می‌شوند تا موقعیت‌ها حفظ شوند
+        remaining = single_re.sub(blank, multi_re.sub(blank, text))
+
+        first = remaining.find(marker)
+        if first < 0:
+            continue
+        if (first + 1 < len(text) and text[first + 1] != marker
+                and (first == 0 or text[first - 1] != marker)):
+            pending[marker] = first
+            first = remaining.find(marker, first + 1)
+            if first < 0:
+                continue
+        limit = min(limit, first)
+
+    # عقب بردن برش تا پیش از نشانگرها و تطبیق‌هایی که از روی آن عبور می‌کنند
+    while limit > 0:
+        if text[limit - 1] in _OPEN_TAGS:
+            limit -= 1
+            continue
+        crossing = [start for start, end in spans if start < limit < end]
+        if crossing:
+            limit = min(crossing)
+            continue
+        break
+
+    return limit, {marker: position for marker, position in pending.items() if position < limit}
+
+
+class StreamingMarkdownRenderer:
+    """
+    رندر افزایشی Markdown به HTML برای پاسخ‌های جریانی.
+
+    خروجی render() همیشه دقیقاً برابر convert_markdown_to_html(متن کامل تا این لحظه) است،
+    اما فقط بخش انتهایی متن که هنوز ممکن است تغییر کند دوباره پردازش می‌شود. بخش ثابت‌شده
+    یک بار رندر و نگه داشته می‌شود؛ نشانگرهای تکی باز (` یا *) که ممکن است بعداً بسته شوند
+    به صورت معلق در آن باقی می‌مانند و در هر رندر با تگ یا کاراکتر خود جایگزین می‌شوند.
+
+    مثال:
+        renderer = StreamingMarkdownRenderer()
+        for chunk in chunks:
+            renderer.feed(chunk)
+        html_text = renderer.render()
+    """
+
+    def __init__(self):
+        # بخش ثابت‌شده: رشته‌ها در اندیس‌های زوج و نشانگرهای معلق در اندیس‌های فرد
+        self._head = [""]
+        # نشانگرهای معلق به ترتیب پیشوند مجازی
+        self._pending = []
+        # متنی که هنوز ثابت نشده است
+        self._tail = ""
+
+    def feed(self, delta):
+        """افزودن بخش جدید متن."""
+        self._tail += delta
+
+    def _virtual_prefix(self):
+        """
+        پیشوند مجازی برای نشانگرهای معلق: هر نشانگر با یک کاراکتر محتوا.
+
+        نشانگر معلق با اولین نشانگر هم‌نوع مصرف‌نشده پس از خود جفت می‌شود؛ قرار دادن آن
+        در ابتدای متن انتهایی همین رفتار را بازتولید می‌کند.
+        """
+        return "".join(marker + "a" for marker in self._pending)
+
+    def _resolve_prefix(self, rendered):
+        """
+        خواندن وضعیت نشانگرهای معلق از ابتدای خروجی رندرشده پیشوند مجازی.
+
+        Returns:
+            (renders, position): {نشانگر: خروجی آن} و طول بخش مربوط به پیشوند در خروجی
+        """
+        renders = {}
+        position = 0
+        for marker in self._pending:
+            tag = _OPEN_TAGS[marker]
+            if rendered.startswith(tag, position):
+                renders[marker] = tag
+                position += len(tag)
+            else:
+                renders[marker] = marker
+                position += 1
+            # کاراکتر محتوای مجازی
+            position += 1
+        return renders, position
+
+    def _commit(self, text, prefix_length, cut, pending):
+        """ثابت کردن text[:cut] و انتقال نشانگرهای معلق جدید به بخش ثابت‌شده."""
+        new_pending = sorted(
+            (position, marker) for marker, position in pending.items() if position >= prefix_length
+        )
+
+        head = list(text[:cut])
+        for position, marker in new_pending:
+            head[position] = _SENTINELS[marker]
+        rendered = convert_markdown_to_html("".join(head))
+
+        # نشانگرهای معلق قبلی که اکنون جفت شده‌اند با تگ بازکننده جایگزین و ادغام می‌شوند
+        renders, position = self._resolve_prefix(rendered)
+        merged = [self._head[0]]
+        still_pending = []
+        for index, marker in enumerate(self._pending):
+            segment = self._head[2 * index + 2]
+            if pending.get(marker, prefix_length) < prefix_length:
+                still_pending.append(marker)
+                merged.extend((marker, segment))
+            else:
+                merged[-1] += renders[marker] + segment
+
+        # افزودن خروجی جدید و جدا کردن آن در محل نشانگرهای معلق جدید
+        rendered = rendered[position:]
+        for _, marker in new_pending:
+            before, rendered = rendered.split(_SENTINELS[marker], 1)
+            merged[-1] += before
+            merged.extend((marker, ""))
+            still_pending.append(marker)
+        merged[-1] += rendered
+
+        # ترتیب پیشوند مجازی با ترتیب نشانگرها در _head یکسان می‌ماند
+        self._head = merged
+        self._pending = still_pending
+        self._tail = text[cut:]
+
+    def render(self):
+        """
+        رندر متن کامل تا این لحظه.
+
+        Returns:
+            str: همان خروجی convert_markdown_to_html برای کل متن
+        """
+        prefix = self._virtual_prefix()
+        text = prefix + self._tail
+
+        cut, pending = _find_cut(text)
+        if cut > len(prefix) and not any(sentinel in text for sentinel in _SENTINELS.values()):
+            self._commit(text, len(prefix), cut, pending)
+            prefix = self._virtual_prefix()
+            text = prefix + self._tail
+
+        rendered = convert_markdown_to_html(text)
+        renders, position = self._resolve_prefix(rendered)
+
+        parts = [self._head[0]]
+        for index, marker in enumerate(self._pending):
+            parts.append(renders[marker])
+            parts.append(self._head[2 * index + 2])
+        parts.append(rendered[position:])
+        return "".join(parts)
@@ -0,0 +1,267 @@
+import hashlib
+import logging
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+def _column_names(cursor, table):
+    """دریافت نام ستون‌های یک جدول."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+
+def _baseline(cursor):
+    """
+    طرح پایه: جدول‌های users، dialogs و models.
+
+    پایگاه‌های داده ساخته‌شده پیش از نسخه‌گذاری طرح (user_version = 0) ممکن است
+    ستون‌های جدیدتر را نداشته باشند؛ این بررسی‌ها فقط یک بار و در همین مهاجرت انجام می‌شوند.
+    """
+    # ایجاد جدول کاربران
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        id_chat INTEGER NOT NULL,
+        id_user INTEGER NOT NULL,
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        register_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_premium INTEGER DEFAULT 0,
+        UNIQUE(id_chat, id_user)
+    )
+    ''')
+
+    # ایجاد جدول گفت‌وگوها با ستون displayed
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dialogs (
+        id INTEGER PRIMARY KEY,
+        id_chat INTEGER NOT NULL,
+        id_user INTEGER NOT NULL,
+        number_dialog INTEGER NOT NULL,
+        model TEXT,
+        model_id TEXT,
+        user_ask TEXT,
+        model_answer TEXT,
+        ask_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        displayed INTEGER DEFAULT 1,
+        FOREIGN KEY (id_chat, id_user) REFERENCES users (id_chat, id_user)
+    )
+    ''')
+
+    # ایجاد جدول مدل‌ها
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS models (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        created INTEGER,
+        description TEXT,
+        rus_description TEXT,
+        context_length INTEGER,
+        modality TEXT,
+        tokenizer TEXT,
+        instruct_type TEXT,
+        prompt_price TEXT,
+        completion_price TEXT,
+        image_price TEXT,
+        request_price TEXT,
+        provider_context_length INTEGER,
+        is_moderated INTEGER,
+        is_free INTEGER,
+        top_model INTEGER DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # ستون 'displayed' در پایگاه‌های داده قدیمی
+    if 'displayed' not in _column_names(cursor, "dialogs"):
+        logger.info("افزودن ستون 'displayed' به جدول 'dialogs'")
+        cursor.execute("ALTER TABLE dialogs ADD COLUMN displayed INTEGER DEFAULT 1")
+        cursor.execute("UPDATE dialogs SET displayed = 1 WHERE displayed IS NULL")
+
+    # ستون 'is_premium' در پایگاه‌های داده قدیمی
+    if 'is_premium' not in _column_names(cursor, "users"):
+        logger.info("افزودن ستون 'is_premium' به جدول 'users'")
+        cursor.execute("ALTER TABLE users ADD COLUMN is_premium INTEGER DEFAULT 0")
+        cursor.execute("UPDATE users SET is_premium = 0 WHERE is_premium IS NULL")
+
+
+def _lookup_indexes(cursor):
+    """
+    ایندکس‌های پرس‌وجوهای پرتکرار.
+
+    ترتیب مدخل‌های هر ایندکس با کلید یکسان بر اساس rowid است، بنابراین
+    ایندکس (id_user, number_dialog) هم فیلتر تاریخچه و هم ORDER BY id را پوشش می‌دهد
+    و MAX(number_dialog) را بدون خواندن جدول محاسبه می‌کند.
+    """
+    # تاریخچه گفت‌وگو و آخرین پیام گفت‌وگو
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_dialogs_user_dialog ON dialogs (id_user, number_dialog)"
+    )
+
+    # جستجوی کاربر بر اساس id_user (پوشش‌دهنده برای بررسی پرمیوم و وجود کاربر)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_id_user ON users (id_user, is_premium)"
+    )
+
+    # جستجوی کاربر بر اساس نام کاربری
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users (username, id_user) WHERE username IS NOT NULL"
+    )
+
+
+def _dialog_sequences(cursor):
+    """
+    جدول شمارنده گفت‌وگوهای هر کاربر، پر شده از گفت‌وگوهای موجود.
+
+    last_number آخرین شماره گفت‌وگوی تخصیص‌یافته به کاربر است و همیشه
+    حداقل برابر با MAX(number_dialog) گفت‌وگوهای ثبت‌شده او باقی می‌ماند.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dialog_sequences (
+        id_user INTEGER PRIMARY KEY,
+        last_number INTEGER NOT NULL
+    )
+    ''')
+
+    cursor.execute('''
+    INSERT OR IGNORE INTO dialog_sequences (id_user, last_number)
+    SELECT id_user, MAX(number_dialog) FROM dialogs GROUP BY id_user
+    ''')
+
+
+def _translation_checkpoints(cursor):
+    """
+    جدول‌های پیشرفت کار ترجمه توضیحات مدل‌ها.
+
+    هر کار ترجمه یک ردیف در translation_jobs و برای هر مدل یک ردیف در translation_items
+    دارد؛ مدل‌های با وضعیت 'pending' پس از راه‌اندازی مجدد ربات دوباره ترجمه می‌شوند.
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS translation_jobs (
+        id INTEGER PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'running',
+        id_chat INTEGER,
+        total INTEGER NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS translation_items (
+        job_id INTEGER NOT NULL,
+        model_id TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (job_id, model_id),
+        FOREIGN KEY (job_id) REFERENCES translation_jobs (id)
+    )
+    ''')
+
+
+def _translation_memory(cursor):
+    """
+    حافظه ترجمه بر اساس هش متن توضیحات.
+
+    description_hash هش توضیحات فعلی مدل و translation_hash هش توضیحاتی است که
+    rus_description ترجمه آن است؛ تفاوت این دو یعنی ترجمه کهنه است. ترجمه‌های موجود
+    ترجمه توضیحات فعلی فرض می‌شوند و حافظه ترجمه از آن‌ها پر می‌شود.
+    """
+    columns = _column_names(cursor, "models")
+    if 'description_hash' not in columns:
+        cursor.execute("ALTER TABLE models ADD COLUMN description_hash TEXT")
+    if 'translation_hash' not in columns:
+        cursor.execute("ALTER TABLE models ADD COLUMN translation_hash TEXT")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS translation_memory (
+        source_hash TEXT PRIMARY KEY,
+        translation TEXT NOT NULL,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # همان روش DBHandler.description_hash (SHA-256 متن بدون تغییر)
+    cursor.execute("SELECT id, description, rus_description FROM models WHERE description IS NOT NULL")
+    rows = [
+        (hashlib.sha256(description.encode("utf-8")).hexdigest(), model_id, rus_description)
+        for model_id, description, rus_description in cursor.fetchall()
+    ]
+    cursor.executemany("UPDATE models SET description_hash = ? WHERE id = ?", [row[:2] for row in rows])
+
+    translated = [row for row in rows if row[2]]
+    cursor.executemany("UPDATE models SET translation_hash = ? WHERE id = ?", [row[:2] for row in translated])
+    cursor.executemany(
+        "INSERT OR IGNORE INTO translation_memory (source_hash, translation) VALUES (?, ?)",
+        [(row[0], row[2]) for row in translated]
+    )
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_models_description_hash ON models (description_hash)")
+
+
+# مهاجرت‌ها به ترتیب نسخه؛ هر مهاجرت جدید باید به انتهای این لیست اضافه شود
+# و هرگز نباید مهاجرت‌های قبلی را تغییر داد
+MIGRATIONS = [
+    (1, "طرح پایه", _baseline),
+    (2, "ایندکس‌های جستجو", _lookup_indexes),
+    (3, "شمارنده گفت‌وگوها", _dialog_sequences),
+    (4, "پیشرفت کار ترجمه", _translation_checkpoints),
+    (5, "حافظه ترجمه", _translation_memory),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """دریافت نسخه فعلی طرح پایگاه داده (PRAGMA user_version)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """
+    اعمال مهاجرت‌های معلق روی پایگاه داده.
+
+    اگر پایگاه داده به‌روز باشد، فقط یک PRAGMA user_version خوانده می‌شود. در غیر این صورت
+    همه مهاجرت‌های معلق و نسخه جدید در یک تراکنش ثبت می‌شوند؛ در صورت خطا هیچ‌کدام اعمال نمی‌شوند.
+
+    Args:
+        conn: اتصال sqlite3 (نباید تراکنش باز داشته باشد)
+
+    Returns:
+        int: نسخه طرح پس از اعمال مهاجرت‌ها
+    """
+    version = get_schema_version(conn)
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if not pending:
+        return version
+
+    # مدیریت دستی تراکنش، تا دستورات DDL هم در همان تراکنش قرار بگیرند
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # بررسی دوباره پس از گرفتن قفل نوشتن (ممکن است فرایند دیگری مهاجرت را انجام داده باشد)
+            version = get_schema_version(conn)
+            for number, title, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                logger.info(f"اعمال مهاجرت {number}: {title}")
+                migrate(cursor)
+                version = number
+
+            cursor.execute(f"PRAGMA user_version = {version}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+
+    logger.info(f"طرح پایگاه داده به نسخه {version} به‌روزرسانی شد")
+    return version
@@ -0,0 +1,164 @@
+import logging
+import threading
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class ModelRecord:
+    """رکورد فشرده یک مدل در حافظه."""
+
+    __slots__ = (
+        "id", "name", "description", "context_length",
+        "prompt_price", "completion_price", "is_free", "top_model"
+    )
+
+    def __init__(self, model_id, name, description, context_length,
+                 prompt_price, completion_price, is_free, top_model):
+        self.id = model_id
+        self.name = name
+        self.description = description
+        self.context_length = context_length
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.is_free = is_free
+        self.top_model = top_model
+
+    def to_dict(self):
+        """تبدیل به دیکشنری با همان ساختار DBHandler.get_models."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "description": self.description,
+            "context_length": self.context_length,
+            "is_free": self.is_free,
+            "top_model": self.top_model
+        }
+
+
+class _CatalogState:
+    """نمای تغییرناپذیر کاتالوگ؛ با یک انتساب جایگزین می‌شود."""
+
+    __slots__ = ("by_id", "all_models", "free_models", "top_models", "free_ids", "free_index")
+
+    def __init__(self, records):
+        self.by_id = {record.id: record for record in records}
+
+        # مرتب‌سازی مشابه get_models: ابتدا مدل‌های برتر، سپس بر اساس نام
+        ordered = sorted(records, key=lambda record: (not record.top_model, record.name))
+        self.all_models = tuple(record.to_dict() for record in ordered)
+        self.free_models = tuple(model for model in self.all_models if model["is_free"])
+        self.top_models = tuple(model for model in self.all_models if model["top_model"])
+
+        # فهرست مدل‌های رایگان به ترتیب شناسه برای چرخش بین مدل‌های ترجمه
+        self.free_ids = tuple(sorted(
+            record.id for record in records
+            if (record.prompt_price == "0" and record.completion_price == "0")
+            or record.id.lower().endswith(":free")
+        ))
+        self.free_index = {model_id: index for index, model_id in enumerate(self.free_ids)}
+
+
+class ModelCatalog:
+    """
+    کاتالوگ مدل‌ها در حافظه با جستجوی O(1).
+
+    پس از هر تغییر در جدول models (همگام‌سازی، تنظیم مدل برتر یا توضیحات)
+    DBHandler کاتالوگ را مطلع می‌کند و نمای جدید به صورت اتمیک جایگزین می‌شود،
+    بنابراین خوانندگان هرگز نمای نیمه‌ساخته نمی‌بینند. بازسازی‌ها از جریان‌های مختلف
+    نوشتن فراخوانی می‌شوند و ممکن است به ترتیب دیگری پایان یابند؛ شماره نسل تضمین می‌کند
+    که نمای قدیمی‌تر هرگز جایگزین نمای جدیدتر نشود.
+    """
+
+    def __init__(self):
+        self._state = _CatalogState([])
+        self._lock = threading.Lock()
+        # شماره آخرین بازسازی آغازشده و شماره نسل نمای فعلی
+        self._generation = 0
+        self._published = 0
+
+    def attach(self, db):
+        """ثبت کاتالوگ برای دریافت تغییرات مدل‌ها از DBHandler و بارگذاری اولیه."""
+        db.models_listeners.append(self.reload)
+        self.reload(db)
+
+    def reload(self, db):
+        """بازسازی کاتالوگ از پایگاه داده."""
+        # شماره نسل پیش از خواندن گرفته می‌شود: بازسازی با شماره بزرگ‌تر داده‌های جدیدتری می‌خواند
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+
+        rows = db.get_catalog_rows()
+        if rows is None:
+            # در صورت خطا نمای فعلی حفظ می‌شود
+            return
+
+        records = [
+            ModelRecord(row[0], row[1], row[3] if row[3] else row[2], row[4],
+                        row[5], row[6], bool(row[7]), bool(row[8]))
+            for row in rows
+        ]
+
+        state = _CatalogState(records)
+
+        # جایگزینی اتمیک نمای کاتالوگ، مگر اینکه بازسازی جدیدتری زودتر پایان یافته باشد
+        with self._lock:
+            if generation < self._published:
+                return
+            self._published = generation
+            self._state = state
+        logger.info(f"کاتالوگ مدل‌ها با {len(records)} مدل بازسازی شد")
+
+    def get(self, model_id):
+        """دریافت رکورد مدل یا None."""
+        return self._state.by_id.get(model_id)
+
+    def is_free(self, model_id, default=True):
+        """بررسی رایگان بودن مدل؛ برای مدل‌های ناشناخته مقدار default برگردانده می‌شود."""
+        record = self._state.by_id.get(model_id)
+        return record.is_free if record else default
+
+    def name(self, model_id):
+        """نام مدل یا خود شناسه اگر مدل یافت نشود."""
+        record = self._state.by_id.get(model_id)
+        return record.name if record else model_id
+
+    def context_length(self, model_id):
+        """طول زمینه مدل یا None."""
+        record = self._state.by_id.get(model_id)
+        return record.context_length if record else None
+
+    def models(self, only_free=False, only_top=False):
+        """
+        دریافت نمای مرتب مدل‌ها.
+
+        Returns:
+            tuple: دیکشنری‌های مدل‌ها (نباید تغییر داده شوند)
+        """
+        state = self._state
+        if only_free and only_top:
+            return tuple(model for model in state.top_models if model["is_free"])
+        if only_free:
+            return state.free_models
+        if only_top:
+            return state.top_models
+        return state.all_models
+
+    def free_model_ids(self):
+        """شناسه‌های مدل‌های رایگان به ترتیب شناسه."""
+        return self._state.free_ids
+
+    def next_free_model(self, current_model_id):
+        """
+        مدل رایگان بعدی پس از مدل فعلی (به صورت چرخشی).
+        اگر مدل فعلی یافت نشود، اولین مدل رایگان برگردانده می‌شود.
+        """
+        state = self._state
+        if not state.free_ids:
+            return None
+
+        index = state.free_index.get(current_model_id)
+        if index is None:
+            return state.free_ids[0]
+        return state.free_ids[(index + 1) % len(state.free_ids)]
@@ -0,0 +1,151 @@
+import logging
+
+import httpx
+
+import config
+from sse_decoder import DONE, ERROR, SSEDecoder
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models"
+
+# مهلت اتصال و خواندن هر بخش از پاسخ (مشابه timeout=30 در requests)
+STREAM_TIMEOUT = httpx.Timeout(30.0)
+
+
+class OpenRouterAPIError(Exception):
+    """پاسخ ناموفق API اوپن‌روتر."""
+
+    def __init__(self, status_code, text, retry_after=None):
+        super().__init__(f"خطای API: {status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+        # مدت انتظار پیشنهادی سرور (سرآیند Retry-After) به ثانیه
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """آیا خطا موقتی است (محدودیت نرخ یا خطای سمت سرور) و ارزش تلاش مجدد دارد."""
+        return isinstance(self.status_code, int) and (self.status_code == 429 or self.status_code >= 500)
+
+
+def _retry_after(response):
+    """خواندن سرآیند Retry-After به ثانیه، در صورت وجود و عددی بودن."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def openrouter_headers():
+    """سرآیندهای مشترک درخواست‌های اوپن‌روتر."""
+    return {
+        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": config.SITE_URL,
+        "X-Title": config.SITE_NAME,
+    }
+
+
+def _raise_for_error(event):
+    """تبدیل رویداد خطای میانه جریان (با وضعیت HTTP 200) به OpenRouterAPIError."""
+    if event.kind != ERROR:
+        return
+    error = event.value if isinstance(event.value, dict) else {"message": event.value}
+    raise OpenRouterAPIError(error.get("code", "stream"), error.get("message", str(event.value)))
+
+
+async def stream_chat_events(client, model_id, messages, on_chunk=None):
+    """
+    دریافت جریانی پاسخ مدل و بازگرداندن رویدادهای آن به ترتیب دریافت.
+
+    این تابع روی حلقه رویداد ربات اجرا می‌شود و هیچ جریان (thread) جداگانه‌ای نمی‌سازد.
+    لغو وظیفه مصرف‌کننده، اتصال را بلافاصله می‌بندد. بدنه پاسخ به صورت بایت‌های خام
+    به SSEDecoder داده می‌شود.
+
+    Args:
+        client: نمونه httpx.AsyncClient
+        model_id: شناسه مدل
+        messages: لیست پیام‌های زمینه گفت‌وگو
+        on_chunk: تابعی که با دریافت هر بخش خام پاسخ فراخوانی می‌شود (حتی بخش‌هایی که رویداد
+            متنی ندارند، مانند استدلال مدل یا توضیحات keep-alive)
+
+    Yields:
+        StreamEvent: رویدادهای DELTA (بخش متن پاسخ) و USAGE (مصرف توکن‌ها)
+
+    Raises:
+        OpenRouterAPIError: اگر وضعیت پاسخ موفق نباشد یا خطایی درون جریان گزارش شود
+        httpx.TimeoutException: در صورت اتمام مهلت اتصال یا خواندن
+    """
+    payload = {
+        "model": model_id,
+        "messages": messages,
+        "stream": True,
+        # درخواست بخش usage در انتهای جریان
+        "usage": {"include": True}
+    }
+
+    async with client.stream("POST", OPENROUTER_CHAT_URL, headers=openrouter_headers(), json=payload,
+                             timeout=STREAM_TIMEOUT) as response:
+        # بررسی وضعیت پاسخ
+        if response.status_code >= 400:
+            body = await response.aread()
+            raise OpenRouterAPIError(response.status_code, body.decode("utf-8", errors="replace"))
+
+        decoder = SSEDecoder()
+        async for chunk in response.aiter_bytes():
+            if on_chunk is not None:
+                on_chunk()
+            for event in decoder.feed(chunk):
+                if event.kind == DONE:
+                    return
+                _raise_for_error(event)
+                yield event
+
+        for event in decoder.close():
+            if event.kind == DONE:
+                return
+            _raise_for_error(event)
+            yield event
+
+
+async def complete_chat(client, model_id, messages, timeout=60):
+    """
+    دریافت پاسخ کامل مدل بدون انتقال جریانی.
+
+    Args:
+        client: نمونه httpx.AsyncClient
+        model_id: شناسه مدل
+        messages: لیست پیام‌ها
+        timeout: مهلت درخواست به ثانیه
+
+    Returns:
+        str: متن پاسخ
+
+    Raises:
+        OpenRouterAPIError: اگر وضعیت پاسخ موفق نباشد یا پاسخ متنی نداشته باشد
+        httpx.HTTPError: در صورت خطای شبکه یا اتمام مهلت
+    """
+    payload = {
+        "model": model_id,
+        "messages": messages,
+        "stream": False
+    }
+
+    response = await client.post(OPENROUTER_CHAT_URL, headers=openrouter_headers(), json=payload, timeout=timeout)
+    if response.status_code != 200:
+        raise OpenRouterAPIError(response.status_code, response.text, retry_after=_retry_after(response))
+
+    data = response.json()
+    if "error" in data:
+        error = data["error"] if isinstance(data["error"], dict) else {"message": data["error"]}
+        raise OpenRouterAPIError(error.get("code", "response"), error.get("message", str(data["error"])))
+    try:
+        content = data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        content = None
+    if not content:
+        raise OpenRouterAPIError("response", "فرمت پاسخ غیرمنتظره یا پاسخ خالی از OpenRouter API")
+    return content
@@ -1,11 +1,7 @@
-import requests
-import html
+import httpx
 import os
-import queue
 import re
-import threading
 import time
-import json
 import asyncio
 import logging
 from datetime import datetime
@@ -18,6 +14,23 @@ from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQu
 
 import config
 from db_handler import DBHandler
+from async_db import AsyncDBHandler
+from model_catalog import ModelCatalog
+from history_cache import DialogHistoryCache
+from markdown_renderer import StreamingMarkdownRenderer
+from sse_decoder import USAGE
+from openrouter_stream import (
+    OPENROUTER_CHAT_URL, OPENROUTER_MODELS_URL, OpenRouterAPIError, openrouter_headers, stream_chat_events
+)
+from http_client import SharedHTTPClient
+from generation_scheduler import GenerationScheduler
+from edit_cadence import EditCadence
+from stream_control import CANCELED, IDLE, TIMEOUT, StreamHandle, StreamMetrics
+from telegram_rate_limiter import TelegramRateLimiter
+from update_dispatcher import UpdateDispatcher
+from stream_registry import StreamRegistry
+from response_cache import ResponseCache
+from translation_job import TranslationJob
 
 # تنظیمات لاگ‌گیری
 logging.basicConfig(
@@ -29,53 +42,30 @@ logger = logging.getLogger(__name__)
 application = None
 
 
-def convert_markdown_to_html(markdown_text):
-    """تبدیل نشانه‌گذاری پایه Markdown به HTML برای تلگرام."""
-    # جایگزینی کاراکترهای ویژه HTML
-    text = html.escape(markdown_text)
-
-    # جایگزینی بلوک‌های کد
-    text = re.sub(r'```([^`]+)```', r'<pre>\1</pre>', text)
-
-    # جایگزینی کد درون‌خطی
-    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
-
-    # جایگزینی متن پررنگ
-    text = re.sub(r'\*\*([^*]+)\*\*', r'<b>\1</b>', text)
-
-    # جایگزینی متن کج (ایتالیک)
-    text = re.sub(r'\*([^*]+)\*', r'<i>\1</i>', text)
-
-    return text
-
-
-def fetch_and_update_models(context):
+async def fetch_and_update_models(context):
     """فهرست مدل‌ها را از API دریافت کرده و پایگاه داده را به‌روزرسانی می‌کند."""
-    url = "https://openrouter.ai/api/v1/models"
-    headers = {
-        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": config.SITE_URL,
-        "X-Title": config.SITE_NAME,
-    }
-
     try:
-        # از requests به جای aiohttp استفاده می‌کنیم.
-        response = requests.get(url, headers=headers, timeout=10)
+        # استفاده از کلاینت HTTP مشترک
+        client = context.bot_data["http_client"].client
+        response = await client.get(OPENROUTER_MODELS_URL, headers=openrouter_headers(), timeout=10)
 
         if response.status_code == 200:
             data = response.json()
 
-# دریافت دسترسی به پایگاه داده
-            db = context.bot_data.get("db")
+            # دریافت دسترسی به پایگاه داده
+            db = context.bot_data.get("async_db")
             if db:
-                # ذخیره هر مدل
-                saved_count = 0
-                for model in data.get("data", []):
-                    if db.save_model(model):
-                        saved_count += 1
-
-                logger.info(f"{saved_count} مدل از {len(data.get('data', []))} به‌روزرسانی شد")
+                # ذخیره همه مدل‌ها در یک تراکنش
+                diff = await db.save_models(data.get("data", []))
+                if diff is None:
+                    return False
+
+                logger.info(
+                    f"{len(data.get('data', []))} مدل به‌روزرسانی شد: "
+                    f"{len(diff['added'])} جدید، {len(diff['changed'])} تغییر یافته، "
+                    f"{len(diff['removed'])} حذف‌شده از API، "
+                    f"{len(diff['stale'])} ترجمه کهنه، {diff['reused']} ترجمه از حافظه ترجمه"
+                )
                 return True
             else:
                 logger.error("عدم دسترسی به پایگاه داده برای ذخیره مدل‌ها")
@@ -87,7 +77,7 @@ def fetch_and_update_models(context):
     return False
 
 
-def select_translation_model(db):
+def select_translation_model(catalog):
     """
     انتخاب مدل برای ترجمه بر اساس معیارهای مشخص:
     1. مدل باید رایگان باشد
@@ -95,14 +85,14 @@ def select_translation_model(db):
     3. در صورت نبود Gemini، هر مدل رایگان دیگری انتخاب می‌شود
 
     Args:
-        db: شیء پایگاه داده برای دسترسی به مدل‌ها
+        catalog: کاتالوگ مدل‌ها (ModelCatalog)
 
     Returns:
         str: شناسه مدل برای ترجمه یا None، اگر مدل مناسبی یافت نشود
     """
     try:
         # دریافت تمام مدل‌های رایگان
-        free_models = db.get_models(only_free=True)
+        free_models = catalog.models(only_free=True)
 
         if not free_models:
             logger.error("هیچ مدل رایگانی برای ترجمه یافت نشد")
@@ -152,15 +142,14 @@ async def translate_model_description(update: Update, context: ContextTypes.DEFA
     model_id = args[0]
 
     # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if not db:
         await update.message.reply_text("⚠️ خطا در دسترسی به پایگاه داده.")
         return
 
     # بررسی وجود مدل
-    cursor = db.conn.cursor()
-    cursor.execute("SELECT id, description FROM models WHERE id = ?", (model_id,))
-    model = cursor.fetchone()
+    models = await db.get_models_for_translation(model_id)
+    model = models[0] if models else None
 
     if not model:
         await update.message.reply_text(f"⚠️ مدل با شناسه '{model_id}' در پایگاه داده یافت نشد.")
@@ -176,7 +165,7 @@ async def translate_model_description(update: Update, context: ContextTypes.DEFA
     message = await update.message.reply_text(f"🔄 شروع ترجمه توضیحات مدل '{model_id}'...")
 
     # انتخاب مدل برای ترجمه
-    translation_model = select_translation_model(db)
+    translation_model = select_translation_model(context.bot_data["model_catalog"])
 
     if not translation_model:
         await message.edit_text("⚠️ نتوانستیم مدل مناسبی برای ترجمه پیدا کنیم.")
@@ -194,6 +183,7 @@ async def translate_model_description(update: Update, context: ContextTypes.DEFA
 
         # دریافت ترجمه
         translation = await generate_ai_response(
+            context.bot_data["http_client"].client,
             original_prompt,
             translation_model,
             stream=False
@@ -201,7 +191,7 @@ async def translate_model_description(update: Update, context: ContextTypes.DEFA
 
         # ذخیره ترجمه در پایگاه داده
         if translation:
-            db.set_model_description_ru(model_id, translation)
+            await db.set_model_description_ru(model_id, translation)
             await message.edit_text(f"✅ ترجمه توضیحات مدل '{model_id}' تکمیل و ذخیره شد.")
         else:
             await message.edit_text(f"⚠️ نتوانستیم ترجمه‌ای برای مدل '{model_id}' دریافت کنیم.")
@@ -211,7 +201,7 @@ async def translate_model_description(update: Update, context: ContextTypes.DEFA
         await message.edit_text(f"⚠️ خطا در ترجمه توضیحات مدل: {str(e)}")
 
 
-async def generate_ai_response(prompt, model_id, stream=True):
+async def generate_ai_response(client, prompt, model_id, stream=True):
     """
     تولید پاسخ از مدل هوش مصنوعی از طریق API OpenRouter.
 
@@ -223,14 +213,6 @@ async def generate_ai_response(prompt, model_id, stream=True):
     Returns:
         پاسخ مدل یا None در صورت خطا
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": config.SITE_URL,
-        "X-Title": config.SITE_NAME,
-    }
-
     payload = {
         "model": model_id,
         "messages": [{"role": "user", "content": prompt}],
@@ -238,7 +220,7 @@ async def generate_ai_response(prompt, model_id, stream=True):
     }
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
+        response = await client.post(OPENROUTER_CHAT_URL, headers=openrouter_headers(), json=payload, timeout=60)
 
         if response.status_code != 200:
             logger.error(f"خطای OpenRouter API: {response.status_code} - {response.text}")
@@ -276,124 +258,109 @@ async def translate_descriptions(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if not db:
         await update.message.reply_text("خطا در دسترسی به پایگاه داده.")
         return
 
+    # فقط یک کار ترجمه در هر زمان اجرا می‌شود
+    job = context.bot_data.get("translation_job")
+    if job and job.running:
+        await update.message.reply_text(format_translation_progress(job.snapshot()))
+        return
+
     # بررسی آرگومان‌های دستور
     model_id = None
     if context.args:
         model_id = context.args[0]
 
-    # ارسال پیام درباره شروع به‌روزرسانی
-    message = await update.message.reply_text("شروع ترجمه توضیحات مدل‌ها...")
-
     # دریافت لیست مدل‌ها برای ترجمه
-    cursor = db.conn.cursor()
-
-    if model_id:
-        # ترجمه مدل خاص
-        cursor.execute(
-            "SELECT id, description FROM models WHERE id = ?",
-            (model_id,)
-        )
-    else:
-        # جستجوی تمام مدل‌ها با rus_description خالی
-        cursor.execute(
-            "SELECT id, description FROM models WHERE rus_description IS NULL OR rus_description = ''"
-        )
-
-    models_to_translate = cursor.fetchall()
+    # (مدل خاص یا تمام مدل‌ها با rus_description خالی)
+    models_to_translate = await db.get_models_for_translation(model_id)
 
     if not models_to_translate:
-        await message.edit_text("هیچ مدلی برای ترجمه وجود ندارد.")
+        await update.message.reply_text("هیچ مدلی برای ترجمه وجود ندارد.")
         return
 
-    # شمارنده‌ها برای آمار
-    total = len(models_to_translate)
-    success = 0
-    failed = 0
-
     # دریافت مدل اولیه برای ترجمه
-    current_tr_model = select_translation_model(db)
+    current_tr_model = select_translation_model(context.bot_data["model_catalog"])
 
     if not current_tr_model:
-        await message.edit_text("⚠️ نتوانستیم مدل مناسبی برای ترجمه پیدا کنیم.")
+        await update.message.reply_text("⚠️ نتوانستیم مدل مناسبی برای ترجمه پیدا کنیم.")
         return
 
-    # به‌روزرسانی وضعیت
-    await message.edit_text(
-        f"شروع ترجمه {total} توضیحات مدل.\n"
+    total = len(models_to_translate)
+    message = await update.message.reply_text(
+        f"شروع ترجمه {total} توضیحات مدل در پس‌زمینه.\n"
         f"مدل فعلی برای ترجمه: {current_tr_model}"
     )
 
-    # ترجمه هر توضیح
-    for i, model_data in enumerate(models_to_translate):
-        current_model_id = model_data[0]
-        description = model_data[1]
-
-        if not description:
-            logger.warning(f"مدل {current_model_id} فاقد توضیحات است")
-            failed += 1
-            continue
+    # ثبت کار در پایگاه داده تا پس از راه‌اندازی مجدد ادامه یابد
+    job_id = await db.create_translation_job([model[0] for model in models_to_translate], message.chat_id)
+    if job_id is None:
+        await message.edit_text("⚠️ خطا در ثبت کار ترجمه در پایگاه داده.")
+        return
 
-        # تشکیل درخواست ترجمه
-        original_prompt = f"""توضیحات زیر مدل هوش مصنوعی را از انگلیسی به پارسی ترجمه کنید.
-فرمت‌بندی و اصطلاحات فنی را حفظ کنید، اما متن را برای کاربران پارسی‌زبان قابل فهم کنید:
+    # اجرای کار در پس‌زمینه؛ این دستور و سایر دستورات منتظر پایان ترجمه نمی‌مانند
+    start_translation_job(context.application, job_id, total, current_tr_model, message.chat_id, message.message_id)
 
-{description}"""
 
-        try:
-            # تلاش برای دریافت ترجمه
-            translated = await generate_ai_response(
-                original_prompt,
-                current_tr_model,
-                stream=False
-            )
+def format_translation_progress(stats):
+    """متن گزارش پیشرفت کار ترجمه."""
+    header = "ترجمه مدل‌ها" if stats["running"] else "ترجمه تکمیل شد!"
+    return (
+        f"{header}: {stats['done'] + stats['failed']}/{stats['total']}\n"
+        f"✅ موفق: {stats['done']}\n"
+        f"❌ خطاها: {stats['failed']}\n"
+        f"🔁 تلاش‌های مجدد: {stats['retries']}، تعویض مدل: {stats['rotations']}\n"
+        f"📦 درخواست‌ها: {stats['requests']} (دسته‌ها: {stats['batches']}، ترجمه جداگانه پس از دسته: {stats['fallbacks']})\n"
+        f"مدل فعلی برای ترجمه: {stats['model']}"
+    )
 
-            if translated:
-                logger.info(f"ترجمه برای مدل {current_model_id} دریافت شد: {translated[:50]}...")
-                # به‌روزرسانی توضیحات در پایگاه داده
-                if db.set_model_description_ru(current_model_id, translated):
-                    success += 1
-                    logger.info(f"ترجمه برای مدل {current_model_id} با موفقیت ذخیره شد")
-                else:
-                    failed += 1
-                    logger.error(f"نتوانستیم ترجمه را برای مدل {current_model_id} ذخیره کنیم")
-            else:
-                failed += 1
-                logger.error(f"نتوانستیم ترجمه‌ای برای مدل {current_model_id} دریافت کنیم")
 
-                # تلاش برای دریافت مدل بعدی در صورت خطا
-                next_tr_model = get_next_free_model(db, current_tr_model)
-                if next_tr_model and next_tr_model != current_tr_model:
-                    current_tr_model = next_tr_model
-                    logger.info(f"مدل برای ترجمه تغییر کرد به: {current_tr_model}")
+def start_translation_job(application, job_id, total, model, chat_id=None, message_id=None):
+    """
+    راه‌اندازی کار ترجمه در پس‌زمینه و گزارش پیشرفت آن با ویرایش یک پیام.
 
-        except Exception as e:
-            logger.error(f"خطا در ترجمه مدل {current_model_id}: {e}")
-            failed += 1
-
-        # به‌روزرسانی وضعیت هر 3 مدل یا در مدل آخر
-        if (success + failed) % 3 == 0 or (success + failed) == total:
-            await message.edit_text(
-                f"ترجمه مدل‌ها: {success + failed}/{total}\n"
-                f"✅ موفق: {success}\n"
-                f"❌ خطاها: {failed}\n"
-                f"مدل فعلی برای ترجمه: {current_tr_model}"
-            )
+    Args:
+        application: برنامه تلگرام
+        job_id: شناسه کار ترجمه در پایگاه داده
+        total: تعداد کل مدل‌های کار
+        model: مدل اولیه برای ترجمه
+        chat_id: چت گزارش پیشرفت (اختیاری)
+        message_id: پیامی که با پیشرفت کار ویرایش می‌شود
+    """
+    catalog = application.bot_data["model_catalog"]
 
-        # مکث برای جلوگیری از بارگذاری بیش از حد API
-        await asyncio.sleep(2)
+    async def report(stats):
+        if chat_id is None or message_id is None:
+            return
+        await application.bot_data["telegram_limiter"].call(
+            chat_id, application.bot.edit_message_text, final=not stats["running"],
+            chat_id=chat_id,
+            message_id=message_id,
+            text=format_translation_progress(stats)
+        )
 
-    # گزارش نهایی
-    await message.edit_text(
-        f"ترجمه تکمیل شد!\n"
-        f"تعداد کل مدل‌ها: {total}\n"
-        f"✅ با موفقیت ترجمه شده: {success}\n"
-        f"❌ خطاها: {failed}"
+    job = TranslationJob(
+        application.bot_data["async_db"],
+        application.bot_data["http_client"].client,
+        job_id,
+        total,
+        model,
+        next_model=lambda current: get_next_free_model(catalog, current),
+        concurrency=config.TRANSLATION_CONCURRENCY,
+        max_retries=config.TRANSLATION_MAX_RETRIES,
+        base_delay=config.TRANSLATION_BACKOFF_BASE,
+        max_delay=config.TRANSLATION_BACKOFF_MAX,
+        on_progress=report,
+        batch_size=config.TRANSLATION_BATCH_SIZE,
+        context_length=catalog.context_length,
+        estimate_tokens=estimate_tokens
     )
+    application.bot_data["translation_job"] = job
+    application.create_task(job.run())
+    return job
 
 
 async def translate_all_models(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -411,36 +378,19 @@ async def translate_all_models(update: Update, context: ContextTypes.DEFAULT_TYP
     await translate_descriptions(update, context)
 
 
-def get_next_free_model(db, current_model_id):
+def get_next_free_model(catalog, current_model_id):
     """
     دریافت مدل رایگان بعدی پس از مدل فعلی.
     اگر مدل فعلی آخرین باشد یا یافت نشود، اولین مدل رایگان موجود را برمی‌گرداند.
     """
     try:
-        cursor = db.conn.cursor()
-
-        # دریافت تمام مدل‌های رایگان
-        cursor.execute("""
-        SELECT id FROM models 
-        WHERE (prompt_price = '0' AND completion_price = '0') 
-           OR id LIKE '%:free' 
-        ORDER BY id
-        """)
-
-        free_models = [row[0] for row in cursor.fetchall()]
+        next_model = catalog.next_free_model(current_model_id)
 
-        if not free_models:
+        if not next_model:
             logger.error("هیچ مدل رایگانی در پایگاه داده موجود نیست")
             return None
 
-        # اگر مدل فعلی در لیست باشد، مدل بعدی را پیدا می‌کنیم
-        if current_model_id in free_models:
-            current_index = free_models.index(current_model_id)
-            next_index = (current_index + 1) % len(free_models)
-            return free_models[next_index]
-
-        # اگر مدل فعلی یافت نشد، اولین مدل را برمی‌گردانیم
-        return free_models[0]
+        return next_model
 
     except Exception as e:
         logger.error(f"خطا در دریافت مدل رایگان بعدی: {e}")
@@ -448,18 +398,14 @@ def get_next_free_model(db, current_model_id):
         return "anthropic/claude-3-haiku:free"
 
 
-def stream_ai_response(model_id, user_message, update_queue, chat_id, message_id, cancel_event, context):
-    """
-    تابع برای پردازش جریانی پاسخ از هوش مصنوعی.
+async def stream_ai_response(client, model_id, user_message, update_queue, chat_id, message_id, cancel_event, context):
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {config.OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": config.SITE_URL,
-        "X-Title": config.SITE_NAME,
-    }
+    پردازش جریانی پاسخ از هوش مصنوعی روی حلقه رویداد ربات.
 
+    بخش‌های پاسخ از stream_chat_events دریافت شده و در فواصل تعیین‌شده توسط EditCadence
+    به صف به‌روزرسانی پیام‌ها فرستاده می‌شوند. لغو توسط کاربر، بیکاری جریان و مهلت کلی پاسخ
+    بدون نظرسنجی دوره‌ای تشخیص داده می‌شوند و اتصال بلافاصله بسته می‌شود.
+    """
     # استفاده از زمینه گفت‌وگو، در صورت ارائه
     messages = context.get("messages", [{"role": "user", "content": user_message}])
 
@@ -467,485 +413,435 @@ def stream_ai_response(model_id, user_message, update_queue, chat_id, message_id
     if not messages or messages[-1]["role"] != "user" or messages[-1]["content"] != user_message:
         messages.append({"role": "user", "content": user_message})
 
-    # تشکیل payload
-    payload = {
-        "model": model_id,
-        "messages": messages,
-        "stream": True
-    }
-
-    # اندازه‌گیری زمان شروع درخواست
-    start_time = time.time()
-    # حداکثر زمان انتظار برای پاسخ (5 دقیقه)
-    max_wait_time = 300
-
-    # مقداردهی اولیه متغیرها برای ذخیره نتیجه
-    full_response = ""
-    last_update_time = time.time()
+    # رندر افزایشی پاسخ: فقط بخش تازه متن در هر به‌روزرسانی پردازش می‌شود
+    renderer = StreamingMarkdownRenderer()
 
     # برای ردیابی تغییرات در پاسخ
     last_response_txt = ""
 
-    # تابع برای بررسی لغو و ارسال به‌روزرسانی
-    def handle_cancellation():
-        if cancel_event.is_set():
-            logger.info(f"تولید برای chat_id {chat_id} توسط کاربر متوقف شد")
-            update_queue.put({
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "text": convert_markdown_to_html(full_response) + "\n\n[تولید توسط کاربر متوقف شد]",
-                "is_final": True,
-                "was_canceled": True,
-                "dialog_id": context.get("current_dialog_id", None),
-                "is_reload": context.get("is_reload", False),
-                "user_id": context.get("user_id"),
-                "model_name": context.get("model_name"),
-                "model_id": context.get("model_id"),
-                "user_ask": context.get("user_ask"),
-                "dialog_number": context.get("dialog_number")
-            })
-            return True
-        return False
-
-    # تابع برای بررسی مهلت زمانی
-    def check_timeout():
-        current_time = time.time()
-        if current_time - start_time > max_wait_time:
-            logger.warning(f"مهلت پاسخ مدل ({max_wait_time} ثانیه) برای chat_id {chat_id} превыش کرد")
-            update_queue.put({
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "text": convert_markdown_to_html(
-                    full_response) + "\n\n[تولید به دلیل اتمام مهلت زمانی (5 دقیقه) متوقف شد]",
-                "is_final": True,
-                "was_canceled": True,
-                "dialog_id": context.get("current_dialog_id", None),
-                "is_reload": context.get("is_reload", False),
-                "user_id": context.get("user_id"),
-                "model_name": context.get("model_name"),
-                "model_id": context.get("model_id"),
-                "user_ask": context.get("user_ask"),
-                "dialog_number": context.get("dialog_number")
-            })
-            return True
-        return False
-
-    try:
-        # بررسی لغو قبل از شروع درخواست
-        if handle_cancellation():
-            return
-
-        # تنظیم مهلت زمانی برای requests
-        session = requests.Session()
-        response = session.post(url, headers=headers, json=payload, stream=True, timeout=30)
-
-        # بررسی وضعیت پاسخ
-        if not response.ok:
-            error_msg = f"خطای API: {response.status_code} - {response.text}"
-            logger.error(error_msg)
-            update_queue.put({
-                "chat_id": chat_id,
-                "message_id": message_id,
-                "text": f"خطایی در درخواست به API رخ داد: {error_msg}",
-                "is_final": True,
-                "error": True,
-                "dialog_id": context.get("current_dialog_id", None),
-                "is_reload": context.get("is_reload", False)
-            })
-            return
-
-        # برای بررسی پاسخ خط به خط
-        line_iter = response.iter_lines()
-
-        # بررسی لغو هر 0.1 ثانیه
-        while not handle_cancellation() and not check_timeout():
-            try:
-                # استفاده از poll با مهلت زمانی برای بررسی مکرر لغو
-                line_available = False
-                line = None
-
-                # تلاش برای دریافت خط بعدی با مهلت زمانی
-                try:
-                    line = next(line_iter)
-                    line_available = True
-                except StopIteration:
-                    # پایان تکرارگر (پایان پاسخ)
-                    break
-
-                # اگر خطی در دسترس باشد، آن را پردازش می‌کنیم
-                if line_available and line:
-                    # رمزگشایی خط
-                    line_text = line.decode('utf-8')
-
-                    # برای اشکال‌زدایی
-                    logger.debug(f"خط SSE: {line_text}")
-
-                    # پردازش خطوط SSE
-                    if line_text.startswith('data: '):
-                        data = line_text[6:]
-                        if data == '[DONE]':
-                            break
-
-                        try:
-                            data_obj = json.loads(data)
-
-                            # بررسی وجود انتخاب در پاسخ
-                            if "choices" in data_obj and len(data_obj["choices"]) > 0:
-                                choice = data_obj["choices"][0]
-
-                                # بررسی وجود محتوا در انتخاب
-                                content_updated = False
-                                if "delta" in choice and "content" in choice["delta"] and choice["delta"][
-                                    "content"] is not None:
-                                    content_chunk = choice["delta"]["content"]
-                                    full_response += content_chunk
-                                    content_updated = True
-
-                                # به‌روزرسانی پیام فقط در صورت وجود محتوای جدید
-                                if content_updated:
-                                    # به‌روزرسانی پیام با فاصله زمانی مشخص
-                                    current_time = time.time()
-                                    if current_time - last_update_time > config.STREAM_UPDATE_INTERVAL:
-                                        current_response = convert_markdown_to_html(full_response)
-
-                                        # ارسال به‌روزرسانی فقط اگر متن تغییر کرده باشد
-                                        if current_response != last_response_txt:
-                                            update_queue.put({
-                                                "chat_id": chat_id,
-                                                "message_id": message_id,
-                                                "text": current_response,
-                                                "is_final": False
-                                            })
-                                            last_response_txt = current_response
-                                            last_update_time = current_time
-
-                        except json.JSONDecodeError as e:
-                            logger.error(f"خطای رمزگشایی JSON: {e} - {data}")
-                else:
-                    # اگر خطی وجود ندارد، مکث کوتاهی انجام می‌دهیم و لغو را بررسی می‌کنیم
-                    time.sleep(0.1)
-
-            except Exception as e:
-                logger.error(f"خطا در پردازش خط پاسخ: {e}")
-                # ادامه چرخه، شاید خط بعدی به درستی خوانده شود
-
-        # بستن اتصال
-        response.close()
-
-        # بررسی لغو یا مهلت زمانی قبل از ارسال پاسخ نهایی
-        if handle_cancellation() or check_timeout():
-            return
-
-    except requests.exceptions.Timeout:
-        logger.error(f"مهلت زمانی در درخواست به API برای chat_id {chat_id}")
-        update_queue.put({
+    def final_update(text, **flags):
+        """ساخت به‌روزرسانی نهایی پیام."""
+        update_data = {
             "chat_id": chat_id,
             "message_id": message_id,
-            "text": "سرور پاسخ نمی‌دهد. لطفاً بعداً امتحان کنید.",
+            "text": text,
             "is_final": True,
-            "error": True,
             "dialog_id": context.get("current_dialog_id", None),
             "is_reload": context.get("is_reload", False)
-        })
-        return
-    except Exception as e:
-        logger.error(f"خطا در دریافت پاسخ جریانی برای chat_id {chat_id}: {e}")
-        update_queue.put({
+        }
+        update_data.update(flags)
+        return update_data
+
+    def answer_update(text, **flags):
+        """به‌روزرسانی نهایی همراه با اطلاعات لازم برای ثبت پاسخ بارگذاری مجدد."""
+        update_data = final_update(text, **flags)
+        for key in ("user_id", "model_name", "model_id", "user_ask", "dialog_number"):
+            update_data[key] = context.get(key)
+        return update_data
+
+    cadence = context.get("edit_cadence")
+
+    # ورودی جریان در فهرست جریان‌ها برای شمارنده‌های پاسخ
+    registry = context.get("stream_registry")
+    entry = context.get("stream_entry")
+
+    # حافظه پنهان پاسخ‌ها (فقط اگر فعال باشد و درخواست بارگذاری مجدد نباشد)
+    cache = context.get("response_cache")
+    cache_key = context.get("cache_key")
+    flight = None
+
+    def intermediate_update(text):
+        """ساخت به‌روزرسانی میانی پیام."""
+        return {
             "chat_id": chat_id,
             "message_id": message_id,
-            "text": f"خطایی رخ داد: {str(e)}",
-            "is_final": True,
-            "error": True,
-            "dialog_id": context.get("current_dialog_id", None),
-            "is_reload": context.get("is_reload", False)
-        })
+            "text": text,
+            "is_final": False
+        }
+
+    def edit_interval(edits_sent, text_length):
+        """فاصله تا به‌روزرسانی میانی بعدی."""
+        if cadence is None:
+            return config.STREAM_UPDATE_INTERVAL
+        backlog = context.get("update_backlog")
+        return cadence.interval(edits_sent, text_length, backlog() if backlog else update_queue.qsize())
+
+    async def read_stream():
+        """خواندن بخش‌های پاسخ و ارسال به‌روزرسانی‌های میانی."""
+        nonlocal last_response_txt
+        # زمان به‌روزرسانی بعدی پس از رسیدن اولین بخش پاسخ تعیین می‌شود
+        next_update_time = None
+        edits_sent = 0
+        received = 0
+
+        # هر بخش دریافتی (از جمله استدلال مدل و keep-alive) مهلت بیکاری را تمدید می‌کند
+        async for event in stream_chat_events(client, model_id, messages, on_chunk=handle.touch):
+            if event.kind == USAGE:
+                if entry is not None:
+                    registry.record_usage(entry, event.value)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("مصرف توکن برای chat_id %s: %s", chat_id, event.value)
+                continue
+            renderer.feed(event.value)
+            received += len(event.value)
+            if entry is not None:
+                registry.record_delta(entry, event.value)
+
+            # به‌روزرسانی پیام با فاصله تطبیقی (بسته به بار کل ربات و طول پاسخ)
+            current_time = time.monotonic()
+            if next_update_time is None:
+                next_update_time = current_time + edit_interval(edits_sent, received)
+            elif current_time >= next_update_time:
+                current_response = renderer.render()
+
+                # ارسال به‌روزرسانی فقط اگر متن تغییر کرده باشد
+                if current_response != last_response_txt:
+                    await update_queue.put(intermediate_update(current_response))
+                    last_response_txt = current_response
+                    edits_sent += 1
+                    # درخواست‌های یکسان هم‌زمان همین فریم را نمایش می‌دهند
+                    if flight is not None:
+                        flight.publish(current_response)
+                next_update_time = current_time + edit_interval(edits_sent, received)
+
+    if cache_key is not None and not cancel_event.is_set():
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"پاسخ chat_id {chat_id} از حافظه پنهان ارسال شد")
+            await update_queue.put(answer_update(cached))
+            return
+
+        flight, leader = cache.join(cache_key)
+        if leader:
+            # مسئول تولید؛ در صورت خروج بدون پاسخ کامل، run_generation آن را رها می‌کند
+            context["cache_flight"] = flight
+        else:
+            # درخواست یکسانی در حال تولید است: دنبال کردن فریم‌های همان جریان
+            async def show_frame(frame):
+                await update_queue.put(intermediate_update(frame))
+
+            logger.info(f"درخواست chat_id {chat_id} به تولید در حال اجرای یکسان پیوست")
+            text = await cache.follow(flight, cancel_event, show_frame)
+            if text is not None:
+                await update_queue.put(answer_update(text))
+                return
+            # تولید اصلی ناموفق بود یا این درخواست لغو شد: ادامه به صورت مستقل
+            flight = None
+
+    # انتظار برای جایگاه تولید؛ فقط درخواستی که خودش به API درخواست می‌فرستد (مسئول تولید یا
+    # دنبال‌کننده‌ای که تولید اصلی آن ناموفق بود) جایگاه می‌گیرد. اگر درخواست در صف لغو شود،
+    # بدون درخواست به API پیام لغو ثبت می‌شود
+    acquire_slot = context.get("acquire_slot")
+    if acquire_slot is not None and not cancel_event.is_set():
+        await acquire_slot()
+
+    # بررسی لغو قبل از شروع درخواست
+    if not cancel_event.is_set():
+        # ناظر جریان: لغو، بیکاری و مهلت کل پاسخ وظیفه خواندن را از بیرون متوقف می‌کنند؛
+        # پس از گرفتن جایگاه ساخته می‌شود تا انتظار در صف یا دنبال کردن تولید دیگر جزو مهلت‌ها نباشد
+        handle = StreamHandle(cancel_event, idle_timeout=config.STREAM_IDLE_TIMEOUT,
+                              max_duration=config.STREAM_MAX_DURATION, metrics=context.get("stream_metrics"))
+        # انتظار برای پایان پاسخ، لغو توسط کاربر، بیکاری جریان یا اتمام مهلت، هر کدام زودتر رخ دهد
+        outcome, read_task = await handle.run(read_stream())
+    else:
+        outcome, read_task = CANCELED, None
+
+    # بررسی لغو توسط کاربر
+    if outcome == CANCELED or cancel_event.is_set():
+        logger.info(f"تولید برای chat_id {chat_id} توسط کاربر متوقف شد")
+        await update_queue.put(answer_update(
+            renderer.render() + "\n\n[تولید توسط کاربر متوقف شد]",
+            was_canceled=True
+        ))
         return
 
-    # تبدیل متن پاسخ نهایی برای نمایش صحیح
-    formatted_response = convert_markdown_to_html(full_response)
+    # بررسی بیکاری جریان
+    if outcome == IDLE:
+        logger.warning(f"مدل به مدت {config.STREAM_IDLE_TIMEOUT} ثانیه برای chat_id {chat_id} داده‌ای نفرستاد")
+        await update_queue.put(answer_update(
+            renderer.render() + "\n\n[تولید به دلیل عدم دریافت پاسخ از مدل متوقف شد]",
+            was_canceled=True
+        ))
+        return
 
-    # بررسی نهایی لغو و مهلت زمانی
-    if handle_cancellation() or check_timeout():
+    # بررسی مهلت زمانی
+    if outcome == TIMEOUT:
+        logger.warning(f"مهلت پاسخ مدل ({config.STREAM_MAX_DURATION} ثانیه) برای chat_id {chat_id} به پایان رسید")
+        await update_queue.put(answer_update(
+            renderer.render() + f"\n\n[تولید به دلیل اتمام مهلت زمانی ({config.STREAM_MAX_DURATION // 60} دقیقه) متوقف شد]",
+            was_canceled=True
+        ))
         return
 
-    # ارسال به‌روزرسانی نهایی
-    if formatted_response != last_response_txt:
-        update_queue.put({
-            "chat_id": chat_id,
-            "message_id": message_id,
-            "text": formatted_response,
-            "is_final": True,
-            "dialog_id": context.get("current_dialog_id", None),  # انتقال شناسه گفت‌وگو
-            "is_reload": context.get("is_reload", False),
-            "user_id": context.get("user_id"),
-            "model_name": context.get("model_name"),
-            "model_id": context.get("model_id"),
-            "user_ask": context.get("user_ask"),
-            "dialog_number": context.get("dialog_number")
-        })
+    error = read_task.exception()
+    if isinstance(error, OpenRouterAPIError):
+        logger.error(str(error))
+        await update_queue.put(final_update(f"خطایی در درخواست به API رخ داد: {error}", error=True))
+        return
+    if isinstance(error, httpx.TimeoutException):
+        logger.error(f"مهلت زمانی در درخواست به API برای chat_id {chat_id}")
+        await update_queue.put(final_update("سرور پاسخ نمی‌دهد. لطفاً بعداً امتحان کنید.", error=True))
+        return
+    if error is not None:
+        logger.error(f"خطا در دریافت پاسخ جریانی برای chat_id {chat_id}: {error}")
+        await update_queue.put(final_update(f"خطایی رخ داد: {str(error)}", error=True))
+        return
+
+    # ارسال به‌روزرسانی نهایی؛ حتی اگر متن با آخرین به‌روزرسانی میانی یکسان باشد،
+    # چون ثبت پاسخ در پایگاه داده و دکمه بارگذاری مجدد به آن وابسته‌اند
+    response_text = renderer.render()
+    if flight is not None:
+        cache.complete(flight, response_text)
+    await update_queue.put(answer_update(response_text))
+
+
+def update_backlog(bot_data):
+    """تعداد به‌روزرسانی‌های ارسال‌نشده پیام‌ها (صف اصلی و صف کارگرهای توزیع‌کننده)."""
+    dispatcher = bot_data.get("update_dispatcher")
+    if dispatcher is not None:
+        return dispatcher.backlog()
+    update_queue = bot_data.get("update_queue")
+    return update_queue.qsize() if update_queue is not None else 0
 
 
 async def message_updater(context):
     """وظیفه پس‌زمینه برای به‌روزرسانی پیام‌ها با پاسخ‌های هوش مصنوعی"""
-    # برای ذخیره محتوای آخرین پیام هر پیام
-    last_message_content = {}
+    # آخرین فریم هر پیام و وضعیت جریان‌ها در فهرست جریان‌ها نگه داشته می‌شود
+    registry = context.bot_data["stream_registry"]
+
+    # همه فراخوانی‌های تلگرام از محدودکننده نرخ عبور می‌کنند؛ پیام‌های نهایی اولویت دارند
+    limiter = context.bot_data["telegram_limiter"]
+
+    async def apply_update(update_data):
+        """ارسال یک به‌روزرسانی (پس از ادغام فریم‌های میانی) به تلگرام."""
+        chat_id = update_data["chat_id"]
+        message_id = update_data["message_id"]
+        text = update_data["text"]
+        is_final = update_data.get("is_final", False)
+        error = update_data.get("error", False)
+        was_canceled = update_data.get("was_canceled", False)  # پرچم لغو
+        dialog_id = update_data.get("dialog_id", None)
+
+        # اگر محتوا تغییر نکرده باشد، به‌روزرسانی را رد می‌کنیم
+        if not is_final and not registry.is_new_frame(chat_id, message_id, text):
+            return
 
-    while True:
-        try:
-            # بررسی وجود عناصر در صف
-            if not context.bot_data["update_queue"].empty():
-                # دریافت داده‌ها از صف هم‌زمان
-                update_data = context.bot_data["update_queue"].get_nowait()
-
-                chat_id = update_data["chat_id"]
-                message_id = update_data["message_id"]
-                text = update_data["text"]
-                is_final = update_data.get("is_final", False)
-                error = update_data.get("error", False)
-                was_canceled = update_data.get("was_canceled", False)  # پرچم لغو
-                dialog_id = update_data.get("dialog_id", None)
-
-                # ایجاد شناسه یکتا برای پیام
-                msg_identifier = f"{chat_id}:{message_id}"
-
-                # بررسی تغییر متن پیام
-                current_content = {
-                    "text": text,
-                    "is_final": is_final
-                }
+        # ثبت ویرایش برای محاسبه نرخ کل ویرایش‌ها
+        cadence = context.bot_data.get("edit_cadence")
+        if cadence:
+            cadence.record_edit()
+
+        # ایجاد صفحه‌کلیدهای مختلف بسته به وضعیت
+        if is_final:
+            # برای پیام‌های نهایی، دکمه بارگذاری مجدد اضافه می‌کنیم
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔄 بارگذاری مجدد پاسخ",
+                                     callback_data=f"reload_{chat_id}_{message_id}")
+            ]])
 
-                # اگر محتوا تغییر نکرده باشد، به‌روزرسانی را رد می‌کنیم
-                if msg_identifier in last_message_content and not is_final:
-                    prev_content = last_message_content[msg_identifier]
-                    if prev_content["text"] == text:
-                        # آزادسازی وظیفه و رد به‌روزرسانی
-                        context.bot_data["update_queue"].task_done()
-                        continue
+            # پایان جریان: حذف از فهرست جریان‌های فعال
+            registry.finish(chat_id, message_id)
+
+            # اگر این پیام نهایی باشد، پاسخ مدل را در پایگاه داده به‌روزرسانی می‌کنیم
+            if dialog_id and "async_db" in context.bot_data:
+                db = context.bot_data["async_db"]
+
+                # بررسی اینکه آیا این یک بارگذاری مجدد است
+                is_reload = update_data.get("is_reload", False)
+
+                if is_reload:
+                    # اگر بارگذاری مجدد باشد، یک رکورد جدید ایجاد می‌کنیم
+                    user_id = update_data.get("user_id")
+                    dialog_number = update_data.get("dialog_number")
+                    model_name = update_data.get("model_name")
+                    model_id = update_data.get("model_id")
+                    user_ask = update_data.get("user_ask")
+
+                    if user_id and dialog_number and model_name and model_id and user_ask:
+                        # ایجاد رکورد جدید با displayed = 1
+                        new_dialog_id = await db.log_dialog(
+                            id_chat=chat_id,
+                            id_user=user_id,
+                            number_dialog=dialog_number,
+                            model=model_name,
+                            model_id=model_id,
+                            user_ask=user_ask,
+                            model_answer=text,
+                            displayed=1
+                        )
+                        logger.info(f"رکورد جدید برای پاسخ بارگذاری مجدد ایجاد شد: {new_dialog_id}")
+
+                        # به‌روزرسانی dialog_id فعلی در زمینه کاربر
+                        if user_id and hasattr(context, 'dispatcher') and context.dispatcher:
+                            user_data = context.dispatcher.user_data.get(int(user_id), {})
+                            if user_data:
+                                user_data["current_dialog_id"] = new_dialog_id
+                                logger.info(
+                                    f"current_dialog_id برای کاربر {user_id} به {new_dialog_id} به‌روزرسانی شد")
+                    else:
+                        logger.error("داده‌های کافی برای ایجاد رکورد جدید در بارگذاری مجدد وجود ندارد")
+                else:
+                    # اگر پاسخ معمولی باشد، رکورد موجود را به‌روزرسانی می‌کنیم
+                    await db.update_model_answer(dialog_id, text, displayed=1)
+        else:
+            # برای پیام‌های ناتمام، دکمه لغو اضافه می‌کنیم
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("❌ توقف تولید محتوا", callback_data="cancel_stream")
+            ]])
 
-                # ذخیره محتوای جدید
-                last_message_content[msg_identifier] = current_content
+        # اگر متن برای یک پیام تلگرام بیش از حد طولانی باشد
+        if len(text) > 4096:
+            # اگر پیام نهایی باشد، آن را به بخش‌ها تقسیم می‌کنیم
+            if is_final:
+                chunks = [text[i:i + 4096] for i in range(0, len(text), 4096)]
 
-                # ایجاد صفحه‌کلیدهای مختلف بسته به وضعیت
-                if is_final:
-                    # برای پیام‌های نهایی، دکمه بارگذاری مجدد اضافه می‌کنیم
-                    reply_markup = InlineKeyboardMarkup([[
-                        InlineKeyboardButton("🔄 بارگذاری مجدد پاسخ",
-                                             callback_data=f"reload_{chat_id}_{message_id}")
-                    ]])
-
-                    # برای پیام‌های نهایی، ورودی مربوطه در last_message_content را پاک می‌کنیم
-                    if msg_identifier in last_message_content:
-                        del last_message_content[msg_identifier]
-
-                    # اگر این پیام نهایی باشد، پاسخ مدل را در پایگاه داده به‌روزرسانی می‌کنیم
-                    if dialog_id and "db" in context.bot_data:
-                        db = context.bot_data["db"]
-
-                        # بررسی اینکه آیا این یک بارگذاری مجدد است
-                        is_reload = update_data.get("is_reload", False)
-
-                        if is_reload:
-                            # اگر بارگذاری مجدد باشد، یک رکورد جدید ایجاد می‌کنیم
-                            user_id = update_data.get("user_id")
-                            dialog_number = update_data.get("dialog_number")
-                            model_name = update_data.get("model_name")
-                            model_id = update_data.get("model_id")
-                            user_ask = update_data.get("user_ask")
-
-                            if user_id and dialog_number and model_name and model_id and user_ask:
-                                # ایجاد رکورد جدید با displayed = 1
-                                new_dialog_id = db.log_dialog(
-                                    id_chat=chat_id,
-                                    id_user=user_id,
-                                    number_dialog=dialog_number,
-                                    model=model_name,
-                                    model_id=model_id,
-                                    user_ask=user_ask,
-                                    model_answer=text,
-                                    displayed=1
-                                )
-                                logger.info(f"رکورد جدید برای پاسخ بارگذاری مجدد ایجاد شد: {new_dialog_id}")
-
-                                # به‌روزرسانی dialog_id فعلی در زمینه کاربر
-                                if user_id and hasattr(context, 'dispatcher') and context.dispatcher:
-                                    user_data = context.dispatcher.user_data.get(int(user_id), {})
-                                    if user_data:
-                                        user_data["current_dialog_id"] = new_dialog_id
-                                        logger.info(
-                                            f"current_dialog_id برای کاربر {user_id} به {new_dialog_id} به‌روزرسانی شد")
-                            else:
-                                logger.error("داده‌های کافی برای ایجاد رکورد جدید در بارگذاری مجدد وجود ندارد")
-                        else:
-                            # اگر پاسخ معمولی باشد، رکورد موجود را به‌روزرسانی می‌کنیم
-                            db.update_model_answer(dialog_id, text, displayed=1)
-                else:
-                    # برای پیام‌های ناتمام، دکمه لغو اضافه می‌کنیم
-                    reply_markup = InlineKeyboardMarkup([[
-                        InlineKeyboardButton("❌ توقف تولید محتوا", callback_data="cancel_stream")
-                    ]])
-
-                # اگر متن برای یک پیام تلگرام بیش از حد طولانی باشد
-                if len(text) > 4096:
-                    # اگر پیام نهایی باشد، آن را به بخش‌ها تقسیم می‌کنیم
-                    if is_final:
-                        chunks = [text[i:i + 4096] for i in range(0, len(text), 4096)]
-
-                        # حذف پیام میانی
+                # حذف پیام میانی
+                try:
+                    await limiter.call(
+                        chat_id, context.bot.delete_message, final=is_final,
+                        chat_id=chat_id, message_id=message_id)
+                except Exception as e:
+                    logger.error(f"نتوانستیم پیام را حذف کنیم: {e}")
+
+                # ارسال بخش‌ها به عنوان پیام‌های جداگانه
+                for i, chunk in enumerate(chunks):
+                    # اضافه کردن دکمه فقط به آخرین پیام
+                    if i == len(chunks) - 1:
                         try:
-                            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
+                            sent_msg = await limiter.call(
+                                chat_id, context.bot.send_message, final=is_final,
+                                chat_id=chat_id,
+                                text=f"بخش {i + 1}/{len(chunks)}:\n\n{chunk}",
+                                reply_markup=reply_markup,
+                                parse_mode="HTML"  # استفاده از قالب‌بندی HTML
+                            )
                         except Exception as e:
-                            logger.error(f"نتوانستیم پیام را حذف کنیم: {e}")
-
-                        # ارسال بخش‌ها به عنوان پیام‌های جداگانه
-                        for i, chunk in enumerate(chunks):
-                            # اضافه کردن دکمه فقط به آخرین پیام
-                            if i == len(chunks) - 1:
-                                try:
-                                    sent_msg = await context.bot.send_message(
-                                        chat_id=chat_id,
-                                        text=f"بخش {i + 1}/{len(chunks)}:\n\n{chunk}",
-                                        reply_markup=reply_markup,
-                                        parse_mode="HTML"  # استفاده از قالب‌بندی HTML
-                                    )
-                                except Exception as e:
-                                    if "Can't parse entities" in str(e):
-                                        logger.error(f"خطای قالب‌بندی HTML: {e}")
-                                        # پاک کردن متن از تگ‌های HTML
-                                        clean_chunk = re.sub(r'<[^>]*>', '', chunk)
-                                        sent_msg = await context.bot.send_message(
-                                            chat_id=chat_id,
-                                            text=f"بخش {i + 1}/{len(chunks)}:\n\n{clean_chunk}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
-                                            reply_markup=reply_markup
-                                        )
-                                    else:
-                                        logger.error(f"خطا در ارسال پیام: {e}")
-                                        continue
-
-                                # ذخیره شناسه آخرین پیام برای بارگذاری مجدد احتمالی
-                                if str(chat_id) in context.bot_data.get("active_streams", {}):
-                                    del context.bot_data["active_streams"][str(chat_id)]
-
-                                # ذخیره اطلاعات آخرین پیام برای بارگذاری مجدد
-                                if hasattr(context, 'user_data_dict') and int(chat_id) in context.user_data_dict:
-                                    user_data = context.user_data_dict[int(chat_id)]
-                                    if "last_message" in user_data and user_data["last_message"]["text"]:
-                                        user_data["last_message"]["id"] = f"{chat_id}_{sent_msg.message_id}"
+                            if "Can't parse entities" in str(e):
+                                logger.error(f"خطای قالب‌بندی HTML: {e}")
+                                # پاک کردن متن از تگ‌های HTML
+                                clean_chunk = re.sub(r'<[^>]*>', '', chunk)
+                                sent_msg = await limiter.call(
+                                    chat_id, context.bot.send_message, final=is_final,
+                                    chat_id=chat_id,
+                                    text=f"بخش {i + 1}/{len(chunks)}:\n\n{clean_chunk}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
+                                    reply_markup=reply_markup
+                                )
                             else:
-                                try:
-                                    await context.bot.send_message(
-                                        chat_id=chat_id,
-                                        text=f"بخش {i + 1}/{len(chunks)}:\n\n{chunk}",
-                                        parse_mode="HTML"  # استفاده از قالب‌بندی HTML
-                                    )
-                                except Exception as e:
-                                    if "Can't parse entities" in str(e):
-                                        logger.error(f"خطای قالب‌بندی HTML: {e}")
-                                        # پاک کردن متن از تگ‌های HTML
-                                        clean_chunk = re.sub(r'<[^>]*>', '', chunk)
-                                        await context.bot.send_message(
-                                            chat_id=chat_id,
-                                            text=f"بخش {i + 1}/{len(chunks)}:\n\n{clean_chunk}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]"
-                                        )
-                                    else:
-                                        logger.error(f"خطا در ارسال پیام: {e}")
-                                        continue
+                                logger.error(f"خطا در ارسال پیام: {e}")
+                                continue
+
+                        # ذخیره اطلاعات آخرین پیام برای بارگذاری مجدد
+                        if hasattr(context, 'user_data_dict') and int(chat_id) in context.user_data_dict:
+                            user_data = context.user_data_dict[int(chat_id)]
+                            if "last_message" in user_data and user_data["last_message"]["text"]:
+                                user_data["last_message"]["id"] = f"{chat_id}_{sent_msg.message_id}"
                     else:
-                        # برای پیام ناتمام، فقط اولین بخش را نمایش می‌دهیم
-                        text_truncated = text[:4093] + "..."
                         try:
-                            await context.bot.edit_message_text(
-                                text=text_truncated,
+                            await limiter.call(
+                                chat_id, context.bot.send_message, final=is_final,
                                 chat_id=chat_id,
-                                message_id=message_id,
-                                reply_markup=reply_markup,
+                                text=f"بخش {i + 1}/{len(chunks)}:\n\n{chunk}",
                                 parse_mode="HTML"  # استفاده از قالب‌بندی HTML
                             )
                         except Exception as e:
                             if "Can't parse entities" in str(e):
                                 logger.error(f"خطای قالب‌بندی HTML: {e}")
                                 # پاک کردن متن از تگ‌های HTML
-                                clean_text = re.sub(r'<[^>]*>', '', text_truncated)
-                                try:
-                                    await context.bot.edit_message_text(
-                                        text=f"{clean_text}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
-                                        chat_id=chat_id,
-                                        message_id=message_id,
-                                        reply_markup=reply_markup
-                                    )
-                                except Exception as inner_e:
-                                    logger.error(f"نتوانستیم حتی متن پاک‌شده را ارسال کنیم: {inner_e}")
-                            elif "Message is not modified" in str(e):
-                                # این طبیعی است، فقط نادیده می‌گیریم
-                                logger.debug("پیام تغییر نکرده است، به‌روزرسانی را رد می‌کنیم")
+                                clean_chunk = re.sub(r'<[^>]*>', '', chunk)
+                                await limiter.call(
+                                    chat_id, context.bot.send_message, final=is_final,
+                                    chat_id=chat_id,
+                                    text=f"بخش {i + 1}/{len(chunks)}:\n\n{clean_chunk}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]"
+                                )
                             else:
-                                logger.error(f"خطا در به‌روزرسانی پیام: {e}")
-                else:
-                    # به‌روزرسانی پیام
+                                logger.error(f"خطا در ارسال پیام: {e}")
+                                continue
+            else:
+                # برای پیام ناتمام، فقط اولین بخش را نمایش می‌دهیم
+                text_truncated = text[:4093] + "..."
+                try:
+                    await limiter.call(
+                        chat_id, context.bot.edit_message_text, final=is_final,
+                        text=text_truncated,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        reply_markup=reply_markup,
+                        parse_mode="HTML"  # استفاده از قالب‌بندی HTML
+                    )
+                except Exception as e:
+                    if "Can't parse entities" in str(e):
+                        logger.error(f"خطای قالب‌بندی HTML: {e}")
+                        # پاک کردن متن از تگ‌های HTML
+                        clean_text = re.sub(r'<[^>]*>', '', text_truncated)
+                        try:
+                            await limiter.call(
+                                chat_id, context.bot.edit_message_text, final=is_final,
+                                text=f"{clean_text}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
+                                chat_id=chat_id,
+                                message_id=message_id,
+                                reply_markup=reply_markup
+                            )
+                        except Exception as inner_e:
+                            logger.error(f"نتوانستیم حتی متن پاک‌شده را ارسال کنیم: {inner_e}")
+                    elif "Message is not modified" in str(e):
+                        # این طبیعی است، فقط نادیده می‌گیریم
+                        logger.debug("پیام تغییر نکرده است، به‌روزرسانی را رد می‌کنیم")
+                    else:
+                        logger.error(f"خطا در به‌روزرسانی پیام: {e}")
+        else:
+            # به‌روزرسانی پیام
+            try:
+                await limiter.call(
+                    chat_id, context.bot.edit_message_text, final=is_final,
+                    text=text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=reply_markup,
+                    parse_mode="HTML"  # استفاده از قالب‌بندی HTML
+                )
+
+                # اگر پیام نهایی باشد
+                if is_final:
+                    # به‌روزرسانی شناسه آخرین پیام برای بارگذاری مجدد
                     try:
-                        await context.bot.edit_message_text(
-                            text=text,
+                        # دریافت user_id از update_data در صورت وجود
+                        user_id = update_data.get("user_id")
+
+                        # اگر user_id مشخص نشده باشد، تلاش برای یافتن کاربر از طریق chat_id
+                        if not user_id and hasattr(context, 'user_data_dict'):
+                            # در PTB v20، زمینه ممکن است شامل user_data_dict برای دسترسی به داده‌های کاربر باشد
+                            if int(chat_id) in context.user_data_dict:
+                                user_data = context.user_data_dict[int(chat_id)]
+                                if "last_message" in user_data and user_data["last_message"]["text"]:
+                                    user_data["last_message"]["id"] = f"{chat_id}_{message_id}"
+                    except Exception as e:
+                        logger.error(f"خطا در به‌روزرسانی شناسه آخرین پیام: {e}")
+            except Exception as e:
+                if "Can't parse entities" in str(e):
+                    logger.error(f"خطای قالب‌بندی HTML: {e}")
+                    # تلاش برای ارسال پیام بدون قالب‌بندی HTML در صورت خطا
+                    try:
+                        # پاک کردن متن از تگ‌های HTML
+                        clean_text = re.sub(r'<[^>]*>', '', text)
+                        await limiter.call(
+                            chat_id, context.bot.edit_message_text, final=is_final,
+                            text=f"{clean_text}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
                             chat_id=chat_id,
                             message_id=message_id,
-                            reply_markup=reply_markup,
-                            parse_mode="HTML"  # استفاده از قالب‌بندی HTML
+                            reply_markup=reply_markup
                         )
+                    except Exception as inner_e:
+                        logger.error(f"نتوانستیم حتی متن پاک‌شده را ارسال کنیم: {inner_e}")
+                elif "Message is not modified" in str(e):
+                    # این طبیعی است، فقط نادیده می‌گیریم
+                    logger.debug("پیام تغییر نکرده است، به‌روزرسانی را رد می‌کنیم")
+                else:
+                    logger.error(f"خطا در به‌روزرسانی پیام: {e}")
 
-                        # اگر پیام نهایی باشد
-                        if is_final:
-                            # حذف از جریان‌های فعال
-                            if str(chat_id) in context.bot_data.get("active_streams", {}):
-                                del context.bot_data["active_streams"][str(chat_id)]
-
-                            # به‌روزرسانی شناسه آخرین پیام برای بارگذاری مجدد
-                            try:
-                                # دریافت user_id از update_data در صورت وجود
-                                user_id = update_data.get("user_id")
-
-                                # اگر user_id مشخص نشده باشد، تلاش برای یافتن کاربر از طریق chat_id
-                                if not user_id and hasattr(context, 'user_data_dict'):
-                                    # در PTB v20، زمینه ممکن است شامل user_data_dict برای دسترسی به داده‌های کاربر باشد
-                                    if int(chat_id) in context.user_data_dict:
-                                        user_data = context.user_data_dict[int(chat_id)]
-                                        if "last_message" in user_data and user_data["last_message"]["text"]:
-                                            user_data["last_message"]["id"] = f"{chat_id}_{message_id}"
-                            except Exception as e:
-                                logger.error(f"خطا در به‌روزرسانی شناسه آخرین پیام: {e}")
-                    except Exception as e:
-                        if "Can't parse entities" in str(e):
-                            logger.error(f"خطای قالب‌بندی HTML: {e}")
-                            # تلاش برای ارسال پیام بدون قالب‌بندی HTML در صورت خطا
-                            try:
-                                # پاک کردن متن از تگ‌های HTML
-                                clean_text = re.sub(r'<[^>]*>', '', text)
-                                await context.bot.edit_message_text(
-                                    text=f"{clean_text}\n\n[یادداشت: قالب‌بندی به دلیل خطاهای نشانه‌گذاری حذف شد]",
-                                    chat_id=chat_id,
-                                    message_id=message_id,
-                                    reply_markup=reply_markup
-                                )
-
-                                # اگر پیام نهایی باشد، از جریان‌های فعال حذف می‌کنیم
-                                if is_final and str(chat_id) in context.bot_data.get("active_streams", {}):
-                                    del context.bot_data["active_streams"][str(chat_id)]
-                            except Exception as inner_e:
-                                logger.error(f"نتوانستیم حتی متن پاک‌شده را ارسال کنیم: {inner_e}")
-                        elif "Message is not modified" in str(e):
-                            # این طبیعی است، فقط نادیده می‌گیریم
-                            logger.debug("پیام تغییر نکرده است، به‌روزرسانی را رد می‌کنیم")
-                        else:
-                            logger.error(f"خطا در به‌روزرسانی پیام: {e}")
-
-                # علامت‌گذاری وظیفه به عنوان انجام‌شده برای صف هم‌زمان
-                context.bot_data["update_queue"].task_done()
-
-        except queue.Empty:
-            # اگر صف خالی باشد، ادامه می‌دهیم
-            pass
-        except Exception as e:
-            logger.error(f"خطا در پردازشگر پیام‌ها: {e}")
-
-        # مکث کوتاه برای جلوگیری از بار زیاد روی CPU
-        await asyncio.sleep(0.1)
+    # دریافت رویدادمحور از صف، ادغام فریم‌های میانی و ارسال هم‌زمان برای گفت‌وگوهای مختلف
+    dispatcher = UpdateDispatcher(context.bot_data["update_queue"], apply_update, workers=config.UPDATE_WORKERS)
+    context.bot_data["update_dispatcher"] = dispatcher
+    await dispatcher.run()
 
 
 async def process_ai_request(context, chat_id, user_message, is_reload=False):
@@ -974,9 +870,11 @@ async def process_ai_request(context, chat_id, user_message, is_reload=False):
     dialog_number = context.user_data.get("current_dialog", 1)
 
     # آماده‌سازی زمینه گفت‌وگو
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if db:
-        messages, context_usage_percent = prepare_context(db, user_id, dialog_number, model_id, user_message)
+        catalog = context.bot_data["model_catalog"]
+        messages, context_usage_percent = await prepare_context(db, user_id, dialog_number, model_id, user_message,
+                                                                max_context_size=catalog.context_length(model_id))
 
         # گرد کردن درصد به عدد صحیح
         context_usage_percent = round(context_usage_percent)
@@ -1014,39 +912,81 @@ async def process_ai_request(context, chat_id, user_message, is_reload=False):
 
     # مقداردهی اولیه صف به‌روزرسانی‌ها، در صورت عدم وجود
     if "update_queue" not in context.bot_data:
-        # استفاده از صف هم‌زمان استاندارد
-        context.bot_data["update_queue"] = queue.Queue()
+        context.bot_data["update_queue"] = asyncio.Queue()
         # راه‌اندازی وظیفه پس‌زمینه برای به‌روزرسانی پیام‌ها
         asyncio.create_task(message_updater(context))
 
-    # مقداردهی اولیه دیکشنری جریان‌های فعال، در صورت عدم وجود
-    if "active_streams" not in context.bot_data:
-        context.bot_data["active_streams"] = {}
-
-    # ایجاد رویداد برای لغو جریان
-    cancel_event = threading.Event()
-    context.bot_data["active_streams"][str(chat_id)] = cancel_event
+    # ثبت جریان با کلید (chat_id, message_id)؛ دکمه توقف همین پیام را لغو می‌کند
+    registry = context.bot_data["stream_registry"]
+    stream_entry = registry.register(chat_id, initial_message.message_id, user_id=user_id, model_id=model_id)
+    cancel_event = stream_entry.cancel_event
 
     # انتقال شناسه گفت‌وگوی فعلی به زمینه برای تابع جریانی
-    thread_context = {
+    stream_context = {
+        "stream_metrics": context.bot_data.get("stream_metrics"),  # آمار پایان جریان‌ها
+        "stream_registry": registry,  # فهرست جریان‌های فعال
+        "stream_entry": stream_entry,  # ورودی این جریان (شمارنده‌های پاسخ)
+        "edit_cadence": context.bot_data.get("edit_cadence"),  # فاصله تطبیقی به‌روزرسانی‌ها
+        "update_backlog": lambda: update_backlog(context.bot_data),  # بار صف‌های توزیع‌کننده
         "is_reload": is_reload,  # پرچم بارگذاری مجدد
         "messages": messages,  # زمینه گفت‌وگو
         "context_usage_percent": context_usage_percent  # درصد پر شدن زمینه
     }
 
     if "current_dialog_id" in context.user_data:
-        thread_context["current_dialog_id"] = context.user_data["current_dialog_id"]
+        stream_context["current_dialog_id"] = context.user_data["current_dialog_id"]
 
     # افزودن اطلاعات اضافی برای بارگذاری مجدد
     if is_reload and "current_dialog_info" in context.user_data:
-        thread_context.update(context.user_data["current_dialog_info"])
+        stream_context.update(context.user_data["current_dialog_info"])
+
+    # حافظه پنهان پاسخ‌ها برای درخواست‌های یکسان (بارگذاری مجدد همیشه پاسخ تازه تولید می‌کند)
+    response_cache = context.bot_data.get("response_cache")
+    if response_cache is not None and not is_reload:
+        stream_context["response_cache"] = response_cache
+        stream_context["cache_key"] = response_cache.key(model_id, messages)
+
+    scheduler = context.bot_data["generation_scheduler"]
+
+    async def show_queue_position(position):
+        """نمایش جایگاه درخواست در صف در پیام اولیه."""
+        await context.bot_data["telegram_limiter"].call(
+            chat_id, context.bot.edit_message_text,
+            chat_id=chat_id,
+            message_id=initial_message.message_id,
+            text=f"⏳ درخواست شما در صف است (نوبت {position}). پاسخ به‌زودی تولید می‌شود...",
+            reply_markup=cancel_keyboard
+        )
+
+    async def run_generation():
+        """دریافت جریانی پاسخ؛ جایگاه تولید پیش از ارسال درخواست به API گرفته می‌شود."""
+        granted = False
+
+        async def acquire_slot():
+            nonlocal granted
+            granted = await scheduler.acquire(user_id, on_position=show_queue_position, cancel_event=cancel_event)
+
+        # پاسخ‌های موجود در حافظه پنهان یا در حال تولید برای درخواست یکسان جایگاه تولید نمی‌گیرند
+        stream_context["acquire_slot"] = acquire_slot
+        try:
+            await stream_ai_response(
+                context.bot_data["http_client"].client, model_id, user_message, context.bot_data["update_queue"],
+                chat_id, initial_message.message_id, cancel_event, stream_context
+            )
+        finally:
+            if granted:
+                scheduler.release(user_id)
+            # تولیدی که بدون پاسخ کامل پایان یافت، دنبال‌کننده‌ها را به تولید مستقل برمی‌گرداند
+            if "cache_flight" in stream_context:
+                response_cache.abandon(stream_context["cache_flight"])
+
+    # راه‌اندازی وظیفه پردازش جریانی روی حلقه رویداد ربات
+    stream_task = asyncio.create_task(run_generation())
 
-    # راه‌اندازی جریان برای پردازش جریانی
-    threading.Thread(
-        target=stream_ai_response,
-        args=(model_id, user_message, context.bot_data["update_queue"], chat_id,
-              initial_message.message_id, cancel_event, thread_context)
-    ).start()
+    # نگه داشتن ارجاع به وظیفه تا پایان آن
+    stream_tasks = context.bot_data.setdefault("stream_tasks", set())
+    stream_tasks.add(stream_task)
+    stream_task.add_done_callback(stream_tasks.discard)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1057,10 +997,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = user.id
 
     # ثبت کاربر و پیام او
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if db:
         # ثبت یا به‌روزرسانی کاربر
-        db.register_user(
+        await db.register_user(
             id_chat=chat_id,
             id_user=user_id,
             first_name=user.first_name,
@@ -1070,7 +1010,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         # دریافت یا ایجاد شماره گفت‌وگوی فعلی
         if "current_dialog" not in context.user_data:
-            context.user_data["current_dialog"] = db.get_next_dialog_number(user_id)
+            context.user_data["current_dialog"] = await db.get_next_dialog_number(user_id)
 
         # بررسی وجود مدل انتخاب‌شده
         if "selected_model" in context.user_data:
@@ -1079,17 +1019,9 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # بررسی اینکه آیا کاربر اجازه استفاده از این مدل را دارد
             is_admin = str(user_id) in config.ADMIN_IDS
 
-            # بررسی رایگان بودن مدل
-            cursor = db.conn.cursor()
-            cursor.execute(
-                "SELECT is_free FROM models WHERE id = ?",
-                (model_id,)
-            )
-            result = cursor.fetchone()
-
-            is_free_model = True  # به طور پیش‌فرض مدل را رایگان در نظر می‌گیریم
-            if result is not None:
-                is_free_model = bool(result[0])
+            # بررسی رایگان بودن مدل (مدل ناشناخته رایگان در نظر گرفته می‌شود)
+            catalog = context.bot_data["model_catalog"]
+            is_free_model = catalog.is_free(model_id)
 
             # اگر مدل پولی باشد و کاربر ادمین نباشد، خطا اعلام می‌کنیم
             if not is_free_model and not is_admin:
@@ -1099,16 +1031,12 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 return
 
             # یافتن نام مدل برای ثبت
-            models = await get_available_models(context, user_id)
-            model_name = model_id
-            for model in models:
-                if model["id"] == model_id:
-                    model_name = model["name"]
-                    break
+            model_name = catalog.name(model_id)
 
             # آماده‌سازی زمینه گفت‌وگو برای ارزیابی میزان پر شدن
-            messages, context_usage_percent = prepare_context(db, user_id, context.user_data["current_dialog"],
-                                                              model_id, user_message)
+            messages, context_usage_percent = await prepare_context(db, user_id, context.user_data["current_dialog"],
+                                                                    model_id, user_message,
+                                                                    max_context_size=catalog.context_length(model_id))
 
             # اگر زمینه بیش از 90% پر شده باشد، پیشنهاد شروع گفت‌وگوی جدید می‌دهیم
             if context_usage_percent > 90:
@@ -1123,7 +1051,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 # ادامه اجرا - کاربر می‌تواند توصیه را نادیده بگیرد
 
             # ثبت درخواست کاربر (بدون پاسخ مدل در این مرحله)
-            dialog_id = db.log_dialog(
+            dialog_id = await db.log_dialog(
                 id_chat=chat_id,
                 id_user=user_id,
                 number_dialog=context.user_data["current_dialog"],
@@ -1165,14 +1093,14 @@ async def new_dialog(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     user_id = update.effective_user.id
 
     # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if db:
         # اگر گفت‌وگوی فعلی وجود دارد، آن را به عنوان کامل شده علامت‌گذاری می‌کنیم
         if "current_dialog" in context.user_data:
-            db.mark_last_message(user_id, context.user_data["current_dialog"])
+            await db.mark_last_message(user_id, context.user_data["current_dialog"])
 
         # ایجاد گفت‌وگوی جدید
-        context.user_data["current_dialog"] = db.get_next_dialog_number(user_id)
+        context.user_data["current_dialog"] = await db.get_next_dialog_number(user_id)
 
         await update.message.reply_text(
             f"گفت‌وگوی جدید شروع شد (شماره {context.user_data['current_dialog']}). "
@@ -1197,56 +1125,39 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         model_id = data[6:]
 
         # بررسی اینکه آیا کاربر اجازه استفاده از این مدل را دارد
-        db = context.bot_data.get("db")
-        if db:
-            cursor = db.conn.cursor()
-            cursor.execute("SELECT is_free FROM models WHERE id = ?", (model_id,))
-            result = cursor.fetchone()
+        db = context.bot_data.get("async_db")
+        catalog = context.bot_data["model_catalog"]
+        model_info = catalog.get(model_id)
 
-            is_free_model = True  # به طور پیش‌فرض مدل را رایگان در نظر می‌گیریم
-            if result is not None:
-                is_free_model = bool(result[0])
-
-            # اگر مدل پولی باشد و کاربر ادمین نباشد، خطا اعلام می‌کنیم
-            if not is_free_model and not is_admin:
-                await query.edit_message_text(
-                    "⚠️ شما به این مدل دسترسی ندارید. لطفاً یک مدل رایگان انتخاب کنید."
-                )
-                return
+        # اگر مدل پولی باشد و کاربر ادمین نباشد، خطا اعلام می‌کنیم
+        if model_info is not None and not model_info.is_free and not is_admin:
+            await query.edit_message_text(
+                "⚠️ شما به این مدل دسترسی ندارید. لطفاً یک مدل رایگان انتخاب کنید."
+            )
+            return
 
         # ذخیره مدل
         context.user_data["selected_model"] = model_id
 
         # یافتن نام مدل و توضیحات برای نمایش
-        models = await get_available_models(context, user_id)
         model_name = model_id
         model_description = "بدون توضیحات"
-
-        for model in models:
-            if model["id"] == model_id:
-                model_name = model["name"]
-                model_description = model["description"]
-                break
+        if model_info is not None:
+            model_name = model_info.name
+            model_description = model_info.description
 
         # اگر گفت‌وگوی فعلی وجود دارد، آن را به عنوان کامل شده علامت‌گذاری می‌کنیم
         if db and "current_dialog" in context.user_data:
-            db.mark_last_message(user_id, context.user_data["current_dialog"])
+            await db.mark_last_message(user_id, context.user_data["current_dialog"])
             # ایجاد گفت‌وگوی جدید هنگام انتخاب مدل جدید
-            context.user_data["current_dialog"] = db.get_next_dialog_number(user_id)
+            context.user_data["current_dialog"] = await db.get_next_dialog_number(user_id)
 
         # برای ادمین‌ها اطلاعات قیمت مدل را اضافه می‌کنیم
-        if is_admin and db:
-            cursor = db.conn.cursor()
-            cursor.execute(
-                "SELECT prompt_price, completion_price, is_free FROM models WHERE id = ?",
-                (model_id,)
-            )
-            result = cursor.fetchone()
-
-            if result:
-                prompt_price = result[0] or "0"
-                completion_price = result[1] or "0"
-                is_free = bool(result[2])
+        if is_admin:
+            if model_info:
+                prompt_price = model_info.prompt_price or "0"
+                completion_price = model_info.completion_price or "0"
+                is_free = model_info.is_free
 
                 pricing_info = (
                     f"اطلاعات قیمت:\n"
@@ -1311,13 +1222,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         selected_model_text = ""
         if "selected_model" in context.user_data:
             model_id = context.user_data["selected_model"]
-            model_name = model_id
-
-            # جستجوی نام مدل انتخاب‌شده
-            for model in models:
-                if model["id"] == model_id:
-                    model_name = model["name"]
-                    break
+            model_name = context.bot_data["model_catalog"].name(model_id)
 
             selected_model_text = f"مدل انتخاب‌شده فعلی: {model_name}\n\n"
 
@@ -1362,13 +1267,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         selected_model_text = ""
         if "selected_model" in context.user_data:
             model_id = context.user_data["selected_model"]
-            model_name = model_id
-
-            # جستجوی نام مدل انتخاب‌شده
-            for model in models:
-                if model["id"] == model_id:
-                    model_name = model["name"]
-                    break
+            model_name = context.bot_data["model_catalog"].name(model_id)
 
             selected_model_text = f"مدل انتخاب‌شده فعلی: {model_name}\n\n"
 
@@ -1410,9 +1309,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     elif data == "cancel_stream":
         # پردازش لغو جریان
-        if "active_streams" in context.bot_data and str(chat_id) in context.bot_data["active_streams"]:
-            cancel_event = context.bot_data["active_streams"][str(chat_id)]
-            cancel_event.set()
+        if context.bot_data["stream_registry"].cancel(chat_id, query.message.message_id):
 
             # تغییر دکمه به نشانگر لغو
             await query.edit_message_reply_markup(
@@ -1430,9 +1327,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     elif data == "cancel_stream":
         # پردازش لغو جریان
-        if "active_streams" in context.bot_data and str(chat_id) in context.bot_data["active_streams"]:
-            cancel_event = context.bot_data["active_streams"][str(chat_id)]
-            cancel_event.set()
+        if context.bot_data["stream_registry"].cancel(chat_id, query.message.message_id):
 
             # حذف دکمه‌ها برای جلوگیری از کلیک مجدد کاربر
             try:
@@ -1448,14 +1343,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     elif data == "new_dialog":
         # ایجاد گفت‌وگوی جدید
-        db = context.bot_data.get("db")
+        db = context.bot_data.get("async_db")
         if db:
             # اگر گفت‌وگوی فعلی وجود دارد، آن را به عنوان کامل شده علامت‌گذاری می‌کنیم
             if "current_dialog" in context.user_data:
-                db.mark_last_message(user_id, context.user_data["current_dialog"])
+                await db.mark_last_message(user_id, context.user_data["current_dialog"])
 
             # ایجاد گفت‌وگوی جدید
-            context.user_data["current_dialog"] = db.get_next_dialog_number(user_id)
+            context.user_data["current_dialog"] = await db.get_next_dialog_number(user_id)
 
             # به‌روزرسانی پیام با تأیید
             await query.edit_message_text(
@@ -1480,7 +1375,7 @@ async def wait_for_cancel_processing(context, chat_id, message_id, wait_time=1.5
     await asyncio.sleep(wait_time)
 
     # به‌روزرسانی دکمه‌ها، فقط اگر جریان هنوز فعال باشد
-    if "active_streams" in context.bot_data and str(chat_id) in context.bot_data["active_streams"]:
+    if context.bot_data["stream_registry"].get(chat_id, message_id) is not None:
         try:
             # حذف کامل دکمه‌ها، زیرا تولید باید متوقف شده باشد
             await context.bot.edit_message_reply_markup(
@@ -1743,17 +1638,13 @@ async def get_available_models(context, user_id):
     # بررسی اینکه آیا کاربر ادمین است
     is_admin = str(user_id) in config.ADMIN_IDS
 
-    # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
-    if db:
-        if is_admin:
-            # برای ادمین‌ها همه مدل‌ها را برمی‌گردانیم
-            return db.get_models()
-        else:
-            # برای کاربران عادی فقط مدل‌های رایگان را برمی‌گردانیم
-            return db.get_models(only_free=True)
+    # دریافت کاتالوگ مدل‌ها
+    catalog = context.bot_data.get("model_catalog")
+    if catalog:
+        # برای ادمین‌ها همه مدل‌ها و برای کاربران عادی فقط مدل‌های رایگان
+        return catalog.models(only_free=not is_admin)
 
-    # اگر نتوانستیم از پایگاه داده دریافت کنیم، لیست پیش‌فرض مدل‌های رایگان را برمی‌گردانیم
+    # اگر کاتالوگ در دسترس نباشد، لیست خالی برمی‌گردانیم
     return []
 
 
@@ -1783,13 +1674,7 @@ async def select_model(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     selected_model_text = ""
     if "selected_model" in context.user_data:
         model_id = context.user_data["selected_model"]
-        model_name = model_id
-
-        # جستجوی نام مدل انتخاب‌شده
-        for model in models:
-            if model["id"] == model_id:
-                model_name = model["name"]
-                break
+        model_name = context.bot_data["model_catalog"].name(model_id)
 
         selected_model_text = f"مدل انتخاب‌شده فعلی: {model_name}\n\n"
 
@@ -1825,12 +1710,7 @@ async def update_models_command(update: Update, context: ContextTypes.DEFAULT_TY
     # ارسال پیام درباره شروع به‌روزرسانی
     message = await update.message.reply_text("در حال به‌روزرسانی لیست مدل‌ها...")
 
-    # اجرای به‌روزرسانی در یک جریان جداگانه برای جلوگیری از مسدود شدن ربات
-    def run_update():
-        return fetch_and_update_models(context)
-
-    # اجرا در جریان جداگانه
-    success = await context.application.loop.run_in_executor(None, run_update)
+    success = await fetch_and_update_models(context)
 
     if success:
         await message.edit_text("لیست مدل‌ها با موفقیت به‌روزرسانی شد!")
@@ -1838,6 +1718,152 @@ async def update_models_command(update: Update, context: ContextTypes.DEFAULT_TY
         await message.edit_text("خطایی در به‌روزرسانی مدل‌ها رخ داد. جزئیات در لاگ‌ها.")
 
 
+async def http_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """نمایش آمار استخر اتصال‌های HTTP (فقط برای ادمین‌ها)."""
+    user_id = update.effective_user.id
+
+    # بررسی اینکه آیا کاربر ادمین است
+    if str(user_id) not in config.ADMIN_IDS:
+        await update.message.reply_text("شما اجازه استفاده از این دستور را ندارید.")
+        return
+
+    http = context.bot_data.get("http_client")
+    if not http:
+        await update.message.reply_text("کلاینت HTTP هنوز راه‌اندازی نشده است.")
+        return
+
+    stats = http.metrics.snapshot()
+    await update.message.reply_text(
+        f"آمار اتصال‌های HTTP:\n\n"
+        f"درخواست‌ها: {stats['requests']}\n"
+        f"اتصال‌های جدید: {stats['new_connections']}\n"
+        f"نسبت استفاده مجدد: {stats['reuse_ratio']:.1%}\n"
+        f"میانگین زمان اتصال: {stats['avg_connect_ms']:.0f} میلی‌ثانیه\n"
+        f"میانگین زمان تا سرآیندهای پاسخ: {stats['avg_headers_ms']:.0f} میلی‌ثانیه"
+    )
+
+
+async def queue_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """نمایش وضعیت صف تولید پاسخ‌ها (فقط برای ادمین‌ها)."""
+    user_id = update.effective_user.id
+
+    # بررسی اینکه آیا کاربر ادمین است
+    if str(user_id) not in config.ADMIN_IDS:
+        await update.message.reply_text("شما اجازه استفاده از این دستور را ندارید.")
+        return
+
+    scheduler = context.bot_data.get("generation_scheduler")
+    if not scheduler:
+        await update.message.reply_text("زمان‌بند تولید هنوز راه‌اندازی نشده است.")
+        return
+
+    stats = scheduler.snapshot()
+    await update.message.reply_text(
+        f"وضعیت صف تولید:\n\n"
+        f"در حال تولید: {stats['active']} از {scheduler.max_active}\n"
+        f"در صف: {stats['waiting']} درخواست از {stats['waiting_users']} کاربر\n"
+        f"اعطاشده: {stats['granted']} (وارد صف شده: {stats['queued']}، لغو در صف: {stats['canceled']})\n"
+        f"زمان انتظار: میانگین {stats['avg_wait_ms']:.0f}، میانه {stats['p50_wait_ms']:.0f}، "
+        f"صدک ۹۵ {stats['p95_wait_ms']:.0f}، بیشینه {stats['max_wait_ms']:.0f} میلی‌ثانیه"
+    )
+
+    cadence = context.bot_data.get("edit_cadence")
+    if cadence:
+        edits = cadence.snapshot()
+        await update.message.reply_text(
+            f"ویرایش پیام‌ها:\n\n"
+            f"نرخ فعلی: {edits['edit_rate']:.1f} در ثانیه (سقف {cadence.max_edit_rate:.0f})\n"
+            f"بار: {edits['load']:.0%}\n"
+            f"فاصله فعلی: {edits['last_interval']:.2f} ثانیه، میانگین {edits['avg_interval']:.2f} ثانیه"
+        )
+
+    metrics = context.bot_data.get("stream_metrics")
+    if metrics:
+        streams = metrics.snapshot()
+        await update.message.reply_text(
+            f"پایان جریان‌ها:\n\n"
+            f"کامل: {streams['completed']}، لغو: {streams['canceled']}، "
+            f"بیکار: {streams['idle']}، اتمام مهلت: {streams['timeout']}\n"
+            f"زمان آزادسازی اتصال پس از توقف: میانگین {streams['avg_release_ms']:.1f}، "
+            f"صدک ۹۵ {streams['p95_release_ms']:.1f}، بیشینه {streams['max_release_ms']:.1f} میلی‌ثانیه"
+        )
+
+    dispatcher = context.bot_data.get("update_dispatcher")
+    if dispatcher:
+        updates = dispatcher.snapshot()
+        await update.message.reply_text(
+            f"توزیع به‌روزرسانی پیام‌ها:\n\n"
+            f"دریافتی: {updates['received']}، ادغام‌شده: {updates['coalesced']}\n"
+            f"دسته‌ها: {updates['batches']}، بزرگ‌ترین دسته: {updates['max_batch']}\n"
+            f"طول فعلی صف: {updates['queue_size']}"
+        )
+        await update.message.reply_text(
+            "تأخیر کارگرهای ارسال (میلی‌ثانیه):\n\n" + "\n".join(
+                f"کارگر {index}: {worker['handled']} پیام، صف {worker['backlog']}، "
+                f"میانگین {worker['avg_ms']:.0f}، صدک ۹۵ {worker['p95_ms']:.0f}، بیشینه {worker['max_ms']:.0f}"
+                for index, worker in enumerate(updates["workers"])
+            )
+        )
+
+    response_cache = context.bot_data.get("response_cache")
+    if response_cache:
+        cached = response_cache.snapshot()
+        await update.message.reply_text(
+            f"حافظه پنهان پاسخ‌ها:\n\n"
+            f"پاسخ‌های ذخیره‌شده: {cached['entries']} از {response_cache.max_entries}، "
+            f"در حال تولید: {cached['in_flight']}\n"
+            f"پاسخ بدون تولید: {cached['hits']}، پیوستن به تولید هم‌زمان: {cached['coalesced']}\n"
+            f"تولید جدید: {cached['misses']}، ذخیره: {cached['stores']}، حذف: {cached['evictions']}"
+        )
+
+    limiter = context.bot_data.get("telegram_limiter")
+    if limiter:
+        calls = limiter.snapshot()
+        await update.message.reply_text(
+            f"محدودیت نرخ تلگرام:\n\n"
+            f"پیام‌های نهایی: {calls['final_calls']} (میانگین انتظار {calls['avg_final_wait_ms']:.0f} میلی‌ثانیه)\n"
+            f"ویرایش‌های میانی: {calls['intermediate_calls']} "
+            f"(میانگین انتظار {calls['avg_intermediate_wait_ms']:.0f} میلی‌ثانیه)\n"
+            f"RetryAfter: {calls['retry_after']} بار، مجموع {calls['retry_after_seconds']:.0f} ثانیه "
+            f"({calls['global_penalties']} بار برای کل ربات)\n"
+            f"گفت‌وگوهای دارای سطل: {calls['tracked_chats']}"
+        )
+
+
+async def list_streams(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """نمایش جریان‌های در حال تولید (فقط برای ادمین‌ها)."""
+    user_id = update.effective_user.id
+
+    # بررسی اینکه آیا کاربر ادمین است
+    if str(user_id) not in config.ADMIN_IDS:
+        await update.message.reply_text("شما اجازه استفاده از این دستور را ندارید.")
+        return
+
+    registry = context.bot_data.get("stream_registry")
+    if not registry:
+        await update.message.reply_text("فهرست جریان‌ها هنوز راه‌اندازی نشده است.")
+        return
+
+    # محدود کردن تعداد جریان‌ها تا پیام از سقف طول تلگرام عبور نکند
+    stats = registry.snapshot(limit=15)
+    lines = [
+        f"جریان‌های فعال: {stats['live']} از {registry.max_entries}",
+        f"ثبت‌شده: {stats['registered']}، پایان‌یافته: {stats['finished']}، "
+        f"حذف به دلیل بیکاری: {stats['expired']}، حذف به دلیل ظرفیت: {stats['evicted']}"
+    ]
+    for stream in stats["streams"]:
+        tokens = stream["completion_tokens"] if stream["completion_tokens"] is not None else "-"
+        status = " (در حال لغو)" if stream["canceled"] else ""
+        lines.append(
+            f"\n• چت {stream['chat_id']}، پیام {stream['message_id']}، کاربر {stream['user_id']}{status}\n"
+            f"  مدل: {stream['model_id']}\n"
+            f"  مدت: {stream['age']:.0f} ثانیه، بدون فعالیت: {stream['idle']:.0f} ثانیه\n"
+            f"  بخش‌ها: {stream['deltas']}، کاراکترها: {stream['chars']}، توکن‌های پاسخ: {tokens}"
+        )
+
+    await update.message.reply_text("\n".join(lines))
+
+
 async def set_model_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """تنظیم توضیحات پارسی برای مدل."""
     user_id = update.effective_user.id
@@ -1858,9 +1884,9 @@ async def set_model_description(update: Update, context: ContextTypes.DEFAULT_TY
     description = " ".join(context.args[1:])
 
     # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if db:
-        if db.update_model_description(model_id, description):
+        if await db.update_model_description(model_id, description):
             await update.message.reply_text(f"توضیحات مدل {model_id} با موفقیت به‌روزرسانی شد!")
         else:
             await update.message.reply_text(f"خطایی در به‌روزرسانی توضیحات مدل {model_id} رخ داد.")
@@ -1892,13 +1918,13 @@ async def set_top_model(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         top_status = context.args[1] != "0"
 
     # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
+    db = context.bot_data.get("async_db")
     if db:
         # اگر وضعیت top_model را تنظیم می‌کنیم، ابتدا آن را برای همه مدل‌ها پاک می‌کنیم
         if top_status:
-            db.clear_top_models()
+            await db.clear_top_models()
 
-        if db.update_model_description(model_id, None, top_status):
+        if await db.set_model_top_status(model_id, top_status):
             status_text = "به" if top_status else "از"
             await update.message.reply_text(f"مدل {model_id} {status_text} مدل‌های برتر اضافه شد!")
         else:
@@ -1921,13 +1947,13 @@ async def list_models(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if context.args and context.args[0] in ["free", "top", "all"]:
         filter_type = context.args[0]
 
-    # دریافت دسترسی به پایگاه داده
-    db = context.bot_data.get("db")
-    if db:
+    # دریافت کاتالوگ مدل‌ها
+    catalog = context.bot_data.get("model_catalog")
+    if catalog:
         only_free = (filter_type == "free")
         only_top = (filter_type == "top")
 
-        models = db.get_models(only_free=only_free, only_top=only_top)
+        models = catalog.models(only_free=only_free, only_top=only_top)
 
         if not models:
             await update.message.reply_text("لیست مدل‌ها خالی است.")
@@ -1991,17 +2017,17 @@ def estimate_tokens(text):
     return int(tokens)
 
 
-def prepare_context(db, user_id, dialog_number, model_id, current_message, max_context_size=None):
+async def prepare_context(db, user_id, dialog_number, model_id, current_message, max_context_size=None):
     """
     آماده‌سازی زمینه گفت‌وگو با توجه به محدودیت‌های مدل.
 
     Args:
-        db: نمونه DBHandler
+        db: نمونه AsyncDBHandler
         user_id: شناسه کاربر
         dialog_number: شماره گفت‌وگو
         model_id: شناسه مدل
         current_message: پیام فعلی کاربر
-        max_context_size: حداکثر اندازه زمینه (اگر None باشد، از پایگاه داده گرفته می‌شود)
+        max_context_size: حداکثر اندازه زمینه (اگر None باشد، مقدار پیش‌فرض 4096 استفاده می‌شود)
 
     Returns:
         (messages, context_usage_percent): لیست پیام‌ها برای زمینه و درصد پر شدن زمینه
@@ -2009,31 +2035,28 @@ def prepare_context(db, user_id, dialog_number, model_id, current_message, max_c
     # دریافت محدودیت زمینه برای مدل
     context_limit = max_context_size
     if not context_limit:
-        cursor = db.conn.cursor()
-        cursor.execute("SELECT context_length FROM models WHERE id = ?", (model_id,))
-        result = cursor.fetchone()
-        if result and result[0]:
-            context_limit = result[0]
-        else:
-            # اگر در پایگاه داده یافت نشد، از مقدار پیش‌فرض استفاده می‌کنیم
-            context_limit = 4096
+        # اگر در کاتالوگ یافت نشد، از مقدار پیش‌فرض استفاده می‌کنیم
+        context_limit = 4096
 
-    # دریافت تاریخچه گفت‌وگو
-    history = db.get_dialog_history(user_id, dialog_number)
+    # دریافت تاریخچه گفت‌وگو همراه با توکن‌های از پیش محاسبه‌شده (از کش تاریخچه)
+    history, history_tokens, history_total = await db.get_dialog_context(user_id, dialog_number)
+    if history_tokens is None:
+        history_tokens = [estimate_tokens(message["content"]) for message in history]
+        history_total = sum(history_tokens)
 
     # افزودن پیام فعلی
     messages = history + [{"role": "user", "content": current_message}]
-
-    # تخمین تعداد کل توکن‌ها
-    token_count = 0
-    for message in messages:
-        token_count += estimate_tokens(message["content"])
+    tokens = history_tokens + [estimate_tokens(current_message)]
+    token_count = history_total + tokens[-1]
 
     # اگر از محدودیت فراتر رفت، پیام‌های قدیمی را حذف می‌کنیم تا در حد مجاز قرار بگیریم
-    while token_count > context_limit * 0.95 and len(messages) > 1:
+    removed = 0
+    while token_count > context_limit * 0.95 and len(messages) - removed > 1:
         # حذف قدیمی‌ترین پیام‌ها
-        removed_message = messages.pop(0)
-        token_count -= estimate_tokens(removed_message["content"])
+        token_count -= tokens[removed]
+        removed += 1
+    if removed:
+        messages = messages[removed:]
 
     # محاسبه درصد پر شدن زمینه
     context_usage_percent = (token_count / context_limit) * 100
@@ -2061,22 +2084,141 @@ async def post_init(application: Application) -> None:
     except Exception as e:
         logger.error(f"خطا در تنظیم دستورات پایه: {e}")
 
+    # کلاینت HTTP مشترک برای همه درخواست‌های اوپن‌روتر
+    http = SharedHTTPClient(
+        pool_size=config.HTTP_POOL_SIZE,
+        keepalive_connections=config.HTTP_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        http2=config.HTTP2_ENABLED
+    )
+    application.bot_data["http_client"] = http
+
+    # محدودیت تولیدهای هم‌زمان با صف منصفانه بین کاربران
+    application.bot_data["generation_scheduler"] = GenerationScheduler(
+        max_active=config.GENERATION_MAX_ACTIVE,
+        max_per_user=config.GENERATION_MAX_PER_USER
+    )
+
+    # فاصله تطبیقی ویرایش پیام‌ها هنگام پخش جریانی پاسخ
+    application.bot_data["edit_cadence"] = EditCadence(
+        base_interval=config.STREAM_UPDATE_INTERVAL,
+        first_interval=config.STREAM_FIRST_UPDATE_INTERVAL,
+        max_interval=config.STREAM_MAX_UPDATE_INTERVAL,
+        max_edit_rate=config.TELEGRAM_MAX_EDIT_RATE
+    )
+
+    # آمار لغو، بیکاری و زمان آزادسازی جریان‌ها
+    application.bot_data["stream_metrics"] = StreamMetrics()
+
+    # حافظه پنهان اختیاری پاسخ‌ها برای درخواست‌های یکسان
+    if config.RESPONSE_CACHE_ENABLED:
+        application.bot_data["response_cache"] = ResponseCache(
+            ttl=config.RESPONSE_CACHE_TTL,
+            max_entries=config.RESPONSE_CACHE_MAX_ENTRIES
+        )
+
+    # فهرست جریان‌های در حال تولید با حذف خودکار ورودی‌های رهاشده
+    application.bot_data["stream_registry"] = StreamRegistry(
+        ttl=config.STREAM_REGISTRY_TTL,
+        max_entries=config.STREAM_REGISTRY_MAX
+    )
+
+    # محدودیت نرخ فراخوانی‌های تلگرام با اولویت پیام‌های نهایی
+    application.bot_data["telegram_limiter"] = TelegramRateLimiter(
+        global_rate=config.TELEGRAM_GLOBAL_RATE,
+        chat_rate=config.TELEGRAM_CHAT_RATE,
+        chat_burst=config.TELEGRAM_CHAT_BURST,
+        group_per_minute=config.TELEGRAM_GROUP_PER_MINUTE,
+        group_burst=config.TELEGRAM_GROUP_BURST
+    )
+
+    # باز کردن اتصال‌ها پیش از اولین پیام کاربران
+    await http.prewarm(OPENROUTER_MODELS_URL, connections=config.HTTP_PREWARM_CONNECTIONS)
+
+    # به‌روزرسانی مدل‌ها در هنگام راه‌اندازی در پس‌زمینه
+    application.create_task(fetch_and_update_models(application))
+
+    # ادامه کار ترجمه‌ای که پیش از راه‌اندازی مجدد تمام نشده بود
+    await resume_translation_job(application)
+
+
+async def resume_translation_job(application):
+    """ادامه آخرین کار ترجمه ناتمام از نقطه ثبت‌شده در پایگاه داده."""
+    db = application.bot_data.get("async_db")
+    if not db:
+        return
+
+    active = await db.get_active_translation_job()
+    if not active:
+        return
+
+    job_id, chat_id, total = active
+    model = select_translation_model(application.bot_data["model_catalog"])
+    if not model:
+        logger.error(f"نتوانستیم مدل مناسبی برای ادامه کار ترجمه {job_id} پیدا کنیم")
+        return
+
+    message_id = None
+    if chat_id:
+        try:
+            message = await application.bot.send_message(
+                chat_id=chat_id,
+                text=f"ادامه ترجمه توضیحات مدل‌ها پس از راه‌اندازی مجدد ربات...\nمدل فعلی برای ترجمه: {model}"
+            )
+            message_id = message.message_id
+        except Exception as e:
+            logger.error(f"خطا در ارسال پیام ادامه کار ترجمه: {e}")
+
+    logger.info(f"ادامه کار ترجمه {job_id}")
+    start_translation_job(application, job_id, total, model, chat_id, message_id)
+
+
+async def post_shutdown(application: Application) -> None:
+    """بستن منابع مشترک پس از توقف ربات."""
+    http = application.bot_data.get("http_client")
+    if http:
+        await http.aclose()
+
+    # پایان پرس‌وجوهای در حال اجرا، سپس ثبت نوشته‌های در صف نویسنده دسته‌ای و بستن اتصال‌ها
+    loop = asyncio.get_running_loop()
+    async_db = application.bot_data.get("async_db")
+    if async_db:
+        await loop.run_in_executor(None, async_db.shutdown)
+    db = application.bot_data.get("db")
+    if db:
+        await loop.run_in_executor(None, db.close)
+
 
 def main() -> None:
     """راه‌اندازی ربات."""
     # ایجاد پردازشگر به‌روزرسانی‌ها
     global application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).post_init(post_init).build()
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # مقداردهی اولیه پایگاه داده
-    db = DBHandler(config.DB_PATH)
+    db = DBHandler(
+        config.DB_PATH,
+        storage_profile=config.DB_STORAGE_PROFILE,
+        write_behind=config.DB_WRITE_BEHIND,
+        batch_interval_ms=config.DB_WRITE_BATCH_INTERVAL_MS,
+        batch_max_ops=config.DB_WRITE_BATCH_MAX_OPS,
+        history_cache=DialogHistoryCache(estimate_tokens, maxsize=config.HISTORY_CACHE_DIALOGS)
+    )
     application.bot_data["db"] = db
 
-    # به‌روزرسانی مدل‌ها در هنگام راه‌اندازی در یک جریان جداگانه
-    def update_models_at_startup():
-        fetch_and_update_models(application)
+    # نمای ناهمگام پایگاه داده برای پردازشگرهای تلگرام
+    application.bot_data["async_db"] = AsyncDBHandler(db, max_workers=config.DB_EXECUTOR_WORKERS)
 
-    threading.Thread(target=update_models_at_startup).start()
+    # کاتالوگ مدل‌ها در حافظه؛ پس از هر تغییر جدول models بازسازی می‌شود
+    catalog = ModelCatalog()
+    catalog.attach(db)
+    application.bot_data["model_catalog"] = catalog
 
     # افزودن پردازشگرهای دستورات
     application.add_handler(CommandHandler("start", start))
@@ -2091,6 +2233,9 @@ def main() -> None:
     application.add_handler(CommandHandler("list_models", list_models))
     application.add_handler(CommandHandler("translate_descriptions", translate_descriptions))
     application.add_handler(CommandHandler("translate_all", translate_all_models))
+    application.add_handler(CommandHandler("http_stats", http_stats))
+    application.add_handler(CommandHandler("queue_stats", queue_stats))
+    application.add_handler(CommandHandler("streams", list_streams))
 
     # افزودن پردازشگر دکمه‌های داخلی
     application.add_handler(CallbackQueryHandler(button_callback))
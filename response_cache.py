@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """تولید در حال اجرای یک پاسخ که درخواست‌های یکسان هم‌زمان آن را دنبال می‌کنند."""
+
+    __slots__ = ("key", "frame", "version", "done", "result", "followers", "_changed")
+
+    def __init__(self, key):
+        self.key = key
+        # آخرین متن رندرشده پاسخ
+        self.frame = ""
+        self.version = 0
+        self.done = False
+        # متن نهایی در صورت موفقیت، None در صورت شکست یا لغو
+        self.result = None
+        self.followers = 0
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        """بیدار کردن دنبال‌کننده‌ها."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, frame):
+        """انتشار فریم میانی تازه برای دنبال‌کننده‌ها."""
+        self.frame = frame
+        self.version += 1
+        self._notify()
+
+    def finish(self, result):
+        """پایان تولید با متن نهایی یا None."""
+        if self.done:
+            return
+        self.done = True
+        self.result = result
+        self._notify()
+
+
+class ResponseCache:
+    """
+    حافظه پنهان پاسخ‌ها با تطبیق دقیق و ادغام درخواست‌های هم‌زمان (single-flight).
+
+    کلید، شناسه مدل و پیام‌های زمینه پس از یکسان‌سازی فاصله‌هاست. پاسخ‌های کامل تا ttl
+    ثانیه و حداکثر max_entries مورد (با حذف کم‌استفاده‌ترین) نگه داشته می‌شوند. اگر هنگام
+    رسیدن یک درخواست، درخواست یکسانی در حال تولید باشد، درخواست جدید به جای تولید دوباره
+    فریم‌های همان جریان را دنبال می‌کند.
+
+    مثال:
+        key = cache.key(model_id, messages)
+        text = cache.get(key)
+        if text is None:
+            flight, leader = cache.join(key)
+            if leader:
+                ...  # تولید، flight.publish(frame) و در پایان cache.complete(flight, text)
+            else:
+                text = await cache.follow(flight, cancel_event, on_frame)
+    """
+
+    def __init__(self, ttl=3600, max_entries=500):
+        """
+        Args:
+            ttl: مدت نگهداری هر پاسخ (ثانیه)
+            max_entries: حداکثر تعداد پاسخ‌های نگه‌داشته‌شده
+        """
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+
+        # {کلید: (زمان ذخیره، متن)} به ترتیب آخرین استفاده
+        self._entries = OrderedDict()
+        # {کلید: Flight} تولیدهای در حال اجرا
+        self._flights = {}
+
+        # آمار
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model_id, messages):
+        """ساخت کلید از شناسه مدل و پیام‌ها (فاصله‌های اضافی نادیده گرفته می‌شوند)."""
+        normalized = [
+            [message.get("role"), " ".join(str(message.get("content", "")).split())]
+            for message in messages
+        ]
+        raw = json.dumps([model_id, normalized], ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """دریافت پاسخ ذخیره‌شده یا None."""
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        stored_at, text = item
+        if time.monotonic() - stored_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return text
+
+    def join(self, key):
+        """
+        پیوستن به تولید در حال اجرای یک کلید یا شروع تولید جدید.
+
+        Returns:
+            (Flight, bool): تولید و اینکه آیا فراخواننده مسئول تولید (leader) است
+        """
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            self.coalesced += 1
+            return flight, False
+        self.misses += 1
+        flight = self._flights[key] = Flight(key)
+        return flight, True
+
+    def complete(self, flight, text):
+        """ذخیره پاسخ کامل و ارسال آن به دنبال‌کننده‌ها."""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        flight.finish(text)
+
+        self._entries[flight.key] = (time.monotonic(), text)
+        self._entries.move_to_end(flight.key)
+        self.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def abandon(self, flight):
+        """پایان تولید بدون پاسخ قابل ذخیره (خطا یا لغو)؛ دنبال‌کننده‌ها None دریافت می‌کنند."""
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        flight.finish(None)
+
+    async def follow(self, flight, cancel_event, on_frame):
+        """
+        دنبال کردن تولید دیگری تا پایان آن.
+
+        Args:
+            flight: تولید در حال اجرا
+            cancel_event: asyncio.Event لغو این درخواست
+            on_frame: تابع async که با هر فریم میانی تازه فراخوانی می‌شود
+
+        Returns:
+            str: متن نهایی، یا None اگر تولید اصلی ناموفق بود یا این درخواست لغو شد
+        """
+        version = 0
+        while not flight.done:
+            if flight.version != version:
+                version = flight.version
+                await on_frame(flight.frame)
+                continue
+
+            changed_task = asyncio.create_task(flight._changed.wait())
+            cancel_task = asyncio.create_task(cancel_event.wait())
+            try:
+                await asyncio.wait({changed_task, cancel_task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed_task.cancel()
+                cancel_task.cancel()
+            if cancel_event.is_set():
+                return None
+
+        if flight.result is not None:
+            self.hits += 1
+        return flight.result
+
+    def snapshot(self):
+        """
+        دریافت خلاصه آمار.
+
+        Returns:
+            dict: تعداد پاسخ‌های ذخیره‌شده، تولیدهای در حال اجرا، پاسخ از حافظه، ادغام‌ها، تولیدها و حذف‌ها
+        """
+        return {
+            "entries": len(self._entries),
+            "in_flight": len(self._flights),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,141 @@
+import json
+import logging
+from json.decoder import scanstring
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+# انواع رویدادهای جریان
+DELTA = "delta"
+USAGE = "usage"
+ERROR = "error"
+DONE = "done"
+
+_DATA_PREFIX = b"data:"
+_DONE_PAYLOAD = b"[DONE]"
+_CONTENT_KEY = b'"content":'
+_DELTA_KEY = b'"delta":'
+
+
+class StreamEvent:
+    """
+    رویداد رمزگشایی‌شده از جریان SSE.
+
+    kind یکی از DELTA (value: بخش متن)، USAGE (value: دیکشنری usage)،
+    ERROR (value: دیکشنری error) یا DONE (value: None) است.
+    """
+
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"StreamEvent({self.kind!r}, {self.value!r})"
+
+
+class SSEDecoder:
+    """
+    رمزگشای جریان SSE اوپن‌روتر روی بایت‌های خام.
+
+    خطوط توضیح (keep-alive مانند ": OPENROUTER PROCESSING") و خطوط خالی بدون رمزگشایی
+    کنار گذاشته می‌شوند. برای بخش‌های معمولی پاسخ فقط مقدار choices[0].delta.content
+    با json.decoder.scanstring خوانده می‌شود؛ تجزیه کامل JSON فقط برای بخش‌های شامل
+    usage یا error، یا قالب‌های غیرمعمول انجام می‌شود.
+
+    مثال:
+        decoder = SSEDecoder()
+        async for chunk in response.aiter_bytes():
+            for event in decoder.feed(chunk):
+                ...
+    """
+
+    def __init__(self):
+        # بخش ناقص آخرین خط دریافت‌شده
+        self._buffer = b""
+        # آمار برای عیب‌یابی
+        self.fast_path = 0
+        self.slow_path = 0
+
+    def feed(self, chunk):
+        """
+        رمزگشایی بایت‌های دریافتی.
+
+        Args:
+            chunk: بخشی از بدنه پاسخ (bytes)؛ مرز آن لازم نیست با مرز خطوط یکی باشد
+
+        Returns:
+            list: رویدادهای StreamEvent کامل‌شده به ترتیب دریافت
+        """
+        if self._buffer:
+            chunk = self._buffer + chunk
+        lines = chunk.split(b"\n")
+        self._buffer = lines.pop()
+
+        events = []
+        for line in lines:
+            if line.startswith(_DATA_PREFIX):
+                self._decode_data(line[5:].strip(), events)
+        return events
+
+    def close(self):
+        """رمزگشایی خط پایانی در صورتی که جریان بدون خط جدید تمام شده باشد."""
+        line, self._buffer = self._buffer, b""
+        events = []
+        if line.startswith(_DATA_PREFIX):
+            self._decode_data(line[5:].strip(), events)
+        return events
+
+    def _decode_data(self, payload, events):
+        """رمزگشایی مقدار یک خط data: و افزودن رویدادهای آن به events."""
+        if payload == _DONE_PAYLOAD:
+            events.append(StreamEvent(DONE))
+            return
+        if not payload:
+            return
+
+        # مسیر سریع: یک کلید content درون delta و بدون usage یا error
+        position = payload.find(_CONTENT_KEY)
+        if (position > 0 and payload.find(_CONTENT_KEY, position + 10) < 0
+                and payload.rfind(_DELTA_KEY, 0, position) >= 0
+                and b'"usage"' not in payload and b'"error"' not in payload):
+            value = position + 10
+            while payload[value:value + 1] == b" ":
+                value += 1
+            if payload.startswith(b"null", value):
+                self.fast_path += 1
+                return
+            if payload.startswith(b'"', value):
+                try:
+                    content, _ = scanstring(payload[value + 1:].decode("utf-8"), 0)
+                except ValueError:
+                    # شامل UnicodeDecodeError؛ تجزیه کامل در ادامه خطا را گزارش می‌کند
+                    pass
+                else:
+                    self.fast_path += 1
+                    if content:
+                        events.append(StreamEvent(DELTA, content))
+                    return
+
+        self.slow_path += 1
+        try:
+            data_obj = json.loads(payload)
+        except ValueError as e:
+            logger.error(f"خطای رمزگشایی JSON: {e} - {payload[:200]!r}")
+            return
+        if not isinstance(data_obj, dict):
+            return
+
+        # بررسی وجود محتوا در انتخاب
+        choices = data_obj.get("choices")
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                events.append(StreamEvent(DELTA, content))
+
+        if data_obj.get("error"):
+            events.append(StreamEvent(ERROR, data_obj["error"]))
+
+        if data_obj.get("usage"):
+            events.append(StreamEvent(USAGE, data_obj["usage"]))
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+# نتیجه اجرای جریان
+COMPLETED = "completed"
+CANCELED = "canceled"
+IDLE = "idle"
+TIMEOUT = "timeout"
+
+
+class StreamMetrics:
+    """
+    آمار پایان جریان‌ها و زمان آزادسازی منابع.
+
+    زمان آزادسازی فاصله میان تشخیص لغو، بیکاری یا اتمام مهلت تا بسته شدن کامل اتصال
+    بالادستی است (پایان وظیفه خواندن پس از cancel).
+    """
+
+    def __init__(self, samples=1000):
+        self.outcomes = {COMPLETED: 0, CANCELED: 0, IDLE: 0, TIMEOUT: 0}
+        self.release_total = 0.0
+        self.release_max = 0.0
+        self.releases = 0
+        self._recent = deque(maxlen=samples)
+
+    def record(self, outcome, release_seconds=None):
+        """ثبت نتیجه یک جریان و در صورت توقف زودهنگام، زمان آزادسازی آن."""
+        self.outcomes[outcome] += 1
+        if release_seconds is None:
+            return
+        self.releases += 1
+        self.release_total += release_seconds
+        self.release_max = max(self.release_max, release_seconds)
+        self._recent.append(release_seconds)
+
+    def snapshot(self):
+        """
+        دریافت خلاصه آمار.
+
+        Returns:
+            dict: تعداد هر نتیجه، و میانگین، صدک ۹۵ و بیشینه زمان آزادسازی (میلی‌ثانیه)
+        """
+        recent = sorted(self._recent)
+        return {
+            **self.outcomes,
+            "avg_release_ms": (self.release_total / self.releases * 1000) if self.releases else 0.0,
+            "p95_release_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000 if recent else 0.0,
+            "max_release_ms": self.release_max * 1000,
+        }
+
+
+class StreamHandle:
+    """
+    نظارت بر یک وظیفه خواندن جریان از بیرون آن.
+
+    وظیفه خواندن با هر کدام از این رخدادها فوراً لغو می‌شود، حتی اگر در انتظار داده
+    از شبکه باشد: تنظیم cancel_event، نرسیدن داده تازه به مدت idle_timeout، یا گذشتن
+    max_duration از شروع. لغو وظیفه، پاسخ httpx را می‌بندد و اتصال آزاد می‌شود.
+    هیچ نظرسنجی دوره‌ای انجام نمی‌شود؛ انتظار فقط تا نزدیک‌ترین مهلت ادامه دارد.
+
+    مثال:
+        handle = StreamHandle(cancel_event, idle_timeout=60, max_duration=300)
+
+        async def read():
+            async for chunk in stream:
+                handle.touch()
+                ...
+
+        outcome, task = await handle.run(read())
+    """
+
+    def __init__(self, cancel_event, idle_timeout, max_duration, metrics=None):
+        """
+        Args:
+            cancel_event: asyncio.Event لغو توسط کاربر
+            idle_timeout: حداکثر فاصله مجاز میان دو داده دریافتی (ثانیه)
+            max_duration: حداکثر مدت کل جریان (ثانیه)
+            metrics: نمونه StreamMetrics برای ثبت نتیجه (اختیاری)
+        """
+        self.cancel_event = cancel_event
+        self.idle_timeout = idle_timeout
+        self.max_duration = max_duration
+        self.metrics = metrics
+        self.started_at = time.monotonic()
+        self.last_activity = self.started_at
+
+    def touch(self):
+        """ثبت دریافت داده تازه (تمدید مهلت بیکاری)."""
+        self.last_activity = time.monotonic()
+
+    def _deadline(self):
+        """نزدیک‌ترین مهلت و نتیجه متناظر با آن."""
+        idle_deadline = self.last_activity + self.idle_timeout
+        total_deadline = self.started_at + self.max_duration
+        if idle_deadline < total_deadline:
+            return idle_deadline, IDLE
+        return total_deadline, TIMEOUT
+
+    async def run(self, coro):
+        """
+        اجرای وظیفه خواندن تا پایان، لغو یا اتمام یکی از مهلت‌ها.
+
+        Returns:
+            (outcome, task): نتیجه (COMPLETED، CANCELED، IDLE یا TIMEOUT) و وظیفه پایان‌یافته؛
+                در صورت COMPLETED، خطای احتمالی وظیفه با task.exception() در دسترس است
+        """
+        task = asyncio.create_task(coro)
+        cancel_task = asyncio.create_task(self.cancel_event.wait())
+        outcome = COMPLETED
+        try:
+            while not task.done():
+                deadline, reason = self._deadline()
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    outcome = reason
+                    break
+
+                await asyncio.wait({task, cancel_task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if cancel_task.done() and not task.done():
+                    outcome = CANCELED
+                    break
+        finally:
+            cancel_task.cancel()
+            stopped_at = time.monotonic()
+            if not task.done():
+                task.cancel()
+            # انتظار برای بسته شدن اتصال
+            await asyncio.gather(task, return_exceptions=True)
+
+        release = time.monotonic() - stopped_at if outcome != COMPLETED else None
+        if self.metrics is not None:
+            self.metrics.record(outcome, release)
+        if release is not None:
+            logger.info(f"جریان با نتیجه {outcome} متوقف شد؛ آزادسازی اتصال {release * 1000:.1f} میلی‌ثانیه")
+        return outcome, task
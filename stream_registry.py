@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class StreamEntry:
+    """وضعیت یک جریان پاسخ در حال تولید."""
+
+    __slots__ = ("chat_id", "message_id", "user_id", "model_id", "cancel_event", "started_at", "updated_at",
+                 "last_frame", "deltas", "chars", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, chat_id, message_id, user_id=None, model_id=None):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.user_id = user_id
+        self.model_id = model_id
+        self.cancel_event = asyncio.Event()
+        self.started_at = time.monotonic()
+        self.updated_at = self.started_at
+        # آخرین متن ارسال‌شده به تلگرام (برای رد ویرایش‌های تکراری)
+        self.last_frame = None
+        # شمارنده‌های پاسخ
+        self.deltas = 0
+        self.chars = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+
+    def snapshot(self, now):
+        """خلاصه وضعیت برای نمایش به ادمین."""
+        return {
+            "chat_id": self.chat_id,
+            "message_id": self.message_id,
+            "user_id": self.user_id,
+            "model_id": self.model_id,
+            "age": now - self.started_at,
+            "idle": now - self.updated_at,
+            "deltas": self.deltas,
+            "chars": self.chars,
+            "completion_tokens": self.completion_tokens,
+            "canceled": self.cancel_event.is_set(),
+        }
+
+
+class StreamRegistry:
+    """
+    ثبت متمرکز جریان‌های در حال تولید با کلید (chat_id, message_id).
+
+    هر ورودی رویداد لغو، آخرین فریم ارسال‌شده، زمان شروع و شمارنده‌های پاسخ را نگه می‌دارد.
+    ورودی‌ها با پیام نهایی حذف می‌شوند؛ ورودی‌هایی که به هر دلیل پیام نهایی ندارند پس از ttl
+    ثانیه بدون فعالیت حذف می‌شوند و تعداد کل ورودی‌ها هرگز از max_entries بیشتر نمی‌شود.
+    جریان‌هایی که به این ترتیب حذف می‌شوند لغو هم می‌شوند تا اتصال آن‌ها آزاد شود.
+
+    مثال:
+        registry = StreamRegistry(ttl=900, max_entries=1000)
+        entry = registry.register(chat_id, message_id, user_id=user_id)
+        ...
+        registry.cancel(chat_id, message_id)  # دکمه توقف تولید
+        registry.finish(chat_id, message_id)  # پس از ارسال پیام نهایی
+    """
+
+    def __init__(self, ttl=900, max_entries=1000):
+        """
+        Args:
+            ttl: مدت (ثانیه) بدون فعالیت که پس از آن ورودی حذف می‌شود
+            max_entries: حداکثر تعداد ورودی‌ها
+        """
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+
+        # {(chat_id, message_id): StreamEntry} به ترتیب آخرین فعالیت
+        self._entries = OrderedDict()
+
+        # آمار
+        self.registered = 0
+        self.finished = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _discard(self, key):
+        """حذف ورودی و لغو جریان آن در صورت فعال بودن."""
+        entry = self._entries.pop(key)
+        if not entry.cancel_event.is_set():
+            entry.cancel_event.set()
+        return entry
+
+    def evict_expired(self, now=None):
+        """حذف ورودی‌هایی که بیش از ttl ثانیه فعالیتی نداشته‌اند."""
+        now = time.monotonic() if now is None else now
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.updated_at < self.ttl:
+                break
+            self._discard(key)
+            self.expired += 1
+            logger.warning(f"جریان {key} پس از {self.ttl} ثانیه بدون فعالیت از فهرست جریان‌ها حذف شد")
+
+    def register(self, chat_id, message_id, user_id=None, model_id=None):
+        """
+        ثبت جریان جدید.
+
+        Returns:
+            StreamEntry: ورودی جریان (cancel_event آن برای لغو استفاده می‌شود)
+        """
+        now = time.monotonic()
+        self.evict_expired(now)
+
+        key = (chat_id, message_id)
+        if key in self._entries:
+            self._discard(key)
+        while len(self._entries) >= self.max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evicted += 1
+            logger.warning(f"جریان {oldest} به دلیل پر شدن فهرست جریان‌ها حذف شد")
+
+        entry = self._entries[key] = StreamEntry(chat_id, message_id, user_id, model_id)
+        self.registered += 1
+        return entry
+
+    def get(self, chat_id, message_id):
+        """دریافت ورودی جریان یا None."""
+        return self._entries.get((chat_id, message_id))
+
+    def touch(self, entry):
+        """ثبت فعالیت جریان (تمدید ttl)."""
+        entry.updated_at = time.monotonic()
+        key = (entry.chat_id, entry.message_id)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def record_delta(self, entry, text):
+        """ثبت رسیدن بخشی از پاسخ."""
+        entry.deltas += 1
+        entry.chars += len(text)
+        self.touch(entry)
+
+    @staticmethod
+    def record_usage(entry, usage):
+        """ثبت مصرف توکن گزارش‌شده توسط OpenRouter."""
+        entry.prompt_tokens = usage.get("prompt_tokens")
+        entry.completion_tokens = usage.get("completion_tokens")
+
+    def is_new_frame(self, chat_id, message_id, text):
+        """
+        ثبت فریم میانی و بررسی تفاوت آن با آخرین فریم ارسال‌شده.
+
+        Returns:
+            bool: False اگر متن با آخرین فریم همین پیام یکسان باشد
+        """
+        entry = self._entries.get((chat_id, message_id))
+        if entry is None:
+            return True
+        if entry.last_frame == text:
+            return False
+        entry.last_frame = text
+        self.touch(entry)
+        return True
+
+    def cancel(self, chat_id, message_id):
+        """
+        لغو جریان یک پیام.
+
+        Returns:
+            bool: True اگر جریان فعالی برای این پیام وجود داشت
+        """
+        entry = self._entries.get((chat_id, message_id))
+        if entry is None:
+            return False
+        entry.cancel_event.set()
+        return True
+
+    def finish(self, chat_id, message_id):
+        """حذف جریان پس از ارسال پیام نهایی."""
+        entry = self._entries.pop((chat_id, message_id), None)
+        if entry is not None:
+            self.finished += 1
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self, limit=20):
+        """
+        دریافت خلاصه وضعیت.
+
+        Args:
+            limit: حداکثر تعداد جریان‌های نمایش‌داده‌شده (قدیمی‌ترین‌ها)
+
+        Returns:
+            dict: تعداد جریان‌های فعال، آمار ثبت و حذف، و وضعیت جریان‌ها
+        """
+        now = time.monotonic()
+        self.evict_expired(now)
+        entries = sorted(self._entries.values(), key=lambda entry: entry.started_at)[:limit]
+        return {
+            "live": len(self._entries),
+            "registered": self.registered,
+            "finished": self.finished,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "streams": [entry.snapshot(now) for entry in entries],
+        }
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """سطل توکن: rate توکن در ثانیه با ظرفیت capacity."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        """افزودن توکن‌های تولیدشده از آخرین به‌روزرسانی."""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now, reserve=0.0):
+        """
+        زمان لازم (ثانیه) تا در دسترس بودن یک توکن.
+
+        Args:
+            reserve: تعداد توکن‌هایی که باید پس از مصرف باقی بمانند (برای درخواست‌های کم‌اولویت)
+        """
+        self._refill(now)
+        missing = 1.0 + reserve - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, now):
+        """مصرف یک توکن."""
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def drain(self, now):
+        """خالی کردن سطل (پس از خطای محدودیت نرخ)."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+    def is_full(self, now):
+        """آیا سطل پر است (برای حذف سطل‌های بیکار)."""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def retry_after_seconds(error):
+    """مدت انتظار RetryAfter به ثانیه (در نسخه‌های جدید timedelta است)."""
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TelegramRateLimiter:
+    """
+    محدودکننده نرخ فراخوانی‌های Bot API تلگرام.
+
+    هر فراخوانی باید از سه سطل توکن عبور کند: سطل کل ربات، سطل گفت‌وگو و برای گروه‌ها
+    (chat_id منفی) سطل گروه. پیام‌های نهایی بر ویرایش‌های میانی اولویت دارند: ویرایش میانی
+    فقط وقتی توکن مصرف می‌کند که بخشی از ظرفیت هر سطل (final_reserve) برای پیام‌های نهایی
+    باقی بماند. در صورت دریافت RetryAfter، گفت‌وگو تا پایان مدت اعلام‌شده مسدود و
+    همان فراخوانی پس از آن دوباره انجام می‌شود. سطل کل ربات فقط وقتی خالی می‌شود که خطا به
+    گفت‌وگوی خاصی مربوط نباشد یا چند گفت‌وگو هم‌زمان مسدود باشند (نشانه محدودیت کل ربات)،
+    تا محدودیت یک گفت‌وگو ویرایش‌های گفت‌وگوهای دیگر را کند نکند.
+
+    مثال:
+        limiter = TelegramRateLimiter(global_rate=30, chat_rate=1)
+        await limiter.call(chat_id, bot.edit_message_text, text=text, chat_id=chat_id, message_id=message_id)
+    """
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, group_per_minute=20, group_burst=5,
+                 final_reserve=0.2, max_retries=5, max_buckets=10000, global_penalty_chats=3):
+        """
+        Args:
+            global_rate: حداکثر فراخوانی در ثانیه برای کل ربات
+            chat_rate: حداکثر فراخوانی در ثانیه برای هر گفت‌وگو
+            chat_burst: ظرفیت سطل هر گفت‌وگو
+            group_per_minute: حداکثر فراخوانی در دقیقه برای هر گروه
+            group_burst: ظرفیت سطل هر گروه
+            final_reserve: سهمی از ظرفیت هر سطل که فقط پیام‌های نهایی مصرف می‌کنند
+            max_retries: حداکثر تلاش مجدد پس از RetryAfter
+            max_buckets: تعداد سطل‌های گفت‌وگو که پس از آن سطل‌های بیکار حذف می‌شوند
+            global_penalty_chats: تعداد گفت‌وگوهای هم‌زمان مسدود که سطل کل ربات را خالی می‌کند
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60.0
+        self.group_burst = group_burst
+        self.final_reserve = final_reserve
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+        self.global_penalty_chats = max(1, global_penalty_chats)
+
+        # {chat_id: TokenBucket}
+        self._chats = {}
+        self._groups = {}
+        # {chat_id: زمان پایان مسدودیت پس از RetryAfter}
+        self._blocked_until = {}
+
+        # آمار
+        self.calls = {True: 0, False: 0}
+        self.wait_total = {True: 0.0, False: 0.0}
+        self.retry_after_count = 0
+        self.retry_after_seconds = 0.0
+        self.global_penalties = 0
+
+    def _bucket(self, buckets, chat_id, rate, capacity, now):
+        """دریافت یا ایجاد سطل یک گفت‌وگو و حذف سطل‌های بیکار در صورت زیاد شدن آن‌ها."""
+        bucket = buckets.get(chat_id)
+        if bucket is None:
+            if len(buckets) >= self.max_buckets:
+                for key in [key for key, value in buckets.items() if value.is_full(now)]:
+                    del buckets[key]
+            bucket = buckets[chat_id] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _buckets_for(self, chat_id, now):
+        """سطل‌هایی که یک فراخوانی برای این گفت‌وگو باید از آن‌ها عبور کند."""
+        buckets = [self.global_bucket, self._bucket(self._chats, chat_id, self.chat_rate, self.chat_burst, now)]
+        if chat_id is not None and int(chat_id) < 0:
+            buckets.append(self._bucket(self._groups, chat_id, self.group_rate, self.group_burst, now))
+        return buckets
+
+    async def acquire(self, chat_id, final=False):
+        """
+        انتظار تا مجاز بودن یک فراخوانی برای گفت‌وگو.
+
+        Args:
+            chat_id: شناسه گفت‌وگو
+            final: True برای پیام‌های نهایی (بدون رعایت سهم رزرو)
+
+        Returns:
+            float: مدت انتظار (ثانیه)
+        """
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            buckets = self._buckets_for(chat_id, now)
+
+            wait = self._blocked_until.get(chat_id, 0.0) - now
+            for bucket in buckets:
+                reserve = 0.0 if final else bucket.capacity * self.final_reserve
+                wait = max(wait, bucket.delay(now, reserve))
+
+            if wait <= 0:
+                for bucket in buckets:
+                    bucket.consume(now)
+                self._blocked_until.pop(chat_id, None)
+                waited = now - started
+                self.calls[final] += 1
+                self.wait_total[final] += waited
+                return waited
+
+            # انتظار تا زمان محاسبه‌شده؛ فراخوانی‌های هم‌زمان ممکن است زودتر توکن را بگیرند
+            await asyncio.sleep(wait)
+
+    def penalize(self, chat_id, seconds):
+        """
+        مسدود کردن گفت‌وگو پس از RetryAfter.
+
+        سطل کل ربات فقط وقتی خالی می‌شود که خطا به گفت‌وگوی خاصی مربوط نباشد (chat_id=None)
+        یا دست‌کم global_penalty_chats گفت‌وگو هم‌زمان مسدود باشند.
+        """
+        now = time.monotonic()
+        self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), now + seconds)
+        self.retry_after_count += 1
+        self.retry_after_seconds += seconds
+
+        blocked = sum(1 for until in self._blocked_until.values() if until > now)
+        if chat_id is None or blocked >= self.global_penalty_chats:
+            self.global_bucket.drain(now)
+            self.global_penalties += 1
+
+    async def call(self, chat_id, method, /, *args, final=False, **kwargs):
+        """
+        انجام یک فراخوانی Bot API با رعایت محدودیت‌ها.
+
+        در صورت RetryAfter، فراخوانی حذف نمی‌شود و پس از مدت اعلام‌شده دوباره انجام می‌شود.
+        سایر خطاها بدون تغییر به فراخواننده می‌رسند.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, final)
+            try:
+                return await method(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                self.penalize(chat_id, seconds)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f"محدودیت نرخ تلگرام برای chat_id {chat_id}: تلاش مجدد پس از {seconds} ثانیه")
+
+    def snapshot(self):
+        """
+        دریافت خلاصه آمار.
+
+        Returns:
+            dict: تعداد فراخوانی‌های نهایی و میانی، میانگین انتظار هر کدام (میلی‌ثانیه)،
+                تعداد و مجموع مدت RetryAfter، تعداد خالی شدن سطل کل ربات و تعداد گفت‌وگوهای دارای سطل
+        """
+        def average(final):
+            return (self.wait_total[final] / self.calls[final] * 1000) if self.calls[final] else 0.0
+
+        return {
+            "final_calls": self.calls[True],
+            "intermediate_calls": self.calls[False],
+            "avg_final_wait_ms": average(True),
+            "avg_intermediate_wait_ms": average(False),
+            "retry_after": self.retry_after_count,
+            "retry_after_seconds": self.retry_after_seconds,
+            "global_penalties": self.global_penalties,
+            "tracked_chats": len(self._chats),
+        }
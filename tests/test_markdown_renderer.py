@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from markdown_renderer import StreamingMarkdownRenderer, convert_markdown_to_html
+
+# نمونه‌های ثابت: حالت‌های مرزی نشانگرها و پاسخ‌های رایج مدل‌ها
+FIXTURES = [
+    "",
+    "سلام! چطور می‌توانم کمک کنم؟",
+    "**پررنگ** و *کج* و `کد` و ```\nبلوک کد\n```",
+    "* مورد اول\n* مورد دوم\n* مورد سوم\n",
+    "ضرب 2 * 3 برابر 6 است، و a ** b توان است.",
+    "```python\nprint('<tag> & \"quote\"')\n```\nو یک `inline` کد",
+    "``دو بک‌تیک`` و ````چهار```` و ```` ``` ````",
+    "***سه ستاره*** و **باز بدون بستن",
+    "`باز بدون بستن و **پررنگ** پس از آن",
+    "*کج با `کد` درون* و `کد با *ستاره* درون`",
+    "<script>alert('x')</script> & &amp; \"'",
+    "متن\n\n```\nکد بدون بستن\nخط دوم",
+    "**a**b**c** *d*e*f* `g`h`i`",
+    "این یک پاراگراف با **کلمات مهم** است.\n"
+    "```python\ndef handler(update, context):\n    return {\"ok\": True, \"items\": [1, 2, 3]}\n```\n"
+    "* مورد **اول** از فهرست\n* مورد دوم با `کد`\n"
+    "نکته: مقدار a < b & c > d را بررسی کنید.\n",
+]
+
+FUZZ_ALPHABET = ["`", "``", "```", "*", "**", "a", "ب", " ", "\n", "<", "&"]
+
+
+def split_at_random(text, rnd):
+    """تقسیم متن در نقاط برش تصادفی، به اندازه deltaهای جریانی."""
+    chunks = []
+    position = 0
+    while position < len(text):
+        step = rnd.randint(1, 12)
+        chunks.append(text[position:position + step])
+        position += step
+    return chunks
+
+
+def assert_matches_full_render(text, rnd):
+    """پس از هر بخش، خروجی رندر افزایشی باید با تبدیل کامل متن دریافتی یکسان باشد."""
+    renderer = StreamingMarkdownRenderer()
+    consumed = ""
+    for chunk in split_at_random(text, rnd):
+        renderer.feed(chunk)
+        consumed += chunk
+        assert renderer.render() == convert_markdown_to_html(consumed), consumed
+    assert renderer.render() == convert_markdown_to_html(text)
+
+
+@pytest.mark.parametrize("text", FIXTURES)
+@pytest.mark.parametrize("seed", range(5))
+def test_fixture_matches_full_render(text, seed):
+    assert_matches_full_render(text, random.Random(seed))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_random_text_matches_full_render(seed):
+    rnd = random.Random(seed)
+    for _ in range(200):
+        text = "".join(rnd.choice(FUZZ_ALPHABET) for _ in range(rnd.randint(0, 40)))
+        assert_matches_full_render(text, rnd)
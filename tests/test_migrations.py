@@ -0,0 +1,125 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import SCHEMA_VERSION, apply_migrations, get_schema_version
+
+
+def column_names(conn, table):
+    return [column[1] for column in conn.execute(f"PRAGMA table_info({table})")]
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """پایگاه داده ساخته‌شده پیش از نسخه‌گذاری طرح (بدون displayed و is_premium)."""
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    conn.executescript('''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        id_chat INTEGER NOT NULL,
+        id_user INTEGER NOT NULL,
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        register_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(id_chat, id_user)
+    );
+    CREATE TABLE dialogs (
+        id INTEGER PRIMARY KEY,
+        id_chat INTEGER NOT NULL,
+        id_user INTEGER NOT NULL,
+        number_dialog INTEGER NOT NULL,
+        model TEXT,
+        model_id TEXT,
+        user_ask TEXT,
+        model_answer TEXT,
+        ask_date DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE models (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        created INTEGER,
+        description TEXT,
+        rus_description TEXT,
+        context_length INTEGER,
+        modality TEXT,
+        tokenizer TEXT,
+        instruct_type TEXT,
+        prompt_price TEXT,
+        completion_price TEXT,
+        image_price TEXT,
+        request_price TEXT,
+        provider_context_length INTEGER,
+        is_moderated INTEGER,
+        is_free INTEGER,
+        top_model INTEGER DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO users (id_chat, id_user, first_name) VALUES (10, 1, 'a'), (20, 2, 'b');
+    INSERT INTO dialogs (id_chat, id_user, number_dialog, user_ask) VALUES
+        (10, 1, 1, 'q1'), (10, 1, 3, 'q2'), (20, 2, 2, 'q3');
+    INSERT INTO models (id, name, description, rus_description) VALUES
+        ('m1', 'M1', 'same text', 'ترجمه'),
+        ('m2', 'M2', 'same text', NULL),
+        ('m3', 'M3', NULL, NULL);
+    ''')
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_legacy_database_is_upgraded_to_current_version(legacy_db):
+    assert get_schema_version(legacy_db) == 0
+
+    assert apply_migrations(legacy_db) == SCHEMA_VERSION
+    assert get_schema_version(legacy_db) == SCHEMA_VERSION
+
+    # ستون‌های اضافه‌شده با مقدار پیش‌فرض برای ردیف‌های موجود
+    assert "displayed" in column_names(legacy_db, "dialogs")
+    assert "is_premium" in column_names(legacy_db, "users")
+    assert legacy_db.execute("SELECT DISTINCT displayed FROM dialogs").fetchall() == [(1,)]
+    assert legacy_db.execute("SELECT DISTINCT is_premium FROM users").fetchall() == [(0,)]
+
+    # شمارنده گفت‌وگوها از بیشترین شماره گفت‌وگوی هر کاربر پر می‌شود
+    sequences = dict(legacy_db.execute("SELECT id_user, last_number FROM dialog_sequences"))
+    assert sequences == {1: 3, 2: 2}
+
+    indexes = {row[0] for row in legacy_db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_dialogs_user_dialog", "idx_users_id_user", "idx_models_description_hash"} <= indexes
+
+
+def test_translation_memory_is_backfilled(legacy_db):
+    apply_migrations(legacy_db)
+
+    source_hash = hashlib.sha256("same text".encode("utf-8")).hexdigest()
+    rows = legacy_db.execute(
+        "SELECT id, description_hash, translation_hash FROM models ORDER BY id"
+    ).fetchall()
+    assert rows == [("m1", source_hash, source_hash), ("m2", source_hash, None), ("m3", None, None)]
+    assert legacy_db.execute("SELECT source_hash, translation FROM translation_memory").fetchall() == [
+        (source_hash, "ترجمه")
+    ]
+
+
+def test_up_to_date_database_is_left_unchanged(legacy_db):
+    apply_migrations(legacy_db)
+    legacy_db.execute("INSERT INTO dialog_sequences (id_user, last_number) VALUES (3, 7)")
+    legacy_db.commit()
+
+    assert apply_migrations(legacy_db) == SCHEMA_VERSION
+    assert legacy_db.execute("SELECT last_number FROM dialog_sequences WHERE id_user = 3").fetchone() == (7,)
+
+
+def test_failed_migration_rolls_back_all_pending_migrations(legacy_db, monkeypatch):
+    def broken(cursor):
+        raise sqlite3.OperationalError("broken migration")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:2] + [(3, "broken", broken)])
+
+    with pytest.raises(sqlite3.OperationalError):
+        apply_migrations(legacy_db)
+
+    assert get_schema_version(legacy_db) == 0
+    assert "displayed" not in column_names(legacy_db, "dialogs")
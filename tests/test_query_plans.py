@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+from db_handler import DBHandler
+from history_cache import DialogHistoryCache
+
+# جدول‌هایی که پیمایش کامل آن‌ها مجاز نیست (حتی با COVERING INDEX)
+GUARDED_TABLES = ("dialogs", "users")
+
+# فقط دستورات داده‌ای بررسی می‌شوند (نه DDL و PRAGMA)
+CHECKED_STATEMENTS = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT|WITH)\b", re.IGNORECASE)
+
+SAMPLE_MODEL = {
+    "id": "sample/model:free",
+    "name": "Sample Model",
+    "created": 1700000000,
+    "description": "A sample model",
+    "context_length": 8192,
+    "architecture": {"modality": "text->text", "tokenizer": "Other", "instruct_type": None},
+    "pricing": {"prompt": "0", "completion": "0", "image": "0", "request": "0"},
+    "top_provider": {"context_length": 8192, "is_moderated": False},
+}
+
+# همه متدهای عمومی DBHandler که به پایگاه داده دسترسی دارند؛ dialog شامل شماره و شناسه گفت‌وگوی نمونه است
+CALLS = {
+    "register_user": lambda db, dialog: db.register_user(10, 1, "Test", "User", "tester"),
+    "get_next_dialog_number": lambda db, dialog: db.get_next_dialog_number(1),
+    "log_dialog": lambda db, dialog: db.log_dialog(
+        10, 1, dialog["number"], "Sample Model", SAMPLE_MODEL["id"], "سلام"),
+    "update_model_answer": lambda db, dialog: db.update_model_answer(dialog["id"], "درود"),
+    "get_dialog_history": lambda db, dialog: db.get_dialog_history(1, dialog["number"]),
+    "get_dialog_history_limit": lambda db, dialog: db.get_dialog_history(1, dialog["number"], limit=10),
+    "get_dialog_context": lambda db, dialog: db.get_dialog_context(1, dialog["number"]),
+    "mark_last_message": lambda db, dialog: db.mark_last_message(1, dialog["number"]),
+    "mark_previous_answers_as_inactive": lambda db, dialog: db.mark_previous_answers_as_inactive(dialog["id"]),
+    "set_premium_status": lambda db, dialog: db.set_premium_status(1, True),
+    "is_premium_user": lambda db, dialog: db.is_premium_user(1),
+    "check_user_exists_by_id": lambda db, dialog: db.check_user_exists_by_id(1),
+    "get_user_id_by_username": lambda db, dialog: db.get_user_id_by_username("tester"),
+    "get_user_info": lambda db, dialog: db.get_user_info(1),
+    "save_model": lambda db, dialog: db.save_model(SAMPLE_MODEL),
+    "save_models": lambda db, dialog: db.save_models([SAMPLE_MODEL]),
+    "get_models": lambda db, dialog: db.get_models(),
+    "get_models_filtered": lambda db, dialog: db.get_models(only_free=True, only_top=True),
+    "set_model_description_ru": lambda db, dialog: db.set_model_description_ru(SAMPLE_MODEL["id"], "مدل نمونه"),
+    "update_model_description": lambda db, dialog: db.update_model_description(
+        SAMPLE_MODEL["id"], "مدل نمونه", top_model=True),
+    "clear_top_models": lambda db, dialog: db.clear_top_models(),
+    "get_models_for_translation": lambda db, dialog: db.get_models_for_translation(),
+    "get_models_for_translation_one": lambda db, dialog: db.get_models_for_translation(SAMPLE_MODEL["id"]),
+}
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    """پایگاه داده با یک کاربر، یک گفت‌وگو و یک مدل نمونه."""
+    path = tmp_path_factory.mktemp("plans") / "plans.db"
+    db = DBHandler(str(path), history_cache=DialogHistoryCache(len))
+    db.register_user(10, 1, "Test", "User", "tester")
+    db.save_model(SAMPLE_MODEL)
+    number = db.get_next_dialog_number(1)
+    dialog_id = db.log_dialog(10, 1, number, "Sample Model", SAMPLE_MODEL["id"], "سلام")
+    db.flush()
+    yield db, {"number": number, "id": dialog_id}
+    db.close()
+
+
+def find_scans(conn, statement):
+    """بازگرداندن خطوط طرح اجرا که جدول‌های محافظت‌شده را پیمایش می‌کنند."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+    return [row[-1] for row in plan
+            if any(re.match(rf"SCAN (TABLE )?{table}\b", row[-1]) for table in GUARDED_TABLES)]
+
+
+def trace_statements(db, call, dialog):
+    """اجرای call و بازگرداندن دستورات داده‌ای اجراشده روی اتصال نوشتن و اتصال خواندن."""
+    statements = []
+    connections = (db.conn, db.get_read_connection())
+    for conn in connections:
+        conn.set_trace_callback(statements.append)
+    try:
+        call(db, dialog)
+        db.flush()
+    finally:
+        for conn in connections:
+            conn.set_trace_callback(None)
+
+    normalized = (" ".join(statement.split()) for statement in statements)
+    return [statement for statement in dict.fromkeys(normalized) if CHECKED_STATEMENTS.match(statement)]
+
+
+@pytest.mark.parametrize("name", CALLS)
+def test_query_plan_has_no_full_scan(seeded, name):
+    db, dialog = seeded
+    statements = trace_statements(db, CALLS[name], dialog)
+    assert statements, f"{name} هیچ پرس‌وجویی اجرا نکرد"
+
+    failures = {statement: find_scans(db.conn, statement) for statement in statements}
+    failures = {statement: scans for statement, scans in failures.items() if scans}
+    assert not failures, f"پیمایش کامل جدول در {name}: {failures}"
+
+
+def test_find_scans_flags_covering_index_scan(tmp_path):
+    """پیمایش کامل با COVERING INDEX هم باید به عنوان خطا شناسایی شود."""
+    db = DBHandler(str(tmp_path / "scan.db"), history_cache=DialogHistoryCache(len))
+    try:
+        assert find_scans(db.conn, "SELECT COUNT(*) FROM dialogs")
+        assert find_scans(db.conn, "SELECT id_user FROM users")
+    finally:
+        db.close()
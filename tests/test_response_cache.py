@@ -0,0 +1,117 @@
+import asyncio
+import types
+
+import response_cache
+from response_cache import ResponseCache
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def follow_all(cache, flight, count):
+    """شروع count دنبال‌کننده و بازگرداندن وظیفه‌ها و فریم‌های دریافتی آن‌ها."""
+    frames = [[] for _ in range(count)]
+    tasks = []
+    for index in range(count):
+        async def on_frame(frame, received=frames[index]):
+            received.append(frame)
+        joined, leader = cache.join(flight.key)
+        assert joined is flight and not leader
+        tasks.append(asyncio.create_task(cache.follow(flight, asyncio.Event(), on_frame)))
+    # فرصت شروع انتظار به دنبال‌کننده‌ها
+    await asyncio.sleep(0.01)
+    return tasks, frames
+
+
+def test_followers_receive_frames_and_final_text():
+    async def scenario():
+        cache = ResponseCache()
+        key = cache.key("model", [{"role": "user", "content": "hi"}])
+        flight, leader = cache.join(key)
+        assert leader
+
+        tasks, frames = await follow_all(cache, flight, 3)
+        flight.publish("partial")
+        await asyncio.sleep(0.01)
+        cache.complete(flight, "final")
+
+        assert await asyncio.gather(*tasks) == ["final"] * 3
+        assert frames == [["partial"]] * 3
+        assert cache.get(key) == "final"
+        return cache.snapshot()
+
+    stats = run(scenario())
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 3
+    assert stats["in_flight"] == 0
+
+
+def test_leader_failure_releases_followers_without_caching():
+    async def scenario():
+        cache = ResponseCache()
+        key = cache.key("model", [{"role": "user", "content": "hi"}])
+        flight, _ = cache.join(key)
+        tasks, _ = await follow_all(cache, flight, 3)
+
+        cache.abandon(flight)
+        results = await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+
+        # نتیجه‌ای ذخیره نمی‌شود و درخواست بعدی خودش مسئول تولید است
+        assert cache.get(key) is None
+        _, leader = cache.join(key)
+        return results, leader, cache.snapshot()
+
+    results, leader, stats = run(scenario())
+    assert results == [None, None, None]
+    assert leader
+    assert stats["entries"] == 0
+    assert stats["hits"] == 0
+
+
+def test_canceled_follower_stops_waiting():
+    async def scenario():
+        cache = ResponseCache()
+        flight, _ = cache.join("key")
+        cache.join("key")
+        cancel_event = asyncio.Event()
+
+        async def on_frame(frame):
+            pass
+
+        task = asyncio.create_task(cache.follow(flight, cancel_event, on_frame))
+        await asyncio.sleep(0.01)
+        cancel_event.set()
+        return await asyncio.wait_for(task, timeout=1), flight.done
+
+    assert run(scenario()) == (None, False)
+
+
+def test_key_ignores_whitespace_differences():
+    first = ResponseCache.key("model", [{"role": "user", "content": "hello   world\n"}])
+    second = ResponseCache.key("model", [{"role": "user", "content": " hello world"}])
+    other_model = ResponseCache.key("other", [{"role": "user", "content": "hello world"}])
+
+    assert first == second
+    assert first != other_model
+
+
+def test_expired_and_evicted_entries_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+
+    cache = ResponseCache(ttl=10, max_entries=2)
+    for key in ("a", "b"):
+        flight, _ = cache.join(key)
+        cache.complete(flight, key.upper())
+
+    # دسترسی به a آن را تازه‌ترین مورد می‌کند؛ با افزودن c، مورد b حذف می‌شود
+    assert cache.get("a") == "A"
+    flight, _ = cache.join("c")
+    cache.complete(flight, "C")
+    assert cache.get("b") is None
+    assert cache.snapshot()["evictions"] == 1
+
+    now[0] += 10
+    assert cache.get("a") is None
+    assert cache.get("c") is None
@@ -0,0 +1,137 @@
+import json
+import random
+
+import pytest
+
+from sse_decoder import DELTA, DONE, ERROR, USAGE, SSEDecoder
+
+CONTENTS = [
+    "سلام", "**مهم**", "`code`", "hello world", "\"quoted\"", "back\\slash", "line\nbreak", "tab\t",
+    "😀 emoji", "<tag>", "‌", "content: \"nested\"",
+]
+
+
+def reference(data):
+    """روش مرجع: رمزگشایی کامل بدنه و json.loads هر خط data:."""
+    parts = []
+    usage = None
+    errors = []
+    for line in data.decode("utf-8").split("\n"):
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        if not payload:
+            continue
+        data_obj = json.loads(payload)
+        choices = data_obj.get("choices")
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                parts.append(content)
+        if data_obj.get("error"):
+            errors.append(data_obj["error"])
+        if data_obj.get("usage"):
+            usage = data_obj["usage"]
+    return "".join(parts), usage, errors
+
+
+def decode(packets):
+    """رمزگشایی بخش‌به‌بخش با SSEDecoder."""
+    decoder = SSEDecoder()
+    parts = []
+    usage = None
+    errors = []
+    events = []
+    for packet in packets:
+        events.extend(decoder.feed(packet))
+    events.extend(decoder.close())
+    for event in events:
+        if event.kind == DONE:
+            break
+        if event.kind == DELTA:
+            parts.append(event.value)
+        elif event.kind == USAGE:
+            usage = event.value
+        elif event.kind == ERROR:
+            errors.append(event.value)
+    return "".join(parts), usage, errors
+
+
+def make_stream(rnd, events=200):
+    """جریان مصنوعی با قالب پاسخ‌های اوپن‌روتر، شامل keep-alive، استدلال و content خالی."""
+    lines = [b": OPENROUTER PROCESSING\n\n"]
+    for index in range(events):
+        if index % 25 == 0:
+            lines.append(b": OPENROUTER PROCESSING\n\n")
+        delta = {"role": "assistant", "content": rnd.choice(CONTENTS)}
+        if index % 17 == 0:
+            delta = {"role": "assistant", "content": None, "reasoning": "thinking"}
+        elif index % 13 == 0:
+            delta = {"role": "assistant", "content": ""}
+        chunk = {"id": "gen-1", "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        separators = (",", ":") if index % 2 else (", ", ": ")
+        lines.append(b"data: " + json.dumps(chunk, ensure_ascii=index % 3 == 0, separators=separators).encode() + b"\n\n")
+
+    final = {"id": "gen-1", "choices": [{"index": 0, "delta": {"content": ""}, "finish_reason": "stop"}],
+             "usage": {"prompt_tokens": 10, "completion_tokens": events, "total_tokens": events + 10}}
+    lines.append(b"data: " + json.dumps(final).encode() + b"\n\n")
+    lines.append(b"data: [DONE]\n\n")
+    return b"".join(lines)
+
+
+def split_packets(data, rnd, low=1, high=512):
+    """تقسیم بایت‌ها با مرزهای تصادفی (ممکن است وسط کاراکتر چندبایتی باشند)."""
+    packets = []
+    position = 0
+    while position < len(data):
+        step = rnd.randint(low, high)
+        packets.append(data[position:position + step])
+        position += step
+    return packets
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_reference_for_random_packet_boundaries(seed):
+    rnd = random.Random(seed)
+    data = make_stream(rnd)
+
+    expected = reference(data)
+    assert decode(split_packets(data, rnd)) == expected
+    assert decode(split_packets(data, rnd, 1, 3)) == expected
+    assert decode([data]) == expected
+
+
+def test_usage_and_error_events_use_full_parse():
+    data = (
+        b'data: {"choices":[{"delta":{"content":"hi"}}]}\n\n'
+        b'data: {"error":{"code":502,"message":"upstream"},"choices":[{"delta":{"content":""}}]}\n\n'
+        b'data: {"choices":[],"usage":{"prompt_tokens":1,"completion_tokens":2}}\n\n'
+    )
+    decoder = SSEDecoder()
+    events = decoder.feed(data)
+
+    assert [(event.kind, event.value) for event in events] == [
+        (DELTA, "hi"),
+        (ERROR, {"code": 502, "message": "upstream"}),
+        (USAGE, {"prompt_tokens": 1, "completion_tokens": 2}),
+    ]
+    assert decoder.fast_path == 1
+    assert decoder.slow_path == 2
+
+
+def test_last_line_without_newline_is_decoded_on_close():
+    decoder = SSEDecoder()
+    assert decoder.feed(b'data: {"choices":[{"delta":{"content":"tail"}}]}') == []
+
+    events = decoder.close()
+    assert [(event.kind, event.value) for event in events] == [(DELTA, "tail")]
+
+
+def test_comments_and_invalid_json_produce_no_events():
+    decoder = SSEDecoder()
+    events = decoder.feed(b": keep-alive\n\ndata: {not json}\n\ndata: [DONE]\n\n")
+
+    assert [event.kind for event in events] == [DONE]
@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import httpx
+
+import config
+import openrouterbot
+
+
+def sse_response(parts):
+    """پاسخ جریانی اوپن‌روتر با بخش‌های متنی داده‌شده."""
+    async def body():
+        for part in parts:
+            yield b"data: " + json.dumps({"choices": [{"delta": {"content": part}}]}).encode() + b"\n\n"
+        yield b"data: [DONE]\n\n"
+    return httpx.Response(200, content=body())
+
+
+def drain(update_queue):
+    updates = []
+    while not update_queue.empty():
+        updates.append(update_queue.get_nowait())
+    return updates
+
+
+def test_waiting_for_a_slot_does_not_count_as_idle_time(monkeypatch):
+    monkeypatch.setattr(config, "STREAM_IDLE_TIMEOUT", 0.1)
+    monkeypatch.setattr(config, "STREAM_MAX_DURATION", 0.3)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return sse_response(["سلام", " دنیا"])
+
+    async def scenario():
+        async def acquire_slot():
+            # انتظار در صف زمان‌بند بیش از idle_timeout و max_duration
+            await asyncio.sleep(0.4)
+
+        update_queue = asyncio.Queue()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await openrouterbot.stream_ai_response(
+                client, "model", "hi", update_queue, 1, 1, asyncio.Event(), {"acquire_slot": acquire_slot}
+            )
+        return drain(update_queue)
+
+    updates = asyncio.run(scenario())
+
+    assert len(requests) == 1
+    final = updates[-1]
+    assert final["is_final"]
+    assert not final.get("was_canceled")
+    assert final["text"] == "سلام دنیا"
@@ -0,0 +1,37 @@
+from translation_job import parse_batch_translations
+
+
+def test_parses_plain_json_array():
+    text = '[{"id": 0, "translation": "یک"}, {"id": 1, "translation": "دو"}]'
+    assert parse_batch_translations(text, 2) == {0: "یک", 1: "دو"}
+
+
+def test_parses_array_inside_code_block_and_surrounding_text():
+    text = 'ترجمه‌ها:\n```json\n[{"id": 1, "translation": " دو "}]\n```\nپایان'
+    assert parse_batch_translations(text, 2) == {1: "دو"}
+
+
+def test_accepts_numeric_string_ids():
+    assert parse_batch_translations('[{"id": "0", "translation": "یک"}]', 1) == {0: "یک"}
+
+
+def test_skips_invalid_members():
+    text = '''[
+        {"id": 0, "translation": "یک"},
+        {"id": 0, "translation": "تکراری"},
+        {"id": 5, "translation": "خارج از محدوده"},
+        {"id": -1, "translation": "منفی"},
+        {"id": 1, "translation": "   "},
+        {"id": 2, "translation": null},
+        {"translation": "بدون شناسه"},
+        "متن",
+        {"id": 3, "translation": "سه"}
+    ]'''
+    assert parse_batch_translations(text, 4) == {0: "یک", 3: "سه"}
+
+
+def test_invalid_response_returns_empty_dict():
+    assert parse_batch_translations("متأسفم، نمی‌توانم ترجمه کنم.", 2) == {}
+    assert parse_batch_translations('[{"id": 0, "translation": "یک"', 2) == {}
+    assert parse_batch_translations('{"id": 0, "translation": "یک"}', 1) == {}
+    assert parse_batch_translations("] [", 1) == {}
@@ -0,0 +1,165 @@
+"""
+بنچمارک و بررسی درستی رندر افزایشی Markdown.
+
+ابتدا بررسی می‌شود که خروجی StreamingMarkdownRenderer در هر نقطه برش با خروجی
+convert_markdown_to_html روی کل متن یکسان باشد (نمونه‌های ثابت و متن‌های تصادفی).
+سپس پخش جریانی پاسخ‌هایی با طول‌های مختلف شبیه‌سازی می‌شود: در هر «تیک» به‌روزرسانی،
+روش قبلی کل متن را دوباره تبدیل می‌کند و رندر افزایشی فقط بخش تازه را.
+
+استفاده:
+    python tools/bench_markdown_renderer.py --sizes 4000 10000 25000 50000 --fuzz 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_renderer import StreamingMarkdownRenderer, convert_markdown_to_html
+
+# نمونه‌های ثابت: حالت‌های مرزی نشانگرها و پاسخ‌های رایج مدل‌ها
+FIXTURES = [
+    "",
+    "سلام! چطور می‌توانم کمک کنم؟",
+    "**پررنگ** و *کج* و `کد` و ```\nبلوک کد\n```",
+    "* مورد اول\n* مورد دوم\n* مورد سوم\n",
+    "ضرب 2 * 3 برابر 6 است، و a ** b توان است.",
+    "```python\nprint('<tag> & \"quote\"')\n```\nو یک `inline` کد",
+    "``دو بک‌تیک`` و ````چهار```` و ```` ``` ````",
+    "***سه ستاره*** و **باز بدون بستن",
+    "`باز بدون بستن و **پررنگ** پس از آن",
+    "*کج با `کد` درون* و `کد با *ستاره* درون`",
+    "<script>alert('x')</script> & &amp; \"'",
+    "متن\n\n```\nکد بدون بستن\nخط دوم",
+    "**a**b**c** *d*e*f* `g`h`i`",
+]
+
+# قطعه‌های سازنده پاسخ‌های مصنوعی
+PARAGRAPHS = [
+    "این یک پاراگراف توضیحی با **کلمات مهم** و *تأکید* است. ",
+    "برای اجرای دستور از `pip install httpx` استفاده کنید. ",
+    "نکته: مقدار a < b & c > d را بررسی کنید. ",
+    "رابطه x * y = z برای همه مقادیر برقرار است. ",
+]
+CODE_BLOCK = "```python\ndef handler(update, context):\n    return {\"ok\": True, \"items\": [1, 2, 3]}\n```\n"
+LIST_ITEMS = "* مورد **اول** از فهرست\n* مورد دوم با `کد`\n"
+
+
+def make_answer(size, rnd):
+    """ساخت یک پاسخ مصنوعی شبیه پاسخ مدل با طول تقریبی size."""
+    parts = []
+    length = 0
+    while length < size:
+        choice = rnd.random()
+        if choice < 0.2:
+            part = CODE_BLOCK * rnd.randint(1, 4)
+        elif choice < 0.35:
+            part = LIST_ITEMS
+        else:
+            part = rnd.choice(PARAGRAPHS) + "\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)[:size]
+
+
+def split_chunks(text, rnd):
+    """تقسیم متن به بخش‌هایی به اندازه deltaهای جریانی."""
+    chunks = []
+    position = 0
+    while position < len(text):
+        step = rnd.randint(1, 12)
+        chunks.append(text[position:position + step])
+        position += step
+    return chunks
+
+
+def check_identity(text, rnd, every=1):
+    """بررسی یکسان بودن خروجی رندر افزایشی با تبدیل کامل پس از هر every بخش."""
+    renderer = StreamingMarkdownRenderer()
+    consumed = ""
+    for index, chunk in enumerate(split_chunks(text, rnd) or [""]):
+        renderer.feed(chunk)
+        consumed += chunk
+        if index % every == 0 and renderer.render() != convert_markdown_to_html(consumed):
+            return consumed
+    if renderer.render() != convert_markdown_to_html(consumed):
+        return consumed
+    return None
+
+
+def run_checks(args):
+    """بررسی درستی روی نمونه‌های ثابت، پاسخ‌های مصنوعی و متن‌های تصادفی."""
+    rnd = random.Random(args.seed)
+    failures = 0
+
+    corpus = list(FIXTURES) + [make_answer(size, rnd) for size in args.sizes]
+    for text in corpus:
+        mismatch = check_identity(text, rnd)
+        if mismatch is not None:
+            failures += 1
+            print(f"عدم تطابق: {mismatch[-80:]!r}")
+
+    alphabet = ["`", "``", "```", "*", "**", "a", "ب", " ", "\n", "<", "&"]
+    for _ in range(args.fuzz):
+        text = "".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40)))
+        mismatch = check_identity(text, rnd)
+        if mismatch is not None:
+            failures += 1
+            print(f"عدم تطابق: {mismatch!r}")
+
+    print(f"بررسی درستی: {len(corpus)} نمونه و {args.fuzz} متن تصادفی، {failures} عدم تطابق")
+    return failures == 0
+
+
+def bench_size(size, args, rnd):
+    """زمان رندر کل پخش یک پاسخ با روش قبلی و رندر افزایشی."""
+    text = make_answer(size, rnd)
+    chunks = split_chunks(text, rnd)
+
+    # روش قبلی: تبدیل کل متن در هر تیک
+    start = time.perf_counter()
+    full_response = ""
+    for index, chunk in enumerate(chunks):
+        full_response += chunk
+        if index % args.tick == 0:
+            convert_markdown_to_html(full_response)
+    convert_markdown_to_html(full_response)
+    full_time = time.perf_counter() - start
+
+    # رندر افزایشی
+    start = time.perf_counter()
+    renderer = StreamingMarkdownRenderer()
+    for index, chunk in enumerate(chunks):
+        renderer.feed(chunk)
+        if index % args.tick == 0:
+            renderer.render()
+    renderer.render()
+    incremental_time = time.perf_counter() - start
+
+    return len(chunks), full_time, incremental_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک رندر افزایشی Markdown")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4000, 10000, 25000, 50000],
+                        help="طول پاسخ‌ها (کاراکتر)")
+    parser.add_argument("--tick", type=int, default=5, help="تعداد بخش‌های دریافتی بین دو به‌روزرسانی")
+    parser.add_argument("--fuzz", type=int, default=20000, help="تعداد متن‌های تصادفی برای بررسی درستی")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if not run_checks(args):
+        sys.exit(1)
+
+    rnd = random.Random(args.seed)
+    print(f"{'طول':>8} {'بخش‌ها':>8} {'کامل (ms)':>12} {'افزایشی (ms)':>14} {'افزایش سرعت':>12}")
+    for size in args.sizes:
+        chunks, full_time, incremental_time = bench_size(size, args, rnd)
+        print(f"{size:>8} {chunks:>8} {full_time * 1000:>12.1f} {incremental_time * 1000:>14.1f} "
+              f"{full_time / incremental_time:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
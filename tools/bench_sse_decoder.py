@@ -0,0 +1,163 @@
+"""
+بنچمارک رمزگشای SSE روی جریان‌های ضبط‌شده یا مصنوعی اوپن‌روتر.
+
+روش قبلی (رمزگشایی هر خط به str و json.loads هر خط data:) با SSEDecoder مقایسه می‌شود.
+بایت‌های جریان در بخش‌هایی با اندازه تصادفی (مانند بسته‌های شبکه) به هر دو روش داده
+می‌شوند؛ پیش از اندازه‌گیری بررسی می‌شود که متن و usage استخراج‌شده یکسان باشند.
+
+استفاده:
+    python tools/bench_sse_decoder.py --events 20000 --rounds 5
+    python tools/bench_sse_decoder.py --file recorded_stream.txt
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse_decoder import DELTA, DONE, USAGE, SSEDecoder
+
+WORDS = ["سلام", "مدل", "پاسخ", "**مهم**", "`code`", "hello", "world", "\"quoted\"", "<tag>", "\\n", "😀"]
+
+
+def make_stream(events, rnd):
+    """ساخت یک جریان SSE مصنوعی با قالب پاسخ‌های اوپن‌روتر."""
+    lines = [b": OPENROUTER PROCESSING\n\n"]
+    for index in range(events):
+        if index % 50 == 0:
+            # پیام‌های keep-alive در میانه جریان
+            lines.append(b": OPENROUTER PROCESSING\n\n")
+        content = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4)))
+        chunk = {
+            "id": "gen-1700000000-abcdefghijklmnop",
+            "provider": "Example",
+            "model": "example/model:free",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": content},
+                         "finish_reason": None, "logprobs": None}],
+        }
+        lines.append(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+
+    final = {
+        "id": "gen-1700000000-abcdefghijklmnop",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": events, "total_tokens": events + 120},
+    }
+    lines.append(b"data: " + json.dumps(final).encode() + b"\n\n")
+    lines.append(b"data: [DONE]\n\n")
+    return b"".join(lines)
+
+
+def split_packets(data, rnd):
+    """تقسیم بایت‌ها به بخش‌هایی با اندازه تصادفی (مرزها ممکن است وسط کاراکتر باشند)."""
+    packets = []
+    position = 0
+    while position < len(data):
+        step = rnd.randint(64, 4096)
+        packets.append(data[position:position + step])
+        position += step
+    return packets
+
+
+def baseline(packets):
+    """روش قبلی: رمزگشایی خطوط به str و تجزیه کامل JSON هر خط data:."""
+    parts = []
+    usage = None
+    events = 0
+    buffer = ""
+    pending = b""
+    for packet in packets:
+        # مشابه aiter_lines: رمزگشایی افزایشی و تقسیم خطوط
+        pending += packet
+        try:
+            text = pending.decode("utf-8")
+            pending = b""
+        except UnicodeDecodeError as e:
+            text = pending[:e.start].decode("utf-8")
+            pending = pending[e.start:]
+        buffer += text
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                return "".join(parts), usage, events
+            data_obj = json.loads(data)
+            events += 1
+            choices = data_obj.get("choices")
+            if choices:
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    parts.append(content)
+            if "usage" in data_obj:
+                usage = data_obj["usage"]
+    return "".join(parts), usage, events
+
+
+def decode(packets):
+    """رمزگشایی با SSEDecoder."""
+    decoder = SSEDecoder()
+    parts = []
+    usage = None
+    for packet in packets:
+        for event in decoder.feed(packet):
+            if event.kind == DELTA:
+                parts.append(event.value)
+            elif event.kind == USAGE:
+                usage = event.value
+            elif event.kind == DONE:
+                return "".join(parts), usage, decoder
+    return "".join(parts), usage, decoder
+
+
+def measure(func, packets, rounds):
+    """کمترین زمان اجرای func در چند دور."""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func(packets)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک رمزگشای SSE")
+    parser.add_argument("--events", type=int, default=20000, help="تعداد بخش‌های جریان مصنوعی")
+    parser.add_argument("--file", help="فایل جریان ضبط‌شده (بایت‌های خام بدنه پاسخ)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = make_stream(args.events, rnd)
+    packets = split_packets(data, rnd)
+
+    # بررسی یکسان بودن خروجی دو روش
+    expected_text, expected_usage, events = baseline(packets)
+    text, usage, decoder = decode(packets)
+    if text != expected_text or usage != expected_usage:
+        print("خروجی رمزگشا با روش قبلی یکسان نیست")
+        sys.exit(1)
+
+    megabytes = len(data) / (1024 * 1024)
+    print(f"جریان: {len(data)} بایت، {events} رویداد، {len(packets)} بخش شبکه")
+    print(f"مسیر سریع: {decoder.fast_path}، تجزیه کامل: {decoder.slow_path}")
+    print(f"{'روش':<12} {'MB/s':>10} {'µs/رویداد':>12}")
+    for name, func in (("قبلی", baseline), ("SSEDecoder", decode)):
+        elapsed = measure(func, packets, args.rounds)
+        print(f"{name:<12} {megabytes / elapsed:>10.1f} {elapsed / events * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
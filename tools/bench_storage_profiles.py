@@ -0,0 +1,82 @@
+"""
+بنچمارک پروفایل‌های ذخیره‌سازی SQLite روی یک جدول گفت‌وگوی مصنوعی.
+
+هر «نوبت» گفت‌وگو همان الگوی ربات را شبیه‌سازی می‌کند:
+ثبت کاربر، ثبت پرسش، خواندن تاریخچه و ذخیره پاسخ مدل.
+
+استفاده:
+    python tools/bench_storage_profiles.py --turns 2000 --users 50 --threads 8
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_handler import DBHandler, STORAGE_PROFILES
+
+
+def run_turns(db, users, turns, seed):
+    """اجرای تعدادی نوبت گفت‌وگو برای کاربران تصادفی."""
+    rnd = random.Random(seed)
+    for _ in range(turns):
+        user_id = rnd.randrange(users) + 1
+        db.register_user(user_id, user_id, "Bench", "User", f"user{user_id}")
+        dialog_id = db.log_dialog(user_id, user_id, 1, "bench", "bench/model", "سلام " * rnd.randint(5, 50))
+        db.get_dialog_history(user_id, 1)
+        db.update_model_answer(dialog_id, "پاسخ " * rnd.randint(20, 200))
+
+
+def bench_profile(profile, args, directory):
+    """اجرای بنچمارک برای یک پروفایل و بازگرداندن تعداد نوبت در ثانیه."""
+    path = os.path.join(directory, f"bench_{profile}.db")
+    db = DBHandler(path, storage_profile=profile, write_behind=args.write_behind)
+
+    # پر کردن اولیه جدول گفت‌وگوها
+    run_turns(db, args.users, args.warmup, seed=0)
+
+    per_thread = args.turns // args.threads
+    threads = [
+        threading.Thread(target=run_turns, args=(db, args.users, per_thread, i + 1))
+        for i in range(args.threads)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush()
+    elapsed = time.perf_counter() - start
+
+    db.close()
+    return per_thread * args.threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=2000, help="تعداد کل نوبت‌های اندازه‌گیری‌شده")
+    parser.add_argument("--warmup", type=int, default=500, help="تعداد نوبت‌های پر کردن اولیه")
+    parser.add_argument("--users", type=int, default=50, help="تعداد کاربران مصنوعی")
+    parser.add_argument("--threads", type=int, default=4, help="تعداد جریان‌های هم‌زمان")
+    parser.add_argument("--write-behind", action="store_true", help="فعال‌سازی نویسنده دسته‌ای")
+    parser.add_argument("--profile", action="append", choices=sorted(STORAGE_PROFILES),
+                        help="پروفایل برای اجرا (پیش‌فرض: همه)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        for profile in args.profile or list(STORAGE_PROFILES):
+            rate = bench_profile(profile, args, directory)
+            print(f"{profile:>14}: {rate:10.1f} turns/sec")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import httpx
+
+from openrouter_stream import OpenRouterAPIError, complete_chat
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+TRANSLATION_PROMPT = """توضیحات زیر مدل هوش مصنوعی را از انگلیسی به پارسی ترجمه کنید.
+فرمت‌بندی و اصطلاحات فنی را حفظ کنید، اما متن را برای کاربران پارسی‌زبان قابل فهم کنید:
+
+{description}"""
+
+BATCH_TRANSLATION_PROMPT = """توضیحات مدل‌های هوش مصنوعی در آرایه JSON زیر را از انگلیسی به پارسی ترجمه کنید.
+فرمت‌بندی و اصطلاحات فنی را حفظ کنید، اما متن را برای کاربران پارسی‌زبان قابل فهم کنید.
+فقط یک آرایه JSON برگردانید، بدون هیچ متن دیگری، به شکل [{{"id": 0, "translation": "..."}}]،
+با یک عضو برای هر id ورودی:
+
+{items}"""
+
+# سهم طول زمینه مدل ترجمه که به متن ورودی یک دسته اختصاص می‌یابد؛
+# بقیه برای دستورالعمل و پاسخ (که معمولاً از ورودی طولانی‌تر است) باقی می‌ماند
+BATCH_CONTEXT_SHARE = 0.3
+
+
+def parse_batch_translations(text, count):
+    """
+    استخراج ترجمه‌ها از پاسخ دسته‌ای.
+
+    Args:
+        text: پاسخ مدل (آرایه JSON، احتمالاً درون بلوک کد)
+        count: تعداد توضیحات ارسال‌شده در دسته
+
+    Returns:
+        dict: {اندیس: ترجمه} فقط برای اعضای معتبر؛ در صورت نامعتبر بودن کل پاسخ، دیکشنری خالی
+    """
+    start = text.find("[")
+    end = text.rfind("]")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    translations = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        translation = item.get("translation")
+        if isinstance(index, str) and index.isdigit():
+            index = int(index)
+        if (isinstance(index, int) and 0 <= index < count and index not in translations
+                and isinstance(translation, str) and translation.strip()):
+            translations[index] = translation.strip()
+    return translations
+
+
+class TranslationJob:
+    """
+    کار پس‌زمینه ترجمه توضیحات مدل‌ها با موازی‌سازی محدود.
+
+    پیشرفت کار در جدول‌های translation_jobs و translation_items ثبت می‌شود، بنابراین پس از
+    راه‌اندازی مجدد ربات فقط مدل‌های ترجمه‌نشده دوباره ترجمه می‌شوند. در خطاهای موقتی
+    (429 و 5xx یا خطای شبکه) با فاصله نمایی تلاش مجدد می‌شود و اگر مدل ترجمه پاسخ ندهد،
+    مدل رایگان بعدی جایگزین آن می‌شود.
+
+    در حالت دسته‌ای (batch_size > 1) چند توضیح، تا سهمی از طول زمینه مدل ترجمه، در یک
+    درخواست ارسال و ترجمه‌ها به صورت آرایه JSON دریافت می‌شوند؛ توضیحاتی که ترجمه معتبری
+    در پاسخ ندارند جداگانه ترجمه می‌شوند.
+
+    مثال:
+        job = TranslationJob(async_db, client, job_id, total, first_model,
+                             next_model=lambda model: get_next_free_model(catalog, model))
+        application.create_task(job.run())
+    """
+
+    def __init__(self, db, client, job_id, total, model, next_model, concurrency=3, max_retries=5,
+                 base_delay=2.0, max_delay=60.0, max_rotations=3, on_progress=None, progress_interval=5.0,
+                 batch_size=1, context_length=None, estimate_tokens=None):
+        """
+        Args:
+            db: نمونه AsyncDBHandler
+            client: نمونه httpx.AsyncClient
+            job_id: شناسه کار ترجمه در پایگاه داده
+            total: تعداد کل مدل‌های این کار
+            model: مدل اولیه برای ترجمه
+            next_model: تابعی که مدل فعلی را گرفته و مدل رایگان بعدی را برمی‌گرداند
+            concurrency: حداکثر تعداد ترجمه‌های هم‌زمان
+            max_retries: حداکثر تلاش مجدد برای خطاهای موقتی با هر مدل
+            base_delay: فاصله اولین تلاش مجدد (ثانیه)؛ هر بار دو برابر می‌شود
+            max_delay: بیشترین فاصله تلاش مجدد (ثانیه)
+            max_rotations: حداکثر تعداد تعویض مدل برای هر توضیح پیش از ثبت شکست
+            on_progress: تابع async که با خلاصه وضعیت (snapshot) فراخوانی می‌شود
+            progress_interval: حداقل فاصله میان دو گزارش پیشرفت (ثانیه)
+            batch_size: حداکثر تعداد توضیحات در یک درخواست (۱ = بدون دسته‌بندی)
+            context_length: تابعی که شناسه مدل را گرفته و طول زمینه آن را برمی‌گرداند (یا None)
+            estimate_tokens: تابع تخمین تعداد توکن‌های یک متن
+        """
+        self.db = db
+        self.client = client
+        self.job_id = job_id
+        self.total = total
+        self.model = model
+        self.next_model = next_model
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_rotations = max_rotations
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.batch_size = max(1, batch_size)
+        self.context_length = context_length
+        self.estimate_tokens = estimate_tokens or (lambda text: len(text) // 3)
+
+        # آمار
+        self.done = 0
+        self.failed = 0
+        self.retries = 0
+        self.rotations = 0
+        self.requests = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.running = False
+        self.started_at = None
+        self._last_progress = 0.0
+
+    def _backoff(self, attempt, error=None):
+        """فاصله تلاش مجدد: نمایی با نوسان تصادفی، یا مدت پیشنهادی سرور در صورت وجود."""
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            return min(self.max_delay, retry_after)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _rotate(self, failed_model):
+        """جایگزینی مدل ترجمه با مدل رایگان بعدی (فقط یک بار برای هر مدل ناموفق)."""
+        if self.model != failed_model:
+            # کارگر دیگری مدل را عوض کرده است
+            return
+        next_model = self.next_model(failed_model)
+        if next_model and next_model != failed_model:
+            self.model = next_model
+            self.rotations += 1
+            logger.info(f"مدل برای ترجمه تغییر کرد به: {next_model}")
+
+    async def _request(self, prompt):
+        """
+        ارسال یک درخواست ترجمه با تلاش مجدد و تعویض مدل.
+
+        Returns:
+            (str یا None, int, str یا None): پاسخ مدل، تعداد تلاش‌ها و آخرین خطا
+        """
+        messages = [{"role": "user", "content": prompt}]
+        attempts = 0
+        last_error = None
+        for _ in range(self.max_rotations + 1):
+            model = self.model
+            for attempt in range(self.max_retries + 1):
+                attempts += 1
+                self.requests += 1
+                try:
+                    return await complete_chat(self.client, model, messages), attempts, None
+                except OpenRouterAPIError as e:
+                    last_error = str(e)
+                    if not e.retryable:
+                        break
+                    delay = self._backoff(attempt, e)
+                except httpx.HTTPError as e:
+                    last_error = f"{type(e).__name__}: {e}"
+                    delay = self._backoff(attempt)
+
+                if attempt < self.max_retries:
+                    self.retries += 1
+                    logger.warning(f"خطای موقت در ترجمه با مدل {model}: {last_error}؛ تلاش مجدد پس از {delay:.1f} ثانیه")
+                    await asyncio.sleep(delay)
+
+            self._rotate(model)
+        return None, attempts, last_error
+
+    async def _report(self, force=False):
+        """گزارش پیشرفت با فاصله حداقل progress_interval."""
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        try:
+            await self.on_progress(self.snapshot())
+        except Exception as e:
+            logger.error(f"خطا در گزارش پیشرفت ترجمه: {e}")
+
+    async def _store(self, model_id, translated, attempts, error=None):
+        """
+        ذخیره نتیجه ترجمه یک مدل (یا ثبت شکست آن).
+
+        نتیجه برای مدل‌های در انتظار با توضیحات یکسان نیز ثبت و در آمار شمرده می‌شود.
+        """
+        count = await self.db.save_translation(self.job_id, model_id, translated, attempts) if translated else False
+        if count is not False:
+            self.done += count
+            logger.info(f"ترجمه برای مدل {model_id} با موفقیت ذخیره شد ({count} مدل)")
+        else:
+            logger.error(f"نتوانستیم ترجمه‌ای برای مدل {model_id} دریافت کنیم: {error}")
+            count = await self.db.fail_translation_item(self.job_id, model_id, error or "ذخیره ناموفق", attempts)
+            self.failed += count or 1
+
+    def _take_batch(self, items):
+        """
+        برداشتن دسته بعدی از لیست مشترک.
+
+        تا batch_size توضیح برداشته می‌شود، به شرطی که مجموع توکن‌های تخمینی از سهم
+        BATCH_CONTEXT_SHARE طول زمینه مدل فعلی بیشتر نشود. اولین توضیح همیشه برداشته می‌شود.
+        """
+        budget = None
+        if self.batch_size > 1 and self.context_length is not None:
+            context_length = self.context_length(self.model)
+            if context_length:
+                budget = context_length * BATCH_CONTEXT_SHARE
+
+        batch = [items.pop()]
+        used = self.estimate_tokens(batch[0][1] or "")
+        while items and len(batch) < self.batch_size:
+            tokens = self.estimate_tokens(items[-1][1] or "")
+            if budget is not None and used + tokens > budget:
+                break
+            batch.append(items.pop())
+            used += tokens
+        return batch
+
+    async def _translate_batch(self, batch):
+        """ترجمه یک دسته در یک درخواست و ترجمه جداگانه اعضایی که پاسخ معتبری ندارند."""
+        translations = {}
+        attempts = 0
+        if len(batch) > 1:
+            self.batches += 1
+            payload = json.dumps(
+                [{"id": index, "description": description} for index, (_, description) in enumerate(batch)],
+                ensure_ascii=False
+            )
+            response, attempts, error = await self._request(BATCH_TRANSLATION_PROMPT.format(items=payload))
+            if response is not None:
+                translations = parse_batch_translations(response, len(batch))
+            if len(translations) < len(batch):
+                logger.warning(
+                    f"پاسخ دسته‌ای برای {len(batch) - len(translations)} از {len(batch)} توضیح معتبر نبود؛ "
+                    f"ترجمه جداگانه آن‌ها ({error or 'پاسخ نامعتبر'})"
+                )
+
+        for index, (model_id, description) in enumerate(batch):
+            if index in translations:
+                await self._store(model_id, translations[index], attempts)
+                continue
+            if len(batch) > 1:
+                self.fallbacks += 1
+            translated, single_attempts, error = await self._request(TRANSLATION_PROMPT.format(description=description))
+            await self._store(model_id, translated, single_attempts, error)
+
+    async def _worker(self, items):
+        """کارگر ترجمه: برداشتن دسته بعدی از لیست مشترک تا پایان آن."""
+        while items:
+            batch = []
+            for model_id, description in self._take_batch(items):
+                if description:
+                    batch.append((model_id, description))
+                    continue
+                logger.warning(f"مدل {model_id} فاقد توضیحات است")
+                count = await self.db.fail_translation_item(self.job_id, model_id, "فاقد توضیحات", attempts=0)
+                self.failed += count or 1
+
+            if batch:
+                await self._translate_batch(batch)
+            await self._report()
+
+    async def run(self):
+        """
+        اجرای کار تا ترجمه همه مدل‌های در انتظار.
+
+        مدل‌هایی که پیش از راه‌اندازی مجدد ترجمه شده‌اند دوباره ترجمه نمی‌شوند و هر متن
+        توضیحات فقط یک بار ترجمه می‌شود؛ ترجمه آن هنگام ذخیره به همه مدل‌های با همان متن
+        می‌رسد.
+        """
+        self.running = True
+        self.started_at = time.monotonic()
+        try:
+            counts = await self.db.get_translation_job_counts(self.job_id)
+            self.done = counts.get("done", 0)
+            self.failed = counts.get("failed", 0)
+
+            pending = await self.db.get_pending_translation_items(self.job_id)
+            items = []
+            seen = set()
+            for model_id, description in pending:
+                if description and description in seen:
+                    continue
+                seen.add(description)
+                items.append((model_id, description))
+            # ترتیب معکوس، چون کارگرها از انتهای لیست برمی‌دارند
+            items.reverse()
+            logger.info(
+                f"کار ترجمه {self.job_id}: {len(pending)} مدل در انتظار از {self.total} "
+                f"({len(items)} متن متفاوت)"
+            )
+
+            workers = [asyncio.create_task(self._worker(items)) for _ in range(min(self.concurrency, len(items)))]
+            try:
+                await asyncio.gather(*workers)
+            except BaseException:
+                for worker in workers:
+                    worker.cancel()
+                raise
+
+            await self.db.finish_translation_job(self.job_id)
+        finally:
+            self.running = False
+        await self._report(force=True)
+
+    def snapshot(self):
+        """
+        دریافت خلاصه وضعیت.
+
+        Returns:
+            dict: شناسه کار، تعداد کل، موفق، ناموفق، تلاش‌های مجدد، تعویض مدل، تعداد درخواست‌ها،
+                دسته‌ها و ترجمه‌های جداگانه پس از دسته، مدل فعلی، وضعیت اجرا و مدت اجرا (ثانیه)
+        """
+        return {
+            "job_id": self.job_id,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rotations": self.rotations,
+            "requests": self.requests,
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+            "model": self.model,
+            "running": self.running,
+            "elapsed": (time.monotonic() - self.started_at) if self.started_at else 0.0,
+        }
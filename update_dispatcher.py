@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+# تنظیم لاگ‌گیری
+logger = logging.getLogger(__name__)
+
+
+def is_coalescable(update_data):
+    """آیا به‌روزرسانی یک فریم میانی است که می‌توان آن را با فریم تازه‌تر جایگزین کرد."""
+    return not (update_data.get("is_final") or update_data.get("error") or update_data.get("was_canceled"))
+
+
+def coalesce_updates(updates):
+    """
+    ادغام به‌روزرسانی‌های میانی هر پیام در یک دسته.
+
+    برای هر (chat_id, message_id) فقط آخرین فریم میانی نگه داشته می‌شود. پیام‌های نهایی،
+    خطا و لغو هرگز حذف نمی‌شوند و فریم‌های میانی پیش از آن‌ها برای همان پیام کنار گذاشته
+    می‌شوند. ترتیب نسبی پیام‌ها حفظ می‌شود.
+
+    Args:
+        updates: فهرست به‌روزرسانی‌ها به ترتیب دریافت
+
+    Returns:
+        list: به‌روزرسانی‌هایی که باید ارسال شوند
+    """
+    result = []
+    # {(chat_id, message_id): اندیس فریم میانی در result}
+    pending = {}
+    # پیام‌هایی که نسخه نهایی آن‌ها در این دسته دیده شده است
+    finished = set()
+
+    for update_data in updates:
+        key = (update_data["chat_id"], update_data["message_id"])
+        if is_coalescable(update_data):
+            if key in finished:
+                # فریم میانی پس از پیام نهایی قدیمی است
+                continue
+            index = pending.get(key)
+            if index is None:
+                pending[key] = len(result)
+                result.append(update_data)
+            else:
+                result[index] = update_data
+        else:
+            index = pending.pop(key, None)
+            if index is not None:
+                result[index] = None
+            finished.add(key)
+            result.append(update_data)
+
+    return [update_data for update_data in result if update_data is not None]
+
+
+class _Worker:
+    """کارگر پردازش به‌روزرسانی‌های گروهی از گفت‌وگوها با آمار تأخیر ارسال."""
+
+    def __init__(self, index, samples):
+        self.index = index
+        self.queue = asyncio.Queue()
+        # به‌روزرسانی‌های دسته فعلی که هنوز پردازش نشده‌اند
+        self.in_batch = 0
+        self.handled = 0
+        self.busy_total = 0.0
+        self.busy_max = 0.0
+        self._recent = deque(maxlen=samples)
+
+    def backlog(self):
+        """تعداد به‌روزرسانی‌های ارسال‌نشده این کارگر (صف و دسته فعلی)."""
+        return self.queue.qsize() + self.in_batch
+
+    def record(self, seconds):
+        """ثبت مدت پردازش یک به‌روزرسانی."""
+        self.handled += 1
+        self.busy_total += seconds
+        self.busy_max = max(self.busy_max, seconds)
+        self._recent.append(seconds)
+
+    def snapshot(self):
+        """تعداد پردازش‌شده، طول صف و میانگین، صدک ۹۵ و بیشینه تأخیر (میلی‌ثانیه)."""
+        recent = sorted(self._recent)
+        return {
+            "handled": self.handled,
+            "backlog": self.backlog(),
+            "avg_ms": (self.busy_total / self.handled * 1000) if self.handled else 0.0,
+            "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000 if recent else 0.0,
+            "max_ms": self.busy_max * 1000,
+        }
+
+
+class UpdateDispatcher:
+    """
+    توزیع‌کننده رویدادمحور به‌روزرسانی پیام‌ها میان چند کارگر هم‌زمان.
+
+    هر به‌روزرسانی بر اساس chat_id به یکی از کارگرها سپرده می‌شود، بنابراین ترتیب
+    پیام‌های هر گفت‌وگو حفظ می‌شود و یک ویرایش کند یا ارسال چندبخشی یک گفت‌وگو بقیه را
+    معطل نمی‌کند. هر کارگر با رسیدن اولین مورد بیدار می‌شود، همه موارد موجود در صف خود
+    را یک‌جا برمی‌دارد، فریم‌های میانی هر پیام را ادغام می‌کند و سپس هر مورد را به handler
+    می‌دهد. در مدتی که handler منتظر تلگرام است، فریم‌های تازه در صف کارگر جمع می‌شوند و
+    در دسته بعدی فقط آخرین آن‌ها ارسال می‌شود.
+
+    مثال:
+        dispatcher = UpdateDispatcher(update_queue, apply_update, workers=4)
+        await dispatcher.run()
+    """
+
+    def __init__(self, queue, handler, workers=1, latency_samples=1000):
+        """
+        Args:
+            queue: asyncio.Queue به‌روزرسانی‌ها
+            handler: تابع async که هر به‌روزرسانی ادغام‌شده را پردازش می‌کند
+            workers: تعداد کارگرهای هم‌زمان
+            latency_samples: تعداد تأخیرهای اخیر نگه‌داشته‌شده برای هر کارگر
+        """
+        self.queue = queue
+        self.handler = handler
+        self.workers = [_Worker(index, latency_samples) for index in range(max(1, workers))]
+
+        # آمار
+        self.received = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def _worker_for(self, chat_id):
+        """کارگر مسئول یک گفت‌وگو (همیشه یکسان برای یک chat_id)."""
+        return self.workers[hash(chat_id) % len(self.workers)]
+
+    @staticmethod
+    def _drain(queue, first):
+        """برداشتن همه موارد موجود در صف بدون انتظار."""
+        batch = [first]
+        while True:
+            try:
+                batch.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return batch
+
+    async def _work(self, worker):
+        """حلقه یک کارگر: دریافت دسته، ادغام و ارسال به ترتیب."""
+        while True:
+            batch = self._drain(worker.queue, await worker.queue.get())
+            updates = coalesce_updates(batch)
+
+            self.coalesced += len(batch) - len(updates)
+            self.batches += 1
+            self.max_batch = max(self.max_batch, len(batch))
+
+            worker.in_batch = len(updates)
+            try:
+                for update_data in updates:
+                    started = time.monotonic()
+                    try:
+                        await self.handler(update_data)
+                    except Exception as e:
+                        logger.error(f"خطا در پردازشگر پیام‌ها (کارگر {worker.index}): {e}")
+                    worker.record(time.monotonic() - started)
+                    worker.in_batch -= 1
+            finally:
+                worker.in_batch = 0
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def run(self):
+        """حلقه اصلی توزیع؛ تا لغو وظیفه ادامه دارد و با آن کارگرها نیز متوقف می‌شوند."""
+        tasks = [asyncio.create_task(self._work(worker)) for worker in self.workers]
+        try:
+            while True:
+                update_data = await self.queue.get()
+                self.received += 1
+                self._worker_for(update_data["chat_id"]).queue.put_nowait(update_data)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def backlog(self):
+        """تعداد به‌روزرسانی‌های ارسال‌نشده در صف اصلی، صف‌ها و دسته‌های فعلی کارگرها."""
+        return self.queue.qsize() + sum(worker.backlog() for worker in self.workers)
+
+    def snapshot(self):
+        """
+        دریافت خلاصه آمار.
+
+        Returns:
+            dict: تعداد به‌روزرسانی‌های دریافتی و ادغام‌شده، تعداد دسته‌ها، بزرگ‌ترین دسته،
+                طول فعلی صف و آمار تأخیر هر کارگر
+        """
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "queue_size": self.backlog(),
+            "workers": [worker.snapshot() for worker in self.workers],
+        }